@@ -0,0 +1,225 @@
+"""Streaming anomaly detection for every metric, run by monitor.py on each sample.
+
+Only TVOC used to get a robust baseline, and only on the dashboard; everything else
+relied on fixed thresholds. Here each metric gets a Detector that keeps a running
+baseline and spread, so a reading is judged against what is normal for this room
+lately, at O(1) cost per sample and without re-reading history from SQLite:
+
+- level: a robust z-score against an exponentially weighted baseline. What the
+  baseline learns from a reading is clipped to a few spreads from it, so a spike
+  barely moves the very baseline it is measured against (the same reason
+  utils.baseline_deviation uses the median);
+- rate: a jump since the previous reading larger than the metric's `max_step`,
+  which catches a sensor glitch or a door slammed open before the level notices.
+
+Every sample gets a bitmask of what fired (two bits per metric, see `bits`), stored
+in the `anomalies` column of `records`. Notifications go through an alarm with
+hysteresis: it raises after RAISE_SAMPLES flagged samples in a row and only re-arms
+after CLEAR_SAMPLES calm ones, so a reading hovering on the threshold pings once.
+Only the metrics in config.ANOMALY_ALERT_METRICS notify, each at most once per
+ANOMALY_COOLDOWN_MINUTES, and alarms raised by the same sample go out as one
+notification: one event tends to move several metrics at once.
+"""
+
+import datetime
+
+from compact import CLEAN_VIEW
+from config import ANOMALY_ALERT_METRICS, ANOMALY_COOLDOWN_MINUTES
+from utils import MIN_HISTORY
+
+# metric: (spread floor, largest plausible change between two samples), in the
+# metric's own unit. The floor plays MAD_FLOOR's part: below it, variation is sensor
+# noise. None means rate-of-change isn't checked. Outdoor values are the weather
+# service's, nothing the room does; wind direction wraps around and swings freely.
+# The order sets each metric's bits in stored masks, so a retired metric keeps its
+# place as None rather than being removed.
+METRICS = {
+    "co2": (20.0, 400.0),
+    "voc": (5.0, None),  # TVOC re-baselines itself; only its level is meaningful
+    "eco2": None,  # derived from TVOC: it only ever fired along with voc
+    "temp": (0.2, 2.0),
+    "hum": (1.0, 10.0),
+    "pressure": (0.3, 3.0),
+    "pm1": (1.0, 30.0),
+    "pm25": (1.0, 30.0),
+    "pm4": (1.0, 30.0),
+    "pm10": (1.0, 30.0),
+}
+# Weight of each new sample in the baseline: about a six-hour memory at 5 minutes.
+ALPHA = 2 / (72 + 1)
+# A reading this many spreads from the baseline is flagged; the dashboard's TVOC card
+# uses the same 3.5.
+Z_THRESHOLD = 3.5
+# How far (in spreads) a single reading may pull the baseline.
+CLIP = 3.0
+# 0.6745 makes a mean absolute deviation read like a standard deviation, as in utils.
+SCALE = 0.6745
+# Alarm hysteresis, in samples: raise after this many flagged in a row...
+RAISE_SAMPLES = 2
+# ...and re-arm after this many in a row under CLEAR_Z with no jumps.
+CLEAR_SAMPLES = 6
+CLEAR_Z = 2.0
+
+LEVEL, RATE = 1, 2
+
+
+def bits(metric, kind, metrics=METRICS):
+    """The `anomalies` bits for `kind` (LEVEL, RATE or both) of one metric."""
+    return kind << (2 * list(metrics).index(metric))
+
+
+def describe(mask, metrics=METRICS):
+    """[(metric, kind)] flagged in an `anomalies` value."""
+    mask = mask or 0
+    return [
+        (metric, kind)
+        for i, metric in enumerate(metrics)
+        if (kind := (mask >> (2 * i)) & (LEVEL | RATE))
+    ]
+
+
+class Detector:
+    """Running baseline, spread and last value of one metric."""
+
+    def __init__(self, floor, max_step=None, alpha=ALPHA):
+        self.floor = floor
+        self.max_step = max_step
+        self.alpha = alpha
+        self.baseline = None
+        self.spread = 0.0
+        self.previous = None
+        self.seen = 0
+
+    def update(self, value):
+        """Take in one reading; return (z, jumped). z is None while warming up."""
+        if value is None or value != value:  # value != value: NaN
+            return None, False
+        jumped = (
+            self.max_step is not None
+            and self.previous is not None
+            and abs(value - self.previous) > self.max_step
+        )
+        self.previous = value
+        self.seen += 1
+        if self.baseline is None:
+            self.baseline = value
+            return None, jumped
+
+        spread = max(self.spread, self.floor)
+        residual = value - self.baseline
+        z = SCALE * residual / spread if self.seen > MIN_HISTORY else None
+        clipped = max(-CLIP * spread, min(CLIP * spread, residual))
+        self.baseline += self.alpha * clipped
+        self.spread += self.alpha * (abs(clipped) - self.spread)
+        return z, jumped
+
+
+class Anomalies:
+    """One Detector and one alarm per metric."""
+
+    def __init__(
+        self,
+        metrics=METRICS,
+        alert=ANOMALY_ALERT_METRICS,
+        cooldown_minutes=ANOMALY_COOLDOWN_MINUTES,
+    ):
+        self.metrics = metrics
+        self.detectors = {m: Detector(*limits) for m, limits in metrics.items() if limits}
+        self.alert = set(alert)
+        self.cooldown = datetime.timedelta(minutes=cooldown_minutes)
+        self.active = set()  # metrics whose alarm is raised
+        self._flagged = dict.fromkeys(self.detectors, 0)
+        self._calm = dict.fromkeys(self.detectors, 0)
+        self._sent = {}  # metric: date of its last notification
+
+    def _muted(self, metric, now):
+        sent = self._sent.get(metric)
+        return metric not in self.alert or (
+            sent is not None and now is not None and now - sent < self.cooldown
+        )
+
+    def update(self, reading):
+        """Take in one `records` row as a dict; return (mask, raised).
+
+        `raised` lists (metric, value, z, jumped) for each alarm this sample raised
+        that should notify: an alert metric, out of its cooldown.
+        """
+        now = reading.get("date")
+        mask = 0
+        raised = []
+        for metric, detector in self.detectors.items():
+            value = reading.get(metric)
+            z, jumped = detector.update(value)
+            level = z is not None and abs(z) > Z_THRESHOLD
+            if level:
+                mask |= bits(metric, LEVEL, self.metrics)
+            if jumped:
+                mask |= bits(metric, RATE, self.metrics)
+
+            if level or jumped:
+                self._flagged[metric] += 1
+                self._calm[metric] = 0
+            elif z is not None and abs(z) < CLEAR_Z:
+                self._calm[metric] += 1
+                self._flagged[metric] = 0
+            else:
+                # Between the thresholds, or no reading: neither raise nor re-arm.
+                self._flagged[metric] = 0
+
+            if metric in self.active:
+                if self._calm[metric] >= CLEAR_SAMPLES:
+                    self.active.discard(metric)
+            elif self._flagged[metric] >= RAISE_SAMPLES:
+                self.active.add(metric)
+                if not self._muted(metric, now):
+                    self._sent[metric] = now
+                    raised.append((metric, value, z, jumped))
+        return mask, raised
+
+
+def message(metric, value, z, jumped, detector):
+    """Notification (title, body) for a raised alarm."""
+    if jumped and (z is None or abs(z) <= Z_THRESHOLD):
+        return (
+            f"Sudden change in {metric}",
+            f"{metric} jumped to {value:.4g} since the previous reading.",
+        )
+    direction = "above" if z > 0 else "below"
+    return (
+        f"Unusual {metric}",
+        f"{metric} is {value:.4g}, {abs(z):.1f} spreads {direction} its recent "
+        f"baseline of {detector.baseline:.4g}.",
+    )
+
+
+def notification(raised, detectors):
+    """One (title, body) for all the alarms a sample raised, or None if it raised none."""
+    messages = [message(*alarm, detectors[alarm[0]]) for alarm in raised]
+    if len(messages) < 2:
+        return messages[0] if messages else None
+    return (
+        f"Unusual {', '.join(metric for metric, *_ in raised)}",
+        "\n".join(body for _, body in messages),
+    )
+
+
+def rebuild(con, now=None, hours=24):
+    """Replay the last `hours` of `records` into fresh detectors.
+
+    Used once when monitor.py starts, so the baselines survive a restart. Alarms that
+    the replay raises start out raised, so a restart doesn't repeat a notification.
+    """
+    now = now or datetime.datetime.now()
+    anomalies = Anomalies()
+    since = now - datetime.timedelta(hours=hours)
+    cur = con.execute(
+        f"SELECT date, {', '.join(anomalies.detectors)} FROM {CLEAN_VIEW} "
+        "WHERE date >= ? ORDER BY date",
+        (since.strftime("%Y-%m-%d %H:%M:%S"),),
+    )
+    columns = [d[0] for d in cur.description]
+    for row in cur:
+        reading = dict(zip(columns, row))
+        reading["date"] = datetime.datetime.fromisoformat(reading["date"])
+        anomalies.update(reading)
+    return anomalies
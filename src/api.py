@@ -0,0 +1,269 @@
+"""A small read-only JSON API over the database, for widgets and home-automation polling.
+
+    GET /latest      the latest reading, as the dashboard header shows it
+    GET /summary     that plus the last 24 hours: mean, min and max of every metric,
+                     and the header's temperature extremes and TVOC baseline
+    GET /events      server-sent events: the cards and the new row after every sample
+                     (see push.py), starting with the latest one
+    GET /range?from=2024-06-01&to=2024-06-30&cols=co2,temp[&resolution=raw|1h|1d]
+                     `from` and `to` are dates (both days included) or ISO datetimes,
+                     local time unless they carry an offset; without `resolution`,
+                     planner.py picks one that keeps it under
+                     planner.MAX_POINTS points. Rows come back as
+                     {"resolution", "columns", "rows": [[date, ...], ...]}.
+
+Every response carries an ETag made from compact.CHANGES_TABLE's count, which every
+insert, update or delete in either tier moves on: a new sample, compact.py, or an
+outdoor.py backfill. A client that sends it back in If-None-Match gets
+`304 Not Modified` after a one-row lookup, and
+responses for the current tag are kept in memory, so polling between samples costs
+next to nothing. Connections are kept alive, and every thread has its own database
+connection. /events streams are open-ended, one thread each, and only wake up for a
+new sample or a keep-alive comment every KEEPALIVE_SECONDS.
+
+The API never writes: its connections are read-only. /range reads the hourly and daily
+rollups as monitor.py last extended them, and aggregates whatever came after on the fly.
+
+    python3 src/api.py [--host 0.0.0.0] [--port 4203]
+"""
+
+import argparse
+import datetime
+import http.server
+import json
+import queue
+import sqlite3
+import threading
+import urllib.parse
+import zoneinfo
+
+import planner
+import push
+import snapshot
+from compact import CHANGES_TABLE, CIRCULAR_COLUMNS, CLEAN_VIEW, metric_columns
+from config import API_PORT, DB_PATH
+
+# Responses kept for the current ETag; more distinct URLs than this between two
+# samples and the cache starts over.
+CACHE_ENTRIES = 256
+# A comment on idle /events streams this often, so proxies don't time them out and
+# a gone viewer's thread finds out.
+KEEPALIVE_SECONDS = 15
+# Stored dates are naive local time here.
+LOCAL_TZ = "Europe/Brussels"
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _metrics(con):
+    # What /range may ask for; also keeps request text out of the SQL.
+    return [c for c in metric_columns(con) if c not in CIRCULAR_COLUMNS]
+
+
+def _parse_time(value, end=False):
+    """A date or ISO datetime, as naive local time like the stored dates.
+
+    A bare date as `to` means the end of that day; a datetime with an offset is
+    converted to LOCAL_TZ.
+    """
+    try:
+        if len(value) == 10:
+            day = datetime.datetime.combine(datetime.date.fromisoformat(value), datetime.time())
+            return day + datetime.timedelta(days=1) if end else day
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise ApiError(400, f"not a date: {value!r}") from None
+    if parsed.tzinfo is None:
+        return parsed
+    try:
+        return parsed.astimezone(zoneinfo.ZoneInfo(LOCAL_TZ)).replace(tzinfo=None)
+    except (OverflowError, ValueError, zoneinfo.ZoneInfoNotFoundError) as exc:
+        raise ApiError(400, f"can't convert {value!r} to {LOCAL_TZ} time: {exc}") from None
+
+
+def version(con):
+    """The ETag: changes with every row written to either tier, in place or not."""
+    return '"{}"'.format(con.execute(f"SELECT changes FROM {CHANGES_TABLE}").fetchone()[0])
+
+
+def latest(con, query):
+    state = snapshot.read(con) or snapshot.rebuild(con).state()
+    if state is None:
+        raise ApiError(404, "no measurements yet")
+    return state["reading"]
+
+
+def summary(con, query):
+    state = snapshot.read(con) or snapshot.rebuild(con).state()
+    if state is None:
+        raise ApiError(404, "no measurements yet")
+    # The 24 hours up to the latest reading, like the header's extremes.
+    until = datetime.datetime.fromisoformat(state["reading"]["date"])
+    metrics = _metrics(con)
+    cur = con.execute(
+        "SELECT COUNT(*), "
+        + ", ".join(f"AVG({m}), MIN({m}), MAX({m})" for m in metrics)
+        + f" FROM {CLEAN_VIEW} WHERE date > ? AND date <= ?",
+        (
+            (until - datetime.timedelta(hours=24)).strftime("%Y-%m-%d %H:%M:%S"),
+            until.strftime("%Y-%m-%d %H:%M:%S"),
+        ),
+    )
+    samples, *values = cur.fetchone()
+    day = {
+        m: dict(zip(("mean", "min", "max"), values[3 * i : 3 * i + 3]))
+        for i, m in enumerate(metrics)
+        if values[3 * i] is not None
+    }
+    return dict(state, last_24h={"samples": samples, **day})
+
+
+def range_(con, query):
+    for key in ("from", "to", "cols"):
+        if not query.get(key):
+            raise ApiError(400, f"missing {key}")
+    start, end = _parse_time(query["from"][0]), _parse_time(query["to"][0], end=True)
+    if end <= start:
+        raise ApiError(400, "`to` is before `from`")
+    columns = list(dict.fromkeys(query["cols"][0].split(",")))
+    unknown = set(columns) - set(_metrics(con))
+    if unknown:
+        raise ApiError(400, f"unknown columns: {', '.join(sorted(unknown))}")
+    resolution = query.get("resolution", [None])[0]
+    if resolution is not None and resolution not in planner.RESOLUTIONS:
+        raise ApiError(400, f"resolution is one of {', '.join(planner.RESOLUTIONS)}")
+    resolution, sql, params = planner.query(
+        con, start, end, columns, resolution=resolution, build=False
+    )
+    cur = con.execute(sql, params)
+    return {
+        "resolution": resolution,
+        "columns": [d[0] for d in cur.description],
+        "rows": cur.fetchall(),
+    }
+
+
+ROUTES = {"/latest": latest, "/summary": summary, "/range": range_}
+
+
+class Server(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", API_PORT), path=DB_PATH, hub=None):
+        super().__init__(address, _Handler)
+        self.path = path
+        self.hub = hub  # a push.Hub, for /events
+        self.cache = {}  # URL -> (etag, body)
+        self._local = threading.local()
+
+    def connection(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = self._local.con = sqlite3.connect(
+                f"file:{self.path}?mode=ro", uri=True, timeout=10
+            )
+        return con
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    # Keep-alive, so a poller doesn't pay for a new connection every time...
+    protocol_version = "HTTP/1.1"
+    # ...and no Nagle: headers and body go out as two writes, and on a kept-alive
+    # connection the body would wait for the client's delayed ACK, ~40 ms a response.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == "/events" and self.server.hub is not None:
+            return self._stream()
+        route = ROUTES.get(url.path)
+        if route is None:
+            return self._reply(404, {"error": f"no such endpoint; try {', '.join(ROUTES)}"})
+        try:
+            con = self.server.connection()
+            etag = version(con)
+        except sqlite3.Error as exc:
+            return self._reply(503, {"error": f"database unavailable: {exc}"})
+        if etag in (tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")):
+            return self._reply(304, etag=etag)
+
+        cached = self.server.cache.get(self.path)
+        if cached and cached[0] == etag:
+            return self._reply(200, body=cached[1], etag=etag)
+        try:
+            body = json.dumps(route(con, urllib.parse.parse_qs(url.query))).encode()
+        except ApiError as exc:
+            return self._reply(exc.status, {"error": str(exc)})
+        except sqlite3.Error as exc:
+            return self._reply(503, {"error": f"database unavailable: {exc}"})
+        if len(self.server.cache) >= CACHE_ENTRIES:
+            self.server.cache.clear()
+        self.server.cache[self.path] = (etag, body)
+        self._reply(200, body=body, etag=etag)
+
+    def _stream(self):
+        subscriber = self.server.hub.subscribe()
+        # Open-ended, so no Content-Length; the stream ends when the connection does.
+        self.close_connection = True
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            # The latest sample first, so a page that reconnects after a gap catches up.
+            state = snapshot.read(self.server.connection())
+            if state is not None:
+                self.wfile.write(f"data: {push.event(state)}\n\n".encode())
+            while True:
+                try:
+                    message = subscriber.get(timeout=KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    self.wfile.write(b": keep-alive\n\n")
+                    continue
+                self.wfile.write(f"data: {message}\n\n".encode())
+        except (OSError, sqlite3.Error):
+            pass  # the viewer left
+        finally:
+            self.server.hub.unsubscribe(subscriber)
+
+    def _reply(self, status, data=None, body=None, etag=None):
+        if body is None and data is not None:
+            body = json.dumps(data).encode()
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+            # Cacheable, but only after asking whether it's still current.
+            self.send_header("Cache-Control", "no-cache")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        if body is not None:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body or b"")))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the measurements as JSON.")
+    parser.add_argument("--host", default="127.0.0.1", help="0.0.0.0 for the whole LAN")
+    parser.add_argument("--port", type=int, default=API_PORT)
+    args = parser.parse_args(argv)
+    server = Server((args.host, args.port), hub=push.Hub().start())
+    print(f"Serving on http://{args.host}:{args.port}/ ({', '.join(ROUTES)}, /events)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""Closed months as compressed columnar files, read a column at a time.
+
+`records` stores a row at a time, so reading one metric over a year reads every column
+of every row in it, and after compact.py only the hourly means are left of anything
+older than RAW_RETENTION_DAYS. Once a month is over it never changes again, so it is
+written out once to ARCHIVE_DIR as an Arrow IPC file (Feather v2), YYYY-MM.arrow: one
+array per column, zstd-compressed. A reader memory-maps the files of the months it
+needs and decompresses only the columns it asks for -- a year of CO2 is the date and
+CO2 arrays of twelve files, a few percent of what the same query reads from SQLite.
+
+compact.py exports the closed months before it compacts, so they keep their 5-minute
+rows here. The one later change to old rows, outdoor.py filling in missing outdoor
+values, is written into the file too (rewrite()), rather than exporting the month
+again from rows that may have been compacted since. The dashboard's raw views (frames.py) and report.py read archived months
+from here and the rest from SQLite: segments() says which is which.
+
+pyarrow is optional, as it doesn't install everywhere the Pi runs: without it nothing
+is archived and everything is read from SQLite, as before.
+
+    python3 src/archive.py [--rewrite YYYY-MM ...]
+"""
+
+import argparse
+import datetime
+import os
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+
+from compact import FLAG_COLUMNS, HISTORY_VIEW
+from config import ARCHIVE_DIR, DB_PATH
+
+try:
+    import pyarrow as pa
+    from pyarrow import feather
+except ImportError:
+    pa = None
+
+# Stored as integers; everything else as the REAL it is in SQLite.
+INTEGER_COLUMNS = (*FLAG_COLUMNS, "session_id")
+
+
+def available():
+    return pa is not None
+
+
+def _month(value):
+    return datetime.datetime(value.year, value.month, 1)
+
+
+def _next_month(month):
+    return (month + datetime.timedelta(days=32)).replace(day=1)
+
+
+def path(month, archive_dir=ARCHIVE_DIR):
+    return Path(archive_dir) / f"{month:%Y-%m}.arrow"
+
+
+def archived(archive_dir=ARCHIVE_DIR):
+    """The first days of the archived months, oldest first."""
+    if not available() or not Path(archive_dir).is_dir():
+        return []
+    return sorted(
+        datetime.datetime.strptime(p.stem, "%Y-%m") for p in Path(archive_dir).glob("*.arrow")
+    )
+
+
+def export(con, month, archive_dir=ARCHIVE_DIR):
+    """Write `month` (its first day) from the history view to its file; return the rows."""
+    columns = [info[1] for info in con.execute(f"PRAGMA table_info({HISTORY_VIEW})")]
+    rows = con.execute(
+        f"SELECT {', '.join(columns)} FROM {HISTORY_VIEW} "
+        "WHERE date >= ? AND date < ? ORDER BY date",
+        (f"{month:%Y-%m-%d}", f"{_next_month(month):%Y-%m-%d}"),
+    ).fetchall()
+    if not rows:
+        return 0
+    arrays = []
+    for column, values in zip(columns, zip(*rows)):
+        if column == "date":
+            dates = np.array(values, dtype="datetime64[us]").astype("datetime64[s]")
+            arrays.append(pa.array(dates))
+        else:
+            kind = pa.int64() if column in INTEGER_COLUMNS else pa.float64()
+            arrays.append(pa.array(values, type=kind))
+    _write(pa.table(arrays, names=columns), path(month, archive_dir))
+    return len(rows)
+
+
+def _write(table, target):
+    # Through a temporary file, so a reader never maps half a month.
+    target.parent.mkdir(parents=True, exist_ok=True)
+    partial = target.with_name(f".{target.name}.tmp")
+    feather.write_feather(table, partial, compression="zstd")
+    os.replace(partial, target)
+
+
+def rewrite(month, update, archive_dir=ARCHIVE_DIR):
+    """Change an archived month in place; return whether anything changed.
+
+    `update` gets {column: numpy array} (dates as datetime64[s], the rest as float,
+    NULL as nan), changes the arrays it needs to and returns the names of those; only
+    they are converted back, and the file is left alone when there are none.
+    """
+    target = path(month, archive_dir)
+    if not available() or not target.exists():
+        return False
+    table = feather.read_table(str(target), memory_map=False)
+    arrays = {
+        name: column.to_numpy().astype("datetime64[s]") if name == "date"
+        else column.to_numpy().astype(float)
+        for name, column in zip(table.column_names, table.columns)
+    }
+    changed = update(arrays)
+    if not changed:
+        return False
+    for name in changed:
+        field = table.schema.field(name)
+        values = arrays[name].round() if pa.types.is_integer(field.type) else arrays[name]
+        table = table.set_column(
+            table.schema.get_field_index(name), field,
+            pa.array(values, type=field.type, from_pandas=True),
+        )
+    _write(table, target)
+    return True
+
+
+def export_closed(con, now=None, archive_dir=ARCHIVE_DIR, rewrite=()):
+    """Export every month before this one that isn't archived yet, and those in
+    `rewrite` (first days) again; return [(month, rows)]."""
+    if not available():
+        return []
+    oldest = con.execute(f"SELECT MIN(date) FROM {HISTORY_VIEW}").fetchone()[0]
+    if oldest is None:
+        return []
+    done = set(archived(archive_dir)) - set(rewrite)
+    month = _month(datetime.datetime.fromisoformat(oldest))
+    current = _month(now or datetime.datetime.now())
+    out = []
+    while month < current:
+        if month not in done:
+            out.append((month, export(con, month, archive_dir)))
+        month = _next_month(month)
+    return out
+
+
+def segments(start, end, archive_dir=ARCHIVE_DIR):
+    """Split [start, end) into [(start, end, file or None)], in order.
+
+    Archived months come one per file; the stretches between them as one part with
+    None, to be read from SQLite in one query.
+    """
+    months = set(archived(archive_dir))
+    out = []
+    at = start
+    while at < end:
+        month = _month(at)
+        stop = min(_next_month(month), end)
+        source = path(month, archive_dir) if month in months else None
+        if source is None and out and out[-1][2] is None:
+            at = out.pop()[0]
+        out.append((at, stop, source))
+        at = stop
+    return out
+
+
+def read(source, columns, start=None, end=None):
+    """`date` and `columns` of an archived month, rows in [start, end), as a DataFrame.
+
+    Memory-maps the file and decompresses only those columns. Dates are naive local,
+    as stored; a column the month predates comes back all NaN.
+    """
+    with pa.memory_map(str(source)) as mapped:
+        names = pa.ipc.open_file(mapped).schema.names
+    wanted = [c for c in dict.fromkeys(["date", *columns]) if c in names]
+    df = feather.read_table(str(source), columns=wanted, memory_map=True).to_pandas()
+    # In the unit pandas parses the stored strings to, so the two sources concatenate.
+    df["date"] = df["date"].astype("datetime64[us]")
+    if start is not None or end is not None:
+        dates = df["date"].to_numpy()
+        keep = np.ones(len(df), dtype=bool)
+        if start is not None:
+            keep &= dates >= np.datetime64(start)
+        if end is not None:
+            keep &= dates < np.datetime64(end)
+        df = df[keep].reset_index(drop=True)
+    return df.reindex(columns=list(dict.fromkeys(["date", *columns])))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--rewrite", nargs="+", default=[], metavar="YYYY-MM",
+        help="export these months again from the database; a month compact.py has "
+        "rolled up since keeps only its hourly rows",
+    )
+    args = parser.parse_args(argv)
+    if not available():
+        parser.error("needs pyarrow: pip install pyarrow")
+    rewrite = [datetime.datetime.strptime(m, "%Y-%m") for m in args.rewrite]
+    with sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True) as con:
+        for month, rows in export_closed(con, rewrite=rewrite):
+            print(f"{month:%Y-%m}: {rows} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""The current-readings cards, as HTML, from the header snapshot (see snapshot.py).
+
+Shared by the dashboard, the static page and the API's live updates. Only the stdlib,
+so api.py can render them for every new sample without loading pandas.
+"""
+
+import datetime
+
+# How far above its own 24h baseline a TVOC reading has to sit before it counts
+# as a spike, in robust z-scores. 3.5 is the usual cut-off for this measure.
+# The CCS811's ppb output re-baselines itself continuously, so there is no
+# absolute number to threshold against -- only "unusual for this room lately".
+VOC_SPIKE_DEVIATION = 3.5
+
+# Streamlit 0.62 predates st.columns, so the metrics are laid out with a CSS grid
+# instead. auto-fit fits as many 12rem tracks as the window allows, so the cards
+# reflow down to one column on a phone. Grid rather than flexbox because a leftover
+# card on the last row keeps its column width here, where a flex item would grow to
+# span the whole row on its own. Colours are inherited so the grid follows whichever
+# theme is active.
+CARD_CSS = """
+    .metrics {
+        display: grid;
+        grid-template-columns: repeat(auto-fit, minmax(12rem, 1fr));
+        gap: 0.75rem;
+        margin-bottom: 1rem;
+    }
+    .metric {
+        padding: 0.6rem 0.9rem;
+        border: 1px solid rgba(128, 128, 128, 0.35);
+        border-radius: 0.5rem;
+    }
+    .metric-value {font-size: 1.6rem; font-weight: 600; line-height: 1.3;}
+    .metric-label {font-size: 0.9rem; opacity: 0.75;}
+    .metric-sub {font-size: 0.8rem; opacity: 0.6;}
+"""
+
+
+def metric_card(value: str, label: str, *extras: str) -> str:
+    subs = "".join(f"<div class='metric-sub'>{extra}</div>" for extra in extras)
+    return (
+        f"<div class='metric'><div class='metric-value'>{value}</div>"
+        f"<div class='metric-label'>{label}</div>{subs}</div>"
+    )
+
+
+def _number(value, spec):
+    # A failed read is stored as NULL; the card stays, with a dash for the value.
+    return "–" if value is None else format(value, spec)
+
+
+def current_cards(current: dict) -> list[str]:
+    """The cards for a snapshot state: the latest reading, 24h extremes, TVOC baseline."""
+    reading = current["reading"]
+    co2 = reading.get("co2")
+    co2_alert = "🚨" if co2 is not None and co2 > 900 else ""
+    cards = [metric_card(f"{_number(co2, '.0f')} ppm {co2_alert}", "😶‍🌫️ CO2 level")]
+
+    temp_extras = []
+    if reading.get("out_temp") is not None:
+        temp_extras.append(f"🌳 Outdoor: {reading['out_temp']:.1f} °C")
+    if "temp_min" in current:
+        for arrow, key in (("↓", "temp_min"), ("↑", "temp_max")):
+            at = datetime.datetime.fromisoformat(current[f"{key}_at"]).strftime("%H:%M")
+            temp_extras.append(f"{arrow} {current[key]:.1f} °C at {at} (last 24h)")
+    cards.append(
+        metric_card(f"{_number(reading.get('temp'), '.1f')} °C", "🌡 Temperature", *temp_extras)
+    )
+
+    hum_extras = []
+    if reading.get("out_hum") is not None:
+        hum_extras.append(f"🌳 Outdoor: {reading['out_hum']:.0f} %")
+    cards.append(metric_card(f"{_number(reading.get('hum'), '.0f')} %", "💧 Humidity", *hum_extras))
+
+    if reading.get("pm25") is not None:
+        pm_alert = "🚨" if reading["pm25"] > 15 else ""
+        cards.append(metric_card(f"{reading['pm25']:.1f} µg/m³ {pm_alert}", "🌫 PM2.5"))
+    if reading.get("voc") is not None:
+        # The ppb figure is not comparable to any guideline or to another device, so
+        # it is judged against this room's own recent history instead. See
+        # baseline_deviation() in utils.py for why.
+        voc = reading["voc"]
+        voc_alert, voc_extras = "", []
+        if "voc_baseline" in current:
+            voc_baseline, voc_z = current["voc_baseline"], current["voc_deviation"]
+            voc_extras.append(f"📉 24h normal: {voc_baseline:.0f} ppb")
+            if voc_z >= VOC_SPIKE_DEVIATION:
+                voc_alert = "🚨"
+                # A zero baseline is what a still-conditioning sensor looks like,
+                # and there is no meaningful multiple of zero to quote.
+                voc_extras.append(
+                    f"↑ {voc / voc_baseline:.1f}× the 24h normal"
+                    if voc_baseline > 0
+                    else "↑ well above the 24h normal"
+                )
+        else:
+            voc_extras.append("📉 building up 24h baseline")
+        cards.append(metric_card(f"{voc:.0f} ppb {voc_alert}", "🧪 TVOC", *voc_extras))
+    return cards
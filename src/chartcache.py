@@ -0,0 +1,83 @@
+"""Finished Vega-Lite specs, cached by what they chart and the data under them.
+
+Every Streamlit rerun used to rebuild each chart from scratch -- read the window, the
+PM melt and rolling means, the week view's resampling, the Altair build -- and then
+serialise the data into the spec. The spec only changes when the data does, so
+cached() keys it by the chart's kind, its parameters and a version of the data in
+its window (frames.window_version, or the latest sample's date for windows ending
+now), and builds it only on a miss.
+
+Kept in memory for the process; and on disk under CACHE_DIR when the caller says the
+window is closed -- a past day or range won't change again, so it is built once, ever,
+across restarts. Open windows change with every sample, so they stay in memory and
+fall out of it as they are replaced. On disk, a new version of a chart replaces the
+old one (a backfill did change that past day after all), and past DISK_BYTES the
+least recently used files go.
+"""
+
+import collections
+import hashlib
+import json
+import os
+from pathlib import Path
+
+CACHE_DIR = Path(__file__).resolve().parent.parent / "output" / ".cache" / "charts"
+# Specs kept in memory; a day's worth of charts is about 1 MB.
+MEMORY_ENTRIES = 64
+# Size of the on-disk cache: a few months of browsed days and ranges.
+DISK_BYTES = 64 * 2**20
+
+_memory = collections.OrderedDict()
+
+
+def cached(kind, params, version, build, persist=False, cache_dir=CACHE_DIR):
+    """The spec `build()` returns for these, built only when not cached yet.
+
+    `build` returns anything JSON can hold: a spec (Chart.to_dict()), a list of them,
+    None for "nothing to chart". `persist` also keeps it on disk, for closed windows.
+    """
+    chart = f"{kind}-{hashlib.sha1(repr((kind, params)).encode()).hexdigest()[:12]}"
+    key = f"{chart}-{hashlib.sha1(repr(version).encode()).hexdigest()[:12]}"
+    if key in _memory:
+        _memory.move_to_end(key)
+        return _memory[key]
+
+    path = Path(cache_dir) / f"{key}.json"
+    try:
+        with open(path) as f:
+            spec = json.load(f)
+        os.utime(path)  # recently used, for _prune
+    except (OSError, ValueError):
+        spec = build()
+        if persist:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            partial = path.with_name(f".{path.name}.tmp")
+            with open(partial, "w") as f:
+                json.dump(spec, f)
+            os.replace(partial, path)
+            _prune(path, chart)
+
+    _memory[key] = spec
+    while len(_memory) > MEMORY_ENTRIES:
+        _memory.popitem(last=False)
+    return spec
+
+
+def _prune(written, chart, limit=DISK_BYTES):
+    # Drop the versions `written` supersedes, then the least recently used files
+    # until the rest fit in `limit`.
+    files = []
+    for path in written.parent.glob("*.json"):
+        try:
+            if path != written and path.name.startswith(f"{chart}-"):
+                path.unlink()
+            else:
+                files.append((path.stat().st_mtime, path.stat().st_size, path))
+        except OSError:
+            pass  # pruned by another process meanwhile
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= limit or path == written:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
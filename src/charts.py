@@ -0,0 +1,345 @@
+"""The dashboard's charts, built from frames.py's DataFrames.
+
+Shared by dashboard.py and static.py, so both draw the same Altair charts.
+"""
+
+import altair as alt
+import pandas as pd
+
+NIGHT_START, NIGHT_END = 22, 7  # night is 22:00 -> 07:00
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+# Per-night marker on the week overview: which extreme, its label, its tooltip title.
+# The coldest point is what an open window buys; the CO2 peak is what a shut one costs.
+NIGHT_MARKERS = {
+    "temp": ("min", "{:.1f}°C", "Night min"),
+    "co2": ("max", "{:.0f} ppm", "Night max"),
+}
+WEEK_FEATURES = {
+    "temp": "Temperature (°C)",
+    "co2": "CO2 (ppm)",
+    "hum": "Humidity (%)",
+    "pressure": "Pressure (hPa)",
+    "pm25": "PM2.5 (µg/m³)",
+    "voc": "TVOC (ppb)",
+}
+
+# Outdoor (Open-Meteo) counterparts of indoor metrics, drawn as dashed gray comparison lines.
+OUTDOOR_COLUMNS = {"temp": "out_temp", "hum": "out_hum", "pressure": "out_pressure"}
+OUTDOOR_COLOR = "#888888"
+
+PM_COLUMNS = ["pm1", "pm25", "pm4", "pm10"]
+PM_LABELS = {
+    "pm1": "PM1.0",
+    "pm25": "PM2.5",
+    "pm4": "PM4.0",
+    "pm10": "PM10",
+}
+
+
+def night_key(dates: pd.DatetimeIndex) -> pd.DatetimeIndex:
+    # Shifting back by NIGHT_START hours files 22:00 and the 05:00 after it under the
+    # evening the night started on (as summary.co2_streak does in SQL).
+    return (dates - pd.Timedelta(hours=NIGHT_START)).normalize()
+
+
+def night_spans(start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+    """Nights overlapping [start, end], clipped to it, as n0/n1 columns indexed by night."""
+    # From the evening before `start`, so a window opening at 03:00 gets its night too.
+    nights = pd.date_range(night_key(pd.DatetimeIndex([start]))[0], end.normalize(), freq="D")
+    n0 = nights + pd.Timedelta(hours=NIGHT_START)
+    n1 = nights + pd.Timedelta(hours=24 + NIGHT_END)
+    keep = (n0 < end) & (n1 > start)
+    return pd.DataFrame(
+        {"n0": n0[keep].where(n0[keep] > start, start), "n1": n1[keep].where(n1[keep] < end, end)},
+        index=nights[keep],
+    )
+
+
+def night_stats(series: pd.Series) -> pd.DataFrame:
+    """Per-night min and max of a date-indexed series and when they happened.
+
+    One groupby over the night rows rather than a slice per night, so a year costs
+    about what a week does.
+    """
+    hours = series.index.hour
+    night = series[(hours >= NIGHT_START) | (hours < NIGHT_END)]
+    grouped = night.groupby(night_key(night.index))
+    return pd.DataFrame(
+        {
+            "min": grouped.min(),
+            "min_at": grouped.idxmin(),
+            "max": grouped.max(),
+            "max_at": grouped.idxmax(),
+        }
+    )
+
+
+def metric_columns(col: str) -> list[str]:
+    """What plot_metric_over_time and plot_week_overview read to chart `col`."""
+    return ["date", col] + ([OUTDOOR_COLUMNS[col]] if col in OUTDOOR_COLUMNS else [])
+
+
+# What plot_pm_over_time reads.
+PM_CHART_COLUMNS = ["date", *PM_COLUMNS]
+# The single-metric charts of a day, and what day_charts reads for them all.
+DAY_METRICS = ("co2", "temp", "hum", "pressure", "voc")
+DAY_COLUMNS = [*(c for col in DAY_METRICS for c in metric_columns(col)), *PM_CHART_COLUMNS]
+
+
+def plot_week_overview(df: pd.DataFrame, col: str, label: str) -> alt.Chart | None:
+    data = df[["date", col]].dropna()
+    if data.empty:
+        return None
+    start, end = data["date"].min(), data["date"].max()
+    indexed = data.set_index("date")[col]
+    # Downsample the raw line to keep the browser-side chart light.
+    raw = indexed.resample("5min").mean().dropna().reset_index()
+    hourly = indexed.resample("1h").mean().dropna().reset_index()
+
+    x = alt.X("date:T", axis=alt.Axis(title=None, format="%b %d"))
+    y = alt.Y(f"{col}:Q", title=label, scale=alt.Scale(zero=False))
+
+    bands_df = night_spans(start, end)
+    bands = (
+        alt.Chart(bands_df)
+        .mark_rect(color="#cccccc", opacity=0.4)
+        .encode(x="n0:T", x2="n1:T")
+    )
+    raw_line = (
+        alt.Chart(raw).mark_line(strokeWidth=0.5, color="#e8763a", opacity=0.6).encode(x=x, y=y)
+    )
+    hourly_line = alt.Chart(hourly).mark_line(strokeWidth=2.5, color="#d0421b").encode(
+        x=x, y=y, tooltip=["date:T", alt.Tooltip(f"{col}:Q", format=".1f", title=label)]
+    )
+    chart = bands + raw_line + hourly_line
+
+    out_col = OUTDOOR_COLUMNS.get(col)
+    if out_col and out_col in df.columns and df[out_col].notna().any():
+        out_hourly = (
+            df.set_index("date")[out_col].resample("1h").mean().dropna().reset_index()
+        )
+        chart += alt.Chart(out_hourly).mark_line(
+            strokeWidth=1.5, color=OUTDOOR_COLOR, strokeDash=[5, 3]
+        ).encode(
+            x=x,
+            y=alt.Y(f"{out_col}:Q", title=label, scale=alt.Scale(zero=False)),
+            tooltip=["date:T", alt.Tooltip(f"{out_col}:Q", format=".1f", title="Outdoor")],
+        )
+
+    if col in NIGHT_MARKERS:
+        stat, label_format, title = NIGHT_MARKERS[col]
+        stats = night_stats(indexed)
+        marks = pd.DataFrame({"date": stats[f"{stat}_at"], "y": stats[stat]})
+        marks["label"] = marks["y"].map(label_format.format)
+        chart += alt.Chart(marks).mark_point(filled=True, size=90, color="#2077b4").encode(
+            x="date:T", y="y:Q", tooltip=[alt.Tooltip("y:Q", format=".1f", title=title)]
+        )
+        chart += alt.Chart(marks).mark_text(dy=14, color="#2077b4").encode(
+            x="date:T", y="y:Q", text="label:N"
+        )
+
+    return chart.properties(height=350)
+
+
+def plot_range(df: pd.DataFrame, col: str, label: str) -> alt.Chart | None:
+    data = df.dropna(subset=[col])
+    if data.empty:
+        return None
+    x = alt.X("date:T", axis=alt.Axis(title=None))
+    chart = alt.Chart(data).mark_line(color="#d0421b").encode(
+        x=x,
+        y=alt.Y(f"{col}:Q", title=label, scale=alt.Scale(zero=False)),
+        tooltip=["date:T", alt.Tooltip(f"{col}:Q", format=".1f", title=label)],
+    )
+    if f"{col}_min" in data.columns:
+        # Aggregated points: the band is each bucket's min-max, so peaks stay visible.
+        chart = (
+            alt.Chart(data)
+            .mark_area(color="#e8763a", opacity=0.3)
+            .encode(x=x, y=f"{col}_min:Q", y2=f"{col}_max:Q")
+        ) + chart
+    return chart.properties(height=350)
+
+
+def plot_calendar(grid: pd.DataFrame, col: str, label: str) -> alt.Chart | None:
+    data = grid.dropna(subset=[col]) if col in grid.columns else grid.iloc[0:0]
+    if data.empty:
+        return None
+    return (
+        alt.Chart(data)
+        .mark_rect()
+        .encode(
+            x=alt.X("week:O", timeUnit="yearmonthdate", axis=alt.Axis(title=None, format="%b %d")),
+            y=alt.Y("weekday:O", sort=WEEKDAYS, title=None),
+            color=alt.Color(f"{col}:Q", title=label, scale=alt.Scale(scheme="orangered")),
+            tooltip=[
+                alt.Tooltip("date:T", format="%a %d %b %Y"),
+                alt.Tooltip(f"{col}:Q", format=".1f", title="mean"),
+                alt.Tooltip(f"{col}_max:Q", format=".1f", title="max"),
+            ],
+        )
+        .properties(height=170)
+    )
+
+
+def plot_ventilation(events: pd.DataFrame) -> alt.Chart:
+    return (
+        alt.Chart(events)
+        .mark_circle(size=50, color="#2077b4")
+        .encode(
+            x=alt.X("date:T", axis=alt.Axis(title=None)),
+            y=alt.Y("ach:Q", title="Air changes per hour"),
+            tooltip=[
+                alt.Tooltip("date:T", format="%a %d %b %H:%M", title="Aired out"),
+                alt.Tooltip("ach:Q", format=".1f", title="Air changes per hour"),
+                alt.Tooltip("co2_start:Q", format=".0f", title="CO2 from"),
+                alt.Tooltip("co2_end:Q", format=".0f", title="CO2 to"),
+            ],
+        )
+        .properties(height=250)
+    )
+
+
+def time_axis_format(df) -> str:
+    # A window crossing midnight repeats every clock label, so name the day too.
+    return "%H %M" if df["date"].dt.normalize().nunique() <= 1 else "%a %H %M"
+
+
+def plot_metric_over_time(df, col, baseline=None):
+    chart = (
+        alt.Chart(df)
+        .mark_line()
+        .encode(
+            x=alt.X("date:T", axis=alt.Axis(title="time", format=time_axis_format(df))),
+            y=col,
+        )
+    )
+    if baseline is not None:
+        # For a self-baselining sensor the line height means little on its own;
+        # what it does either side of this reference is the whole reading.
+        chart += (
+            alt.Chart(pd.DataFrame({"baseline": [baseline]}))
+            .mark_rule(color=OUTDOOR_COLOR, strokeDash=[4, 4])
+            .encode(y=alt.Y("baseline:Q", title=col))
+        )
+        chart = chart.properties(
+            title=alt.TitleParams(
+                "dashed gray = normal for this window", fontSize=11, anchor="end"
+            )
+        )
+    out_col = OUTDOOR_COLUMNS.get(col)
+    if out_col and out_col in df.columns and df[out_col].notna().any():
+        outdoor = (
+            alt.Chart(df.dropna(subset=[out_col]))
+            .mark_line(color=OUTDOOR_COLOR, strokeDash=[5, 3])
+            .encode(
+                x="date:T",
+                y=alt.Y(f"{out_col}:Q", title=col),
+                tooltip=[
+                    "date:T",
+                    alt.Tooltip(f"{out_col}:Q", format=".1f", title=f"outdoor {col}"),
+                ],
+            )
+        )
+        chart = (chart + outdoor).properties(
+            title=alt.TitleParams("solid = indoor, dashed gray = outdoor", fontSize=11, anchor="end")
+        )
+    return chart
+
+
+def plot_pm_over_time(df, domain=None):
+    # Check which PM columns are available in the dataframe.
+    available_columns = [col for col in PM_COLUMNS if col in df.columns]
+    if not available_columns:
+        return None
+
+    # The SPS30's start-up spike is already NULL: monitor.py flags it (see quality.py).
+    pm_df = df[["date"] + available_columns].dropna(subset=available_columns, how="all")
+    if pm_df.empty:
+        return None
+
+    # Prepare long-form data for Altair.
+    label_map = {col: PM_LABELS[col] for col in available_columns}
+    ordered_labels = [label_map[col] for col in available_columns]
+    axis_format = time_axis_format(pm_df)
+
+    # Raw data.
+    raw_long = (
+        pm_df.rename(columns=label_map)
+        .melt("date", var_name="particulate", value_name="μg/m³")
+        .dropna(subset=["μg/m³"])
+    )
+    if raw_long.empty:
+        return None
+
+    # Smoothed data (5-point rolling mean).
+    smoothed_wide = pm_df[["date"]].copy()
+    for col in available_columns:
+        smoothed_wide[col] = pm_df[col].rolling(window=5, min_periods=1).mean()
+
+    # Long-form smoothed data.
+    smoothed_long = (
+        smoothed_wide.rename(columns=label_map)
+        .melt("date", var_name="particulate", value_name="μg/m³")
+        .dropna(subset=["μg/m³"])
+    )
+    # Only the long forms go into the chart; let the wide frames go before it's built.
+    del pm_df, smoothed_wide
+    smoothed_long = smoothed_long[smoothed_long["particulate"].isin(ordered_labels)]
+
+    # Create the Altair chart.
+    x_encoding = alt.X(
+        "date:T",
+        axis=alt.Axis(title="time", format=axis_format),
+        scale=alt.Scale(domain=domain) if domain else alt.Undefined,
+    )
+    y_encoding = alt.Y("μg/m³:Q", axis=alt.Axis(title="mass concentration (μg/m³)"))
+    color_encoding = alt.Color("particulate:N", sort=ordered_labels, title="PM size")
+
+    # Base chart with raw data.
+    base_chart = (
+        alt.Chart(raw_long)
+        .mark_line(strokeWidth=0.5)
+        .encode(x=x_encoding, y=y_encoding, color=color_encoding)
+    )
+
+    # Add smoothed data on top, if available.
+    if smoothed_long.empty:
+        return base_chart
+    smooth_chart = (
+        alt.Chart(smoothed_long)
+        .mark_line(strokeWidth=2)
+        .encode(x=x_encoding, y=y_encoding, color=color_encoding)
+    )
+    return base_chart + smooth_chart
+
+
+def day_charts(df: pd.DataFrame) -> list[tuple[str, alt.Chart]]:
+    """The charts of a day (or the last 24h), as (name, chart), in page order."""
+    charts = [(col, plot_metric_over_time(df, col)) for col in DAY_METRICS if col != "voc"]
+    # Only charted once the CCS811 has logged something; older days have no TVOC.
+    if "voc" in df.columns and df["voc"].notna().any():
+        # Baselined over the window on screen, not the rolling 24h the card uses,
+        # so the line still means "normal here" when looking back at a past day.
+        charts.append(("voc", plot_metric_over_time(df, "voc", baseline=df["voc"].median())))
+    pm_chart = plot_pm_over_time(df, domain=(df["date"].min(), df["date"].max()))
+    if pm_chart is not None:
+        charts.append(("pm", pm_chart))
+    return charts
+
+
+def week_caption(col: str) -> str:
+    caption = f"Shaded bands are nights, {NIGHT_START}:00-0{NIGHT_END}:00"
+    if col in OUTDOOR_COLUMNS:
+        caption += " — dashed gray line is outdoor"
+    return caption
+
+
+def latest_reading(current: dict) -> pd.Series:
+    """The reading in frames.load_current()'s state, with a localised date and NaN gaps."""
+    last_record = pd.Series(
+        {k: float("nan") if v is None else v for k, v in current["reading"].items()}
+    )
+    last_record["date"] = pd.Timestamp(last_record["date"]).tz_localize("Europe/Brussels")
+    return last_record
+
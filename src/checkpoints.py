@@ -0,0 +1,144 @@
+"""Keep the WAL short, and count how long the database makes the monitor wait.
+
+In WAL mode SQLite checkpoints -- copies the WAL back into the database -- inside
+whichever commit takes the WAL past 1000 pages, and only as far as no reader still
+needs the frames. While a long read runs (the full-history export) the WAL just grows,
+and afterwards the file is reused but never shrunk, so every read searches a bigger
+WAL index. monitor.py runs a Checkpointer thread, with its own connection, that every
+CHECKPOINT_SECONDS:
+
+- runs a PASSIVE checkpoint, which copies what it can without waiting for anyone;
+- if that got everything, no reader is holding frames back; if the WAL file has also
+  grown past TRUNCATE_ABOVE_BYTES, follows up with a TRUNCATE checkpoint to reset it
+  to zero bytes. That one has to wait for the writer, so its connection gives up
+  after TRUNCATE_TIMEOUT_SECONDS and leaves it for the next round rather than hold
+  up the monitor's next insert.
+
+Alongside, it keeps counters -- WAL size, checkpoint durations and how often one was
+busy, and how long the monitor's inserts waited for the write lock -- and writes them
+as JSON to HEALTH_PATH (RAM-backed, like the live buffer) for the dashboard's
+database-health section.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from config import DB_PATH, HEALTH_PATH
+
+CHECKPOINT_SECONDS = 60
+TRUNCATE_TIMEOUT_SECONDS = 0.1
+# Below this the WAL is just reused after a full checkpoint; truncating it every round
+# would only trade that for growing the file again on the SD card.
+TRUNCATE_ABOVE_BYTES = 4 * 1024 * 1024
+# An insert that took longer than this to get the write lock counts as a lock wait.
+LOCK_WAIT_SECONDS = 0.005
+
+
+def wal_bytes(path=DB_PATH):
+    try:
+        return os.path.getsize(f"{path}-wal")
+    except OSError:
+        return 0
+
+
+class Checkpointer:
+    def __init__(self, path=DB_PATH, interval=CHECKPOINT_SECONDS, health_path=HEALTH_PATH):
+        self.path = path
+        self.interval = interval
+        self.health_path = health_path
+        self._lock = threading.Lock()  # the counters are updated from two threads
+        self.stats = {
+            "started_at": time.time(),
+            "updated_at": None,
+            "wal_bytes": wal_bytes(path),
+            "max_wal_bytes": wal_bytes(path),
+            "checkpoints": 0,
+            "checkpoints_busy": 0,
+            "truncates": 0,
+            "max_checkpoint_seconds": 0.0,
+            # {"at", "mode", "seconds", "frames", "copied", "busy"} of the latest one.
+            "last_checkpoint": None,
+            "last_truncate_at": None,
+            "writes": 0,
+            "lock_waits": 0,
+            "lock_wait_seconds": 0.0,
+            "max_lock_wait_seconds": 0.0,
+            "max_write_seconds": 0.0,
+        }
+
+    def record_write(self, lock_wait, seconds):
+        """Count one of the monitor's write transactions: time to get the lock, in all."""
+        with self._lock:
+            s = self.stats
+            s["writes"] += 1
+            if lock_wait >= LOCK_WAIT_SECONDS:
+                s["lock_waits"] += 1
+            s["lock_wait_seconds"] += lock_wait
+            s["max_lock_wait_seconds"] = max(s["max_lock_wait_seconds"], lock_wait)
+            s["max_write_seconds"] = max(s["max_write_seconds"], seconds)
+
+    def _checkpoint(self, con, mode):
+        started = time.perf_counter()
+        try:
+            busy, frames, copied = con.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+        except sqlite3.OperationalError:  # "database is locked" past the timeout
+            busy, frames, copied = 1, -1, -1
+        seconds = time.perf_counter() - started
+        with self._lock:
+            s = self.stats
+            s["checkpoints"] += 1
+            s["checkpoints_busy"] += bool(busy)
+            s["max_checkpoint_seconds"] = max(s["max_checkpoint_seconds"], seconds)
+            s["last_checkpoint"] = {
+                "at": time.time(), "mode": mode, "seconds": seconds,
+                "frames": frames, "copied": copied, "busy": bool(busy),
+            }
+            if mode == "TRUNCATE" and not busy:
+                s["truncates"] += 1
+                s["last_truncate_at"] = time.time()
+        return not busy and frames == copied
+
+    def checkpoint(self, con):
+        """One round: PASSIVE, then TRUNCATE when that caught up and the WAL is big."""
+        before = wal_bytes(self.path)
+        if self._checkpoint(con, "PASSIVE") and before > TRUNCATE_ABOVE_BYTES:
+            self._checkpoint(con, "TRUNCATE")
+        with self._lock:
+            self.stats["wal_bytes"] = wal_bytes(self.path)
+            self.stats["max_wal_bytes"] = max(self.stats["max_wal_bytes"], before)
+
+    def write(self):
+        with self._lock:
+            self.stats["updated_at"] = time.time()
+            data = json.dumps(self.stats)
+        # Write and rename, so the dashboard never reads half a file.
+        partial = f"{self.health_path}.tmp"
+        with open(partial, "w") as f:
+            f.write(data)
+        os.replace(partial, self.health_path)
+
+    def _run(self):
+        con = sqlite3.connect(self.path, timeout=TRUNCATE_TIMEOUT_SECONDS)
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.checkpoint(con)
+                self.write()
+            except Exception as exc:
+                print("Checkpoint failed:", exc)
+
+    def start(self):
+        threading.Thread(target=self._run, name="checkpoint", daemon=True).start()
+        return self
+
+
+def read_health(path=HEALTH_PATH):
+    """The monitor's latest counters, or None when it hasn't written any."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,231 @@
+"""Roll raw rows older than the retention window into hourly rows.
+
+`records` gets a row every 5 minutes forever, and everything that scans it -- the
+dashboard, the CSV export, the weekly backup -- grows with it. Past RAW_RETENTION_DAYS
+nobody looks at 5-minute detail any more, so those rows are folded into
+`records_hourly`: one row per hour keeping the mean under the metric's own name plus
+`<metric>_min` and `<metric>_max`, so peaks survive the compaction.
+
+Readers go through the `history` view, which is the raw rows followed by the hourly
+ones under the same column names, so they never need to know which tier a row is in.
+Its raw half is `records_clean`: `records` with the values quality.py flagged as
+NULL, which is also what gets compacted.
+
+Every day of history is moved in its own short transaction and the freed pages are
+handed back a few at a time, so monitor.py's 60-second busy timeout is never at risk.
+
+Run from cron:  30 3 * * * cd ~/Documents/rpi-airquality/src && python3 compact.py
+"""
+
+import datetime
+import math
+import sqlite3
+import time
+
+from config import DB_PATH, RAW_RETENTION_DAYS
+from quality import clean
+
+HOURLY_TABLE = "records_hourly"
+HISTORY_VIEW = "history"
+CLEAN_VIEW = "records_clean"
+# Columns that are bookkeeping rather than measurements, so get no min/max.
+KEY_COLUMNS = ("date", "session_id")
+# Per-sample flags set at ingest. They describe single rows, so an hourly row has none;
+# the view reads them as NULL there.
+FLAG_COLUMNS = ("anomalies", "quality")
+# A degree mean of 350 and 10 is 180, which points the wrong way; average the vectors.
+CIRCULAR_COLUMNS = ("out_wind_dir",)
+# One row counting the inserts, updates and deletes in either tier, kept by triggers, so
+# a reader can tell the data changed even when no row was added (api.py's ETag).
+CHANGES_TABLE = "data_changes"
+# Pages handed back per incremental_vacuum step (4 KiB each), and the pause between
+# steps and between days so monitor.py can slip its insert in.
+VACUUM_PAGES_PER_STEP = 256
+PAUSE_SECONDS = 0.2
+
+
+def _columns(con, table):
+    return [info[1] for info in con.execute(f"PRAGMA table_info({table})")]
+
+
+def metric_columns(con):
+    return [c for c in _columns(con, "records") if c not in KEY_COLUMNS + FLAG_COLUMNS]
+
+
+def ensure_change_counter(con):
+    """Create CHANGES_TABLE and the triggers counting into it, on the tiers that exist.
+
+    Migration 7 calls this before the hourly table may exist; ensure_tiers() calls it
+    again once it does. Idempotent.
+    """
+    con.execute(
+        f"CREATE TABLE IF NOT EXISTS {CHANGES_TABLE} "
+        "(id integer PRIMARY KEY CHECK (id = 0), changes integer)"
+    )
+    con.execute(f"INSERT OR IGNORE INTO {CHANGES_TABLE} VALUES (0, 0)")
+    tables = {row[0] for row in con.execute("SELECT name FROM sqlite_master")}
+    for table in ("records", HOURLY_TABLE):
+        if table not in tables:
+            continue
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            con.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_count "
+                f"AFTER {event} ON {table} "
+                f"BEGIN UPDATE {CHANGES_TABLE} SET changes = changes + 1; END"
+            )
+
+
+def ensure_tiers(con):
+    """Create the hourly table, indexes, change counter and views over both tiers.
+
+    Idempotent. The views list the columns of `records`, which migrations extend in
+    place, so migrations.migrate() calls this after applying any; compact() calls it
+    too, before moving rows. Nothing else rebuilds the views.
+    """
+    metrics = metric_columns(con)
+    con.execute(
+        f"CREATE TABLE IF NOT EXISTS {HOURLY_TABLE} "
+        "(date timestamp PRIMARY KEY, samples integer, session_id integer)"
+    )
+    existing = set(_columns(con, HOURLY_TABLE))
+    for metric in metrics:
+        for column in (metric, f"{metric}_min", f"{metric}_max"):
+            if column not in existing:
+                con.execute(f"ALTER TABLE {HOURLY_TABLE} ADD COLUMN {column} real")
+    # Compaction and every dashboard window select by date range.
+    con.execute("CREATE INDEX IF NOT EXISTS records_date ON records (date)")
+    # Per-room reads select by session in both tiers (rooms.py; the raw one's index is
+    # migration 6).
+    con.execute(
+        f"CREATE INDEX IF NOT EXISTS {HOURLY_TABLE}_session ON {HOURLY_TABLE} (session_id)"
+    )
+    ensure_change_counter(con)
+    flags = [c for c in FLAG_COLUMNS if c in _columns(con, "records")]
+    cleaned = [clean(m) for m in metrics] if "quality" in flags else metrics
+    columns = ", ".join(("date", *metrics, *flags, "session_id"))
+    hourly = ", ".join(("date", *metrics, *(f"NULL AS {c}" for c in flags), "session_id"))
+    con.execute(f"DROP VIEW IF EXISTS {HISTORY_VIEW}")
+    con.execute(f"DROP VIEW IF EXISTS {CLEAN_VIEW}")
+    con.execute(
+        f"CREATE VIEW {CLEAN_VIEW} AS "
+        f"SELECT {', '.join(('date', *cleaned, *flags, 'session_id'))} FROM records"
+    )
+    con.execute(
+        f"CREATE VIEW {HISTORY_VIEW} AS "
+        f"SELECT {columns} FROM {CLEAN_VIEW} UNION ALL SELECT {hourly} FROM {HOURLY_TABLE}"
+    )
+    con.commit()
+
+
+def _mean(values, circular=False):
+    if not values:
+        return None
+    if circular:
+        x = sum(math.cos(math.radians(v)) for v in values)
+        y = sum(math.sin(math.radians(v)) for v in values)
+        return math.degrees(math.atan2(y, x)) % 360
+    return sum(values) / len(values)
+
+
+def aggregate_hours(rows, columns):
+    """Fold raw rows (tuples in `columns` order) into one row per hour.
+
+    Returns (hour, samples, session_id, *[mean, min, max per metric]) tuples. Stored
+    dates are naive local ISO strings, so the first 13 characters name the hour.
+    """
+    date_at = columns.index("date")
+    session_at = columns.index("session_id")
+    metric_at = [(i, c in CIRCULAR_COLUMNS) for i, c in enumerate(columns) if c not in KEY_COLUMNS]
+    hours = {}
+    for row in rows:
+        hours.setdefault(row[date_at][:13] + ":00:00", []).append(row)
+
+    out = []
+    for hour, members in sorted(hours.items()):
+        sessions = [r[session_at] for r in members if r[session_at] is not None]
+        values = [max(sessions) if sessions else None]
+        for i, circular in metric_at:
+            seen = [r[i] for r in members if r[i] is not None]
+            values += [_mean(seen, circular), min(seen, default=None), max(seen, default=None)]
+        out.append((hour, len(members), *values))
+    return out
+
+
+def _cutoff(now, days):
+    # Cut on an hour boundary so an hour is never split between the two tiers.
+    cutoff = (now - datetime.timedelta(days=days)).replace(minute=0, second=0, microsecond=0)
+    return cutoff.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def vacuum_step(con, pages=VACUUM_PAGES_PER_STEP):
+    """Return up to `pages` free pages to the filesystem; how many are left free."""
+    con.execute(f"PRAGMA incremental_vacuum({pages})").fetchall()
+    return con.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def compact(con, now=None, days=RAW_RETENTION_DAYS, pause=PAUSE_SECONDS):
+    """Move raw rows older than `days` into the hourly tier, one day per transaction."""
+    ensure_tiers(con)
+    cutoff = _cutoff(now or datetime.datetime.now(), days)
+    metrics = metric_columns(con)
+    columns = ["date", *metrics, "session_id"]
+    targets = ["date", "samples", "session_id"]
+    for metric in metrics:
+        targets += [metric, f"{metric}_min", f"{metric}_max"]
+    insert = (
+        f"INSERT OR REPLACE INTO {HOURLY_TABLE} ({', '.join(targets)}) "
+        f"VALUES ({', '.join('?' * len(targets))})"
+    )
+    select = f"SELECT {', '.join(columns)} FROM {CLEAN_VIEW} WHERE date >= ? AND date < ?"
+
+    moved = 0
+    while True:
+        oldest = con.execute(
+            "SELECT MIN(date) FROM records WHERE date < ?", (cutoff,)
+        ).fetchone()[0]
+        if oldest is None:
+            break
+        day = datetime.date.fromisoformat(oldest[:10])
+        end = min(cutoff, (day + datetime.timedelta(days=1)).isoformat())
+        # Taken before the read, so an update to the day (outdoor.fill, a quality
+        # backfill) can't land between it and the DELETE and be lost.
+        with con:
+            con.execute("BEGIN IMMEDIATE")
+            rows = con.execute(select, (oldest, end)).fetchall()
+            con.executemany(insert, aggregate_hours(rows, columns))
+            con.execute("DELETE FROM records WHERE date >= ? AND date < ?", (oldest, end))
+        moved += len(rows)
+        vacuum_step(con)
+        time.sleep(pause)
+
+    if _auto_vacuum(con) == 2:
+        while vacuum_step(con):
+            time.sleep(pause)
+    return moved
+
+
+def _auto_vacuum(con):
+    return con.execute("PRAGMA auto_vacuum").fetchone()[0]  # 0 none, 1 full, 2 incremental
+
+
+if __name__ == "__main__":
+    import sys
+
+    con = sqlite3.connect(DB_PATH, timeout=60)
+    if "--convert" in sys.argv:
+        # auto_vacuum only changes on a full VACUUM, which rewrites the whole file under
+        # an exclusive lock. Needed once for databases created before monitor.py set
+        # INCREMENTAL; stop the monitor first or it may time out waiting.
+        con.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        con.execute("VACUUM")
+    elif _auto_vacuum(con) != 2:
+        print("auto_vacuum is not INCREMENTAL; freed pages are reused but the file won't "
+              "shrink. Run once with --convert (monitor stopped) to fix.")
+    # Closed months go to the archive first, so they keep their 5-minute rows there.
+    import archive
+
+    for month, rows in archive.export_closed(con):
+        print(f"{datetime.datetime.now()}: archived {month:%Y-%m}, {rows} rows")
+    moved = compact(con)
+    print(f"{datetime.datetime.now()}: compacted {moved} raw rows")
+    con.close()
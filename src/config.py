@@ -11,6 +11,11 @@ try:
     from location import LATITUDE, LONGITUDE  # noqa: F811
 except ImportError:
     pass
+# Open-Meteo's services: monitor.py reads the forecast and air quality ones live, and
+# outdoor.py fills in history from the archive. simulate.py stands in for all three.
+FORECAST_HOST = "https://api.open-meteo.com"
+AIR_QUALITY_HOST = "https://air-quality-api.open-meteo.com"
+ARCHIVE_HOST = "https://archive-api.open-meteo.com"
 
 # ntfy.sh topic to push notifications to (e.g. indoor/outdoor temp getting close).
 # Set in the gitignored src/location.py to keep it out of the public repo. Install the
@@ -20,3 +25,65 @@ try:
     from location import NTFY_TOPIC  # noqa: F811
 except ImportError:
     pass
+
+# Raw 5-minute rows are kept this many days; compact.py rolls older ones into hourly
+# rows (mean, min and max per metric) so the database stops growing without bound.
+RAW_RETENTION_DAYS = 90
+
+# archive.py writes each closed month here as a compressed columnar file (needs pyarrow).
+ARCHIVE_DIR = Path(__file__).resolve().parent.parent / "archive"
+
+# monitor.py mirrors the latest readings into this memory-mapped ring buffer so the
+# dashboard's live view needs no SQL. /dev/shm is RAM-backed, so nothing hits the SD card.
+LIVE_BUFFER_PATH = Path("/dev/shm/airquality-live")
+LIVE_BUFFER_HOURS = 24
+# ...and its database checkpoint and lock-wait counters here, for the dashboard's health
+# section (see checkpoints.py).
+HEALTH_PATH = Path("/dev/shm/airquality-health.json")
+
+# Where static.py writes the dashboard's front page as static HTML and Vega-Lite specs,
+# e.g. Path("/var/www/airquality"). When set, monitor.py re-renders it after each sample.
+STATIC_DIR = None
+
+# api.py serves JSON, and the live updates, on this port. monitor.py announces every
+# sample to it as a UDP datagram on PUSH_ADDRESS (see push.py).
+API_PORT = 4203
+PUSH_ADDRESS = ("127.0.0.1", 4204)
+
+# Dashboard low-memory mode for small Pis: metrics as float32 (CO2 as a 16-bit integer),
+# dates read as integer timestamps instead of strings, and a peak-memory readout.
+LOW_MEMORY = False
+
+# Metrics whose unusual readings (see anomaly.py) send a notification. Every metric is
+# still checked and flagged in `records`; these are the ones worth a ping, one per
+# correlated group: PM2.5 stands for the other particle sizes, TVOC for eCO2.
+ANOMALY_ALERT_METRICS = ("co2", "voc", "temp", "hum", "pm25")
+# After notifying about a metric, stay quiet about it for this long.
+ANOMALY_COOLDOWN_MINUTES = 180
+
+# Alert rules monitor.py evaluates on every sample; see rules.py for the format, and run
+# `python3 src/rules.py` to count what a change would have sent over the stored history.
+RULES = [
+    {
+        # Outdoor will catch up with indoor within half an hour. `close_in` (minutes) is
+        # worked out by monitor.py from the forecast, or the outdoor reading without one,
+        # and the room's thermal model (see thermal.close_in); it isn't stored, so the
+        # backtest skips this rule. Re-arms once the crossing is more than two hours off.
+        "name": "close_windows",
+        "value": "close_in",
+        "fire": [("<=", 30)],
+        "rearm": [(">", 120)],
+        "title": "Close the windows",
+        "message": "Outdoor temp ({out_temp:.1f}°C) reaches indoor ({temp:.1f}°C) "
+        "within half an hour.",
+    },
+    {
+        # Outdoor has dropped comfortably below indoor. Re-arms once the gap is under 1°C.
+        "name": "open_windows",
+        "value": "temp - out_temp",
+        "fire": [(">=", 2.0)],
+        "rearm": [("<", 1.0)],
+        "title": "Open the windows",
+        "message": "Outdoor temp ({out_temp:.1f}°C) is {value:.1f}°C below indoor ({temp:.1f}°C).",
+    },
+]
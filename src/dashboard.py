@@ -2,46 +2,51 @@ import base64
 import csv
 import datetime
 import io
+import resource
 import sqlite3
 from subprocess import call
 from zoneinfo import ZoneInfo
 
-import altair as alt
 import numpy as np
 import pandas as pd
 import streamlit as st
 
-from config import DB_PATH
-from utils import baseline_deviation
-
-NIGHT_START, NIGHT_END = 22, 7  # night is 22:00 -> 07:00
-EXPORT_TZ = ZoneInfo("Europe/Brussels")  # matches _normalize_dataframe's localisation
-WEEK_FEATURES = {
-    "temp": "Temperature (°C)",
-    "co2": "CO2 (ppm)",
-    "hum": "Humidity (%)",
-    "pressure": "Pressure (hPa)",
-    "pm25": "PM2.5 (µg/m³)",
-    "voc": "TVOC (ppb)",
-}
-
-# Outdoor (Open-Meteo) counterparts of indoor metrics, drawn as dashed gray comparison lines.
-OUTDOOR_COLUMNS = {"temp": "out_temp", "hum": "out_hum", "pressure": "out_pressure"}
-OUTDOOR_COLOR = "#888888"
-
-# How far above its own 24h baseline a TVOC reading has to sit before it counts
-# as a spike, in robust z-scores. 3.5 is the usual cut-off for this measure.
-# The CCS811's ppb output re-baselines itself continuously, so there is no
-# absolute number to threshold against -- only "unusual for this room lately".
-VOC_SPIKE_DEVIATION = 3.5
-
-PM_COLUMNS = ["pm1", "pm25", "pm4", "pm10"]
-PM_LABELS = {
-    "pm1": "PM1.0",
-    "pm25": "PM2.5",
-    "pm4": "PM4.0",
-    "pm10": "PM10",
-}
+import chartcache
+import checkpoints
+import frames
+import live
+import rooms
+import ventilation
+from cards import CARD_CSS, current_cards, metric_card
+from charts import (
+    DAY_COLUMNS,
+    WEEK_FEATURES,
+    day_charts,
+    latest_reading,
+    metric_columns,
+    plot_calendar,
+    plot_range,
+    plot_ventilation,
+    plot_week_overview,
+    week_caption,
+)
+from compact import HISTORY_VIEW
+from config import DB_PATH, LOW_MEMORY
+from frames import (
+    available_columns,
+    load_current,
+    load_day,
+    load_last_days,
+    load_range,
+    load_room_days,
+    read_sql,
+    window_version,
+)
+from summary import CO2_WARN
+
+# The calendar heatmap covers a year, one cell per day.
+CALENDAR_DAYS = 365
+EXPORT_TZ = ZoneInfo("Europe/Brussels")  # matches frames._normalize_dataframe's localisation
 
 # Compat shim for legacy dependencies expecting deprecated numpy aliases.
 if not hasattr(np, "object"):
@@ -50,62 +55,66 @@ if not hasattr(np, "bool"):
     np.bool = bool  # type: ignore[attr-defined,assignment]
 
 
-def _normalize_dataframe(df: pd.DataFrame) -> pd.DataFrame:
-    if df.empty:
-        return df
+def peak_memory_mb() -> float:
+    # ru_maxrss is in KiB on Linux: the high-water mark of the whole Streamlit process.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
 
-    df["date"] = pd.to_datetime(df["date"])
-    if df["date"].dt.tz is None:
-        df["date"] = df["date"].dt.tz_localize("Europe/Brussels")
-    else:
-        df["date"] = df["date"].dt.tz_convert("Europe/Brussels")
 
-    numeric_columns = [c for c in df.columns if c != "date"]
-    df[numeric_columns] = df[numeric_columns].apply(pd.to_numeric, errors="coerce")
-    return df
+@st.cache(show_spinner=False)
+def calendar_grid(data_version: str, columns: tuple[str, ...]) -> pd.DataFrame:
+    """Daily mean/min/max of `columns` over the last year, placed on a week grid.
 
-
-def load_records(limit: int | None = None) -> pd.DataFrame:
-    query = "SELECT * FROM records ORDER BY date DESC"
-    if limit is not None:
-        query += f" LIMIT {limit}"
-    with sqlite3.connect(DB_PATH) as con:
-        df = pd.read_sql_query(query, con)
-    return _normalize_dataframe(df).sort_values("date")
+    One grouped read of the daily rollup for every metric at once, so switching the
+    metric is a cache hit. `data_version` is only there to key the cache: it is the
+    latest sample's date, so the grid is recomputed once per new sample at most.
+    """
+    end = datetime.date.today()
+    _, grid = load_range(
+        end - datetime.timedelta(days=CALENDAR_DAYS - 1), end, list(columns), resolution="1d"
+    )
+    if grid.empty:
+        return grid
+    grid["week"] = grid["date"].dt.normalize() - pd.to_timedelta(
+        grid["date"].dt.weekday, unit="D"
+    )
+    grid["weekday"] = grid["date"].dt.strftime("%a")
+    return grid
 
 
-def load_day(day: datetime.date) -> pd.DataFrame:
-    # Dates are stored as naive local ISO strings, so a prefix match selects a day.
+@st.cache(show_spinner=False)
+def room_table(data_version: str, room_sessions: tuple) -> pd.DataFrame:
+    """rooms.aggregates() as a table, recomputed once per new sample at most."""
     with sqlite3.connect(DB_PATH) as con:
-        df = pd.read_sql_query(
-            "SELECT * FROM records WHERE date LIKE ? ORDER BY date",
-            con,
-            params=(f"{day.isoformat()}%",),
-        )
-    return _normalize_dataframe(df)
+        table = pd.DataFrame(rooms.aggregates(con, dict(room_sessions)))
+    table = table.set_index("room").rename(
+        columns={
+            "hours": "Hours",
+            "co2": "CO2 (ppm)",
+            "temp": "Temperature (°C)",
+            "hum": "Humidity (%)",
+            "pm25": "PM2.5 (µg/m³)",
+            "co2_hours": f"Hours over {CO2_WARN} ppm",
+            "pm25_max": "PM2.5 peak (µg/m³)",
+        }
+    )
+    return table.round(1)
 
 
-def load_last_days(days: int = 7) -> pd.DataFrame:
-    # Stored dates are local ISO strings, so lexicographic >= works.
-    cutoff = (datetime.datetime.now() - datetime.timedelta(days=days)).strftime(
-        "%Y-%m-%d %H:%M:%S"
-    )
-    with sqlite3.connect(DB_PATH) as con:
-        df = pd.read_sql_query(
-            "SELECT * FROM records WHERE date >= ? ORDER BY date",
-            con,
-            params=(cutoff,),
-        )
-    return _normalize_dataframe(df)
+def load_live(days: int = 1, columns: list[str] | None = None) -> pd.DataFrame | None:
+    try:
+        return frames.load_live(days, columns)
+    except live.Stalled:
+        st.warning("⚠️ The monitor has stopped writing — it may have crashed.")
+        return None
 
 
-def _float_export_columns(cur, columns: list[str]) -> set[str]:
+def _float_export_columns(cur, table: str, columns: list[str]) -> set[str]:
     # pandas widens any numeric column containing a NULL to float64, so those
     # export as "426.0" rather than "426". Counting the nulls sqlite-side keeps
     # the streamed CSV byte-identical to the pandas one it replaces.
     # Column names come from the table schema, not from user input.
     counts = cur.execute(
-        "SELECT COUNT(*), " + ", ".join(f"COUNT({c})" for c in columns) + " FROM records"
+        "SELECT COUNT(*), " + ", ".join(f"COUNT({c})" for c in columns) + f" FROM {table}"
     ).fetchone()
     total, per_column = counts[0], counts[1:]
     return {c for c, filled in zip(columns, per_column) if filled < total}
@@ -128,13 +137,14 @@ def full_history_download_link(chunk_rows: int = 2000) -> str | None:
 
     con = sqlite3.connect(DB_PATH)
     try:
-        columns = [d[1] for d in con.execute("PRAGMA table_info(records)")]
-        float_columns = _float_export_columns(con.cursor(), columns)
+        # Through the view, so compacted hours are exported as their hourly means.
+        columns = [d[1] for d in con.execute(f"PRAGMA table_info({HISTORY_VIEW})")]
+        float_columns = _float_export_columns(con.cursor(), HISTORY_VIEW, columns)
         is_float = [c in float_columns for c in columns]
         date_at = columns.index("date")
 
         writer.writerow(columns)
-        cur = con.execute("SELECT * FROM records ORDER BY date")
+        cur = con.execute(f"SELECT * FROM {HISTORY_VIEW} ORDER BY date")
         while rows := cur.fetchmany(chunk_rows):
             rows_seen += len(rows)
             for row in rows:
@@ -171,207 +181,20 @@ def full_history_download_link(chunk_rows: int = 2000) -> str | None:
     return "".join(parts)
 
 
-def night_spans(start: pd.Timestamp, end: pd.Timestamp) -> list[tuple[pd.Timestamp, pd.Timestamp]]:
-    spans = []
-    day = start.normalize()
-    while day <= end.normalize():
-        n0 = day + pd.Timedelta(hours=NIGHT_START)
-        n1 = day + pd.Timedelta(hours=24 + NIGHT_END)
-        if n0 < end and n1 > start:
-            spans.append((max(n0, start), min(n1, end)))
-        day += pd.Timedelta(days=1)
-    return spans
-
-
-def plot_week_overview(df: pd.DataFrame, col: str, label: str) -> alt.Chart | None:
-    data = df[["date", col]].dropna()
-    if data.empty:
-        return None
-    start, end = data["date"].min(), data["date"].max()
-    indexed = data.set_index("date")[col]
-    # Downsample the raw line to keep the browser-side chart light.
-    raw = indexed.resample("5min").mean().dropna().reset_index()
-    hourly = indexed.resample("1h").mean().dropna().reset_index()
-
-    x = alt.X("date:T", axis=alt.Axis(title=None, format="%b %d"))
-    y = alt.Y(f"{col}:Q", title=label, scale=alt.Scale(zero=False))
-
-    bands_df = pd.DataFrame(night_spans(start, end), columns=["n0", "n1"])
-    bands = (
-        alt.Chart(bands_df)
-        .mark_rect(color="#cccccc", opacity=0.4)
-        .encode(x="n0:T", x2="n1:T")
-    )
-    raw_line = (
-        alt.Chart(raw).mark_line(strokeWidth=0.5, color="#e8763a", opacity=0.6).encode(x=x, y=y)
-    )
-    hourly_line = alt.Chart(hourly).mark_line(strokeWidth=2.5, color="#d0421b").encode(
-        x=x, y=y, tooltip=["date:T", alt.Tooltip(f"{col}:Q", format=".1f", title=label)]
+def load_ventilation() -> pd.DataFrame:
+    # The (small) results monitor.py keeps up to date once an hour.
+    return read_sql(
+        f"SELECT start AS date, ach, co2_start, co2_end FROM {ventilation.TABLE} ORDER BY start"
     )
-    chart = bands + raw_line + hourly_line
-
-    out_col = OUTDOOR_COLUMNS.get(col)
-    if out_col and out_col in df.columns and df[out_col].notna().any():
-        out_hourly = (
-            df.set_index("date")[out_col].resample("1h").mean().dropna().reset_index()
-        )
-        chart += alt.Chart(out_hourly).mark_line(
-            strokeWidth=1.5, color=OUTDOOR_COLOR, strokeDash=[5, 3]
-        ).encode(
-            x=x,
-            y=alt.Y(f"{out_col}:Q", title=label, scale=alt.Scale(zero=False)),
-            tooltip=["date:T", alt.Tooltip(f"{out_col}:Q", format=".1f", title="Outdoor")],
-        )
-
-    if col == "temp":
-        minima = [
-            {"date": chunk.idxmin(), "y": chunk.min(), "label": f"{chunk.min():.1f}°C"}
-            for n0, n1 in night_spans(start, end)
-            if not (chunk := indexed[n0:n1]).empty
-        ]
-        min_df = pd.DataFrame(minima)
-        chart += alt.Chart(min_df).mark_point(filled=True, size=90, color="#2077b4").encode(
-            x="date:T", y="y:Q", tooltip=[alt.Tooltip("y:Q", format=".1f", title="Night min")]
-        )
-        chart += alt.Chart(min_df).mark_text(dy=14, color="#2077b4").encode(
-            x="date:T", y="y:Q", text="label:N"
-        )
-
-    return chart.properties(height=350)
 
 
-latest_df = load_records(limit=1)
+current = load_current()
 
-if latest_df.empty:
+if current is None:
     st.warning("No measurements have been recorded yet.")
     st.stop()
 
-last_record = latest_df.iloc[-1]
-
-
-def time_axis_format(df) -> str:
-    # A window crossing midnight repeats every clock label, so name the day too.
-    return "%H %M" if df["date"].dt.normalize().nunique() <= 1 else "%a %H %M"
-
-
-def plot_metric_over_time(df, col, baseline=None):
-    chart = (
-        alt.Chart(df)
-        .mark_line()
-        .encode(
-            x=alt.X("date:T", axis=alt.Axis(title="time", format=time_axis_format(df))),
-            y=col,
-        )
-    )
-    if baseline is not None:
-        # For a self-baselining sensor the line height means little on its own;
-        # what it does either side of this reference is the whole reading.
-        chart += (
-            alt.Chart(pd.DataFrame({"baseline": [baseline]}))
-            .mark_rule(color=OUTDOOR_COLOR, strokeDash=[4, 4])
-            .encode(y=alt.Y("baseline:Q", title=col))
-        )
-        chart = chart.properties(
-            title=alt.TitleParams(
-                "dashed gray = normal for this window", fontSize=11, anchor="end"
-            )
-        )
-    out_col = OUTDOOR_COLUMNS.get(col)
-    if out_col and out_col in df.columns and df[out_col].notna().any():
-        outdoor = (
-            alt.Chart(df.dropna(subset=[out_col]))
-            .mark_line(color=OUTDOOR_COLOR, strokeDash=[5, 3])
-            .encode(
-                x="date:T",
-                y=alt.Y(f"{out_col}:Q", title=col),
-                tooltip=[
-                    "date:T",
-                    alt.Tooltip(f"{out_col}:Q", format=".1f", title=f"outdoor {col}"),
-                ],
-            )
-        )
-        chart = (chart + outdoor).properties(
-            title=alt.TitleParams("solid = indoor, dashed gray = outdoor", fontSize=11, anchor="end")
-        )
-    return chart
-
-
-def plot_pm_over_time(df, domain=None):
-    # Check which PM columns are available in the dataframe.
-    available_columns = [col for col in PM_COLUMNS if col in df.columns]
-    if not available_columns:
-        return None
-
-    # Prepare the data by removing the first valid measurement for each PM size.
-    pm_df = df[["date"] + available_columns].copy()
-    pm_df = pm_df.dropna(subset=available_columns, how="all")
-    if pm_df.empty:
-        return None
-
-    # Remove first valid measurement for each column to avoid initialization spikes.
-    for column in available_columns:
-        first_idx = pm_df[column].first_valid_index()
-        if first_idx is not None:
-            pm_df.loc[first_idx, column] = np.nan
-    pm_df = pm_df.dropna(subset=available_columns, how="all")
-    if pm_df.empty:
-        return None
-
-    # Prepare long-form data for Altair.
-    label_map = {col: PM_LABELS[col] for col in available_columns}
-    ordered_labels = [label_map[col] for col in available_columns]
-
-    # Raw data.
-    raw_long = (
-        pm_df.rename(columns=label_map)
-        .melt("date", var_name="particulate", value_name="μg/m³")
-        .dropna(subset=["μg/m³"])
-    )
-    if raw_long.empty:
-        return None
-
-    # Smoothed data (5-point rolling mean).
-    smoothed_wide = pm_df[["date"]].copy()
-    for col in available_columns:
-        smoothed_wide[col] = pm_df[col].rolling(window=5, min_periods=1).mean()
-
-    # Long-form smoothed data.
-    smoothed_long = (
-        smoothed_wide.rename(columns=label_map)
-        .melt("date", var_name="particulate", value_name="μg/m³")
-        .dropna(subset=["μg/m³"])
-    )
-    smoothed_long = smoothed_long[smoothed_long["particulate"].isin(ordered_labels)]
-
-    # Create the Altair chart.
-    x_encoding = alt.X(
-        "date:T",
-        axis=alt.Axis(title="time", format=time_axis_format(pm_df)),
-        scale=alt.Scale(domain=domain) if domain else alt.Undefined,
-    )
-    y_encoding = alt.Y("μg/m³:Q", axis=alt.Axis(title="mass concentration (μg/m³)"))
-    color_encoding = alt.Color("particulate:N", sort=ordered_labels, title="PM size")
-
-    # Base chart with raw data.
-    base_chart = (
-        alt.Chart(raw_long)
-        .mark_line(strokeWidth=0.5)
-        .encode(x=x_encoding, y=y_encoding, color=color_encoding)
-    )
-
-    # Add smoothed data on top, if available.
-    if smoothed_long.empty:
-        return base_chart
-    smooth_chart = (
-        alt.Chart(smoothed_long)
-        .mark_line(strokeWidth=2)
-        .encode(x=x_encoding, y=y_encoding, color=color_encoding)
-    )
-    return base_chart + smooth_chart
-
-
-# def set_room():
-#     print(room)
+last_record = latest_reading(current)
 
 #### DEFINE THE STREAMLIT APP ####
 
@@ -383,39 +206,14 @@ st.markdown(
     #MainMenu {visibility: hidden;}
     footer {visibility: hidden;}
     .reportview-container .main .block-container {padding-top: 0; padding-bottom: 0}
-    /* Streamlit 0.62 predates st.columns, so the metrics are laid out with a CSS
-       grid instead. auto-fit fits as many 12rem tracks as the window allows, so
-       the cards reflow down to one column on a phone. Grid rather than flexbox
-       because a leftover card on the last row keeps its column width here,
-       where a flex item would grow to span the whole row on its own. Colours
-       are inherited so the grid follows whichever Streamlit theme is active. */
-    .metrics {
-        display: grid;
-        grid-template-columns: repeat(auto-fit, minmax(12rem, 1fr));
-        gap: 0.75rem;
-        margin-bottom: 1rem;
-    }
-    .metric {
-        padding: 0.6rem 0.9rem;
-        border: 1px solid rgba(128, 128, 128, 0.35);
-        border-radius: 0.5rem;
-    }
-    .metric-value {font-size: 1.6rem; font-weight: 600; line-height: 1.3;}
-    .metric-label {font-size: 0.9rem; opacity: 0.75;}
-    .metric-sub {font-size: 0.8rem; opacity: 0.6;}
+    """
+    + CARD_CSS
+    + """
     </style>
     """,
     unsafe_allow_html=True,
 )
 
-
-def metric_card(value: str, label: str, *extras: str) -> str:
-    subs = "".join(f"<div class='metric-sub'>{extra}</div>" for extra in extras)
-    return (
-        f"<div class='metric'><div class='metric-value'>{value}</div>"
-        f"<div class='metric-label'>{label}</div>{subs}</div>"
-    )
-
 # The current metrics.
 st.markdown("# Current air quality")
 st.text(f"🗓 {last_record['date'].strftime('%d-%m-%Y %H:%M')}")
@@ -425,53 +223,15 @@ if age > pd.Timedelta(minutes=10):
         f"⚠️ Last measurement is {int(age.total_seconds() // 60)} minutes old "
         "— the monitor may be down."
     )
-# room = st.text_input("Room", on_change=set_room)
-co2_alert = "🚨" if last_record["co2"] > 900 else ""
-cards = [metric_card(f"{last_record['co2']:.0f} ppm {co2_alert}", "😶‍🌫️ CO2 level")]
-
-temp_extras = []
-if "out_temp" in last_record and pd.notna(last_record["out_temp"]):
-    temp_extras.append(f"🌳 Outdoor: {last_record['out_temp']:.1f} °C")
-last_24h = load_last_days(1)
-day_temps = last_24h.dropna(subset=["temp"])
-if not day_temps.empty:
-    tmin = day_temps.loc[day_temps["temp"].idxmin()]
-    tmax = day_temps.loc[day_temps["temp"].idxmax()]
-    temp_extras.append(f"↓ {tmin['temp']:.1f} °C at {tmin['date'].strftime('%H:%M')} (last 24h)")
-    temp_extras.append(f"↑ {tmax['temp']:.1f} °C at {tmax['date'].strftime('%H:%M')} (last 24h)")
-cards.append(metric_card(f"{last_record['temp']:.1f} °C", "🌡 Temperature", *temp_extras))
-
-hum_extras = []
-if "out_hum" in last_record and pd.notna(last_record["out_hum"]):
-    hum_extras.append(f"🌳 Outdoor: {last_record['out_hum']:.0f} %")
-cards.append(metric_card(f"{last_record['hum']:.0f} %", "💧 Humidity", *hum_extras))
-
-if "pm25" in last_record and pd.notna(last_record["pm25"]):
-    pm_alert = "🚨" if last_record["pm25"] > 15 else ""
-    cards.append(metric_card(f"{last_record['pm25']:.1f} µg/m³ {pm_alert}", "🌫 PM2.5"))
-if "voc" in last_record and pd.notna(last_record["voc"]):
-    # The ppb figure is not comparable to any guideline or to another device, so
-    # it is judged against this room's own recent history instead. See
-    # baseline_deviation() for why.
-    voc = last_record["voc"]
-    voc_alert, voc_extras = "", []
-    deviation = baseline_deviation(last_24h["voc"].tolist(), voc)
-    if deviation is not None:
-        voc_baseline, voc_z = deviation
-        voc_extras.append(f"📉 24h normal: {voc_baseline:.0f} ppb")
-        if voc_z >= VOC_SPIKE_DEVIATION:
-            voc_alert = "🚨"
-            # A zero baseline is what a still-conditioning sensor looks like,
-            # and there is no meaningful multiple of zero to quote.
-            voc_extras.append(
-                f"↑ {voc / voc_baseline:.1f}× the 24h normal"
-                if voc_baseline > 0
-                else "↑ well above the 24h normal"
-            )
-    else:
-        voc_extras.append("📉 building up 24h baseline")
-    cards.append(metric_card(f"{voc:.0f} ppb {voc_alert}", "🧪 TVOC", *voc_extras))
-
+# Which room the monitor is in now; saved with the session (see rooms.py). A restart
+# keeps the room, so this only needs touching after moving the monitor.
+with sqlite3.connect(DB_PATH) as con:
+    session = rooms.current(con)
+    if session is not None:
+        room = st.text_input("Room", session[1])
+        if room.strip() != session[1]:
+            rooms.assign(con, room, session[0])
+cards = current_cards(current)
 st.markdown(f"<div class='metrics'>{''.join(cards)}</div>", unsafe_allow_html=True)
 
 # Evolution over time.
@@ -479,57 +239,144 @@ st.markdown("# Air quality evolution")
 date = st.date_input("Day of interest", datetime.datetime.now())
 # Today is a rolling 24h window instead of a stub of a day; past days stay whole.
 is_today = date == datetime.date.today()
-filtered_df = last_24h if is_today else load_day(date)
 if is_today:
     st.text("Showing the last 24 hours.")
 
-if filtered_df.empty:
-    st.info("No measurements recorded for the selected day yet.")
+
+def build_day_charts() -> list:
+    if is_today:
+        df = load_live(columns=DAY_COLUMNS)
+        if df is None:
+            df = load_last_days(1, columns=DAY_COLUMNS)
+    else:
+        df = load_day(date, columns=DAY_COLUMNS)
+    return [] if df.empty else [chart.to_dict() for _, chart in day_charts(df)]
+
+
+# The last 24h change with every sample and only then; a past day is read for its
+# version, and its charts are built once and kept on disk.
+if is_today:
+    day_version = current["reading"]["date"]
 else:
-    st.altair_chart(plot_metric_over_time(filtered_df, "co2"), use_container_width=True)
-    st.altair_chart(
-        plot_metric_over_time(filtered_df, "temp"), use_container_width=True
-    )
-    st.altair_chart(plot_metric_over_time(filtered_df, "hum"), use_container_width=True)
-    st.altair_chart(
-        plot_metric_over_time(filtered_df, "pressure"), use_container_width=True
-    )
-    # Only charted once the CCS811 has logged something; older days have no TVOC.
-    if "voc" in filtered_df.columns and filtered_df["voc"].notna().any():
-        # Baselined over the window on screen, not the rolling 24h the card uses,
-        # so the line still means "normal here" when looking back at a past day.
-        st.altair_chart(
-            plot_metric_over_time(
-                filtered_df, "voc", baseline=filtered_df["voc"].median()
-            ),
-            use_container_width=True,
-        )
-    domain = None
-    if not filtered_df.empty:
-        domain = (filtered_df["date"].min(), filtered_df["date"].max())
-    pm_chart = plot_pm_over_time(filtered_df, domain=domain)
-    if pm_chart is not None:
-        st.altair_chart(pm_chart, use_container_width=True)
+    day_start = datetime.datetime.combine(date, datetime.time())
+    day_version = window_version(day_start, day_start + datetime.timedelta(days=1), DAY_COLUMNS)
+day_specs = chartcache.cached(
+    "day",
+    ("last 24h" if is_today else date.isoformat(),),
+    day_version,
+    build_day_charts,
+    persist=date < datetime.date.today(),
+)
+if not day_specs:
+    st.info("No measurements recorded for the selected day yet.")
+for spec in day_specs:
+    # A copy: Streamlit takes the datasets out of the spec it's given.
+    st.vega_lite_chart(spec=dict(spec), use_container_width=True)
 
 # Last 7 days overview.
 st.markdown("# Last 7 days")
-week_df = load_last_days(7)
-if week_df.empty:
-    st.info("No measurements recorded in the last 7 days.")
+available = [c for c in WEEK_FEATURES if c in available_columns()]
+feature = st.selectbox(
+    "Feature", available, index=available.index("temp"), format_func=WEEK_FEATURES.get
+)
+
+
+def build_week_chart() -> dict | None:
+    week_df = load_last_days(7, columns=metric_columns(feature))
+    if week_df.empty:
+        return None
+    week_chart = plot_week_overview(week_df, feature, WEEK_FEATURES[feature])
+    return None if week_chart is None else week_chart.to_dict()
+
+
+week_spec = chartcache.cached(
+    "week", (feature,), current["reading"]["date"], build_week_chart
+)
+if week_spec is None:
+    st.info("No measurements for this feature in the last 7 days.")
+else:
+    st.text(week_caption(feature))
+    st.vega_lite_chart(spec=dict(week_spec), use_container_width=True)
+
+# Any range, weeks to years.
+st.markdown("# Explore a range")
+range_start = st.date_input("From", datetime.date.today() - datetime.timedelta(days=90))
+range_end = st.date_input("To", datetime.date.today())
+range_feature = st.selectbox(
+    "Range feature", available, index=available.index("co2"), format_func=WEEK_FEATURES.get
+)
+# The planner's read is cheaper than a version query over a long range, so the
+# points themselves are the version; the cache saves the chart build.
+resolution, range_df = load_range(range_start, range_end, [range_feature])
+
+
+def build_range_chart() -> dict | None:
+    range_chart = plot_range(range_df, range_feature, WEEK_FEATURES[range_feature])
+    return None if range_chart is None else range_chart.to_dict()
+
+
+range_spec = chartcache.cached(
+    "range",
+    (range_start.isoformat(), range_end.isoformat(), range_feature, resolution),
+    int(pd.util.hash_pandas_object(range_df, index=False).sum()),
+    build_range_chart,
+    persist=range_end < datetime.date.today(),
+)
+if range_spec is None:
+    st.info("No measurements for this feature in the selected range.")
+else:
+    if resolution != "raw":
+        st.text(f"{resolution} points; the band spans each one's min to max")
+    st.vega_lite_chart(spec=dict(range_spec), use_container_width=True)
+
+# A year at a glance.
+st.markdown("# Daily calendar")
+calendar_feature = st.selectbox(
+    "Calendar feature", available, index=available.index("co2"), format_func=WEEK_FEATURES.get
+)
+grid = calendar_grid(current["reading"]["date"], tuple(available))
+calendar_chart = plot_calendar(grid, calendar_feature, WEEK_FEATURES[calendar_feature])
+if calendar_chart is None:
+    st.info("No measurements for this feature in the last year.")
+else:
+    st.text("One cell per day, coloured by the daily mean")
+    st.altair_chart(calendar_chart, use_container_width=True)
+
+# The same measurements per room, from the sessions the room was named for.
+st.markdown("# Rooms")
+with sqlite3.connect(DB_PATH) as con:
+    room_sessions = rooms.sessions_by_room(con)
+if not room_sessions:
+    st.info("No rooms named yet; name the monitor's room at the top of the page.")
 else:
-    available = [c for c in WEEK_FEATURES if c in week_df.columns]
-    feature = st.selectbox(
-        "Feature", available, index=available.index("temp"), format_func=WEEK_FEATURES.get
+    st.table(room_table(current["reading"]["date"], tuple(room_sessions.items())))
+    room_choice = st.selectbox("Show room", list(room_sessions))
+    room_feature = st.selectbox(
+        "Room feature", available, index=available.index("co2"), format_func=WEEK_FEATURES.get
     )
-    week_chart = plot_week_overview(week_df, feature, WEEK_FEATURES[feature])
-    if week_chart is None:
-        st.info("No measurements for this feature in the last 7 days.")
+    room_chart = plot_range(
+        load_room_days(room_sessions[room_choice], room_feature),
+        room_feature,
+        WEEK_FEATURES[room_feature],
+    )
+    if room_chart is None:
+        st.info("No measurements for this feature in this room.")
     else:
-        caption = f"Shaded bands are nights, {NIGHT_START}:00-0{NIGHT_END}:00"
-        if feature in OUTDOOR_COLUMNS:
-            caption += " — dashed gray line is outdoor"
-        st.text(caption)
-        st.altair_chart(week_chart, use_container_width=True)
+        st.text("Daily means; the band spans each day's min to max")
+        st.altair_chart(room_chart, use_container_width=True)
+
+# How well airing out works, from the CO2 decay after each time.
+st.markdown("# Ventilation")
+events = load_ventilation()
+if events.empty:
+    st.info("No CO2 decays found yet; they show up after airing out a stuffy room.")
+else:
+    recent = events[events["date"] >= events["date"].max() - pd.Timedelta(days=30)]
+    st.text(
+        f"{len(events)} times aired out; median {recent['ach'].median():.1f} air changes "
+        "per hour over the last 30 days"
+    )
+    st.altair_chart(plot_ventilation(events), use_container_width=True)
 
 # Data export.
 st.markdown("### Export measurements")
@@ -542,6 +389,47 @@ if st.button("⬇️ Prepare complete CSV download"):
 else:
     st.write("Press the button to prepare the download link.")
 
+# How the database is coping: WAL growth, checkpoints and lock waits (see checkpoints.py).
+st.markdown("### Database health")
+health = checkpoints.read_health()
+wal_card = (f"{checkpoints.wal_bytes() / 2**20:.1f} MB", "📝 WAL file")
+if health is None:
+    st.text("No checkpoint counters yet; monitor.py writes them every minute.")
+    cards = [metric_card(*wal_card)]
+else:
+    stale = datetime.datetime.now().timestamp() - health["updated_at"]
+    if stale > 5 * checkpoints.CHECKPOINT_SECONDS:
+        st.warning(f"⚠️ Counters are {stale / 60:.0f} minutes old — the monitor may be down.")
+    cards = [
+        metric_card(
+            *wal_card, f"↑ {health['max_wal_bytes'] / 2**20:.1f} MB since the monitor started"
+        )
+    ]
+    last = health["last_checkpoint"]
+    if last:
+        at = datetime.datetime.fromtimestamp(last["at"]).strftime("%H:%M")
+        cards.append(
+            metric_card(
+                f"{1000 * last['seconds']:.0f} ms",
+                "🔄 Last checkpoint",
+                f"{last['mode'].lower()} at {at}{', busy' if last['busy'] else ''}",
+                f"{health['checkpoints']} run, {health['checkpoints_busy']} busy, "
+                f"slowest {1000 * health['max_checkpoint_seconds']:.0f} ms",
+            )
+        )
+    cards.append(
+        metric_card(
+            f"{health['lock_waits']}",
+            "⏳ Lock waits",
+            f"of {health['writes']} inserts since the monitor started",
+            f"longest {1000 * health['max_lock_wait_seconds']:.0f} ms",
+        )
+    )
+st.markdown(f"<div class='metrics'>{''.join(cards)}</div>", unsafe_allow_html=True)
+
+if LOW_MEMORY:
+    st.text(f"Low-memory mode, peak memory {peak_memory_mb():.0f} MB")
+
 # Raspberry Pi shutdown button.
 st.markdown("### Shutdown Raspberry Pi")
 if st.checkbox("I really want to shut down the Pi"):
@@ -0,0 +1,195 @@
+"""The dashboard's data, read into DataFrames: from SQLite, or the live buffer.
+
+Shared by dashboard.py and static.py. Dates come back localised to Europe/Brussels,
+metrics as numbers; LOW_MEMORY narrows both (see config.py).
+"""
+
+import datetime
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+import archive
+import live
+import planner
+import rooms
+import snapshot
+from compact import HISTORY_VIEW
+from config import DB_PATH, LOW_MEMORY
+
+# Low-memory mode: columns kept as 16-bit integers (whole ppm is the MH-Z19's
+# resolution; hourly means are rounded to it), and rows read per chunk. The chunk
+# is what sets the peak: sqlite hands every value over as a Python object first.
+INT16_COLUMNS = ("co2",)
+LOW_MEMORY_CHUNK_ROWS = 500
+
+
+def _normalize_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+    if df.empty:
+        return df
+
+    # Low-memory reads hand dates over as epoch seconds of the naive local time.
+    unit = "s" if pd.api.types.is_integer_dtype(df["date"]) else None
+    df["date"] = pd.to_datetime(df["date"], unit=unit)
+    if df["date"].dt.tz is None:
+        df["date"] = df["date"].dt.tz_localize("Europe/Brussels")
+    else:
+        df["date"] = df["date"].dt.tz_convert("Europe/Brussels")
+
+    numeric_columns = [c for c in df.columns if c != "date"]
+    if not LOW_MEMORY:
+        df[numeric_columns] = df[numeric_columns].apply(pd.to_numeric, errors="coerce")
+        return df
+    # Column by column, so there is never a second full-width copy of the frame.
+    for column in numeric_columns:
+        values = pd.to_numeric(df[column], errors="coerce", downcast="float")
+        if column in INT16_COLUMNS:
+            values = values.round().astype("Int16")
+        df[column] = values
+    return df
+
+
+def read_sql(query: str, params: tuple = ()) -> pd.DataFrame:
+    with sqlite3.connect(DB_PATH) as con:
+        if not LOW_MEMORY:
+            return _normalize_dataframe(pd.read_sql_query(query, con, params=params))
+        chunks = [
+            _normalize_dataframe(chunk)
+            for chunk in pd.read_sql_query(
+                query, con, params=params, chunksize=LOW_MEMORY_CHUNK_ROWS
+            )
+        ]
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+
+
+def _projection(columns: list[str] | None) -> str:
+    # Only what the charts on screen read: the week view needs 3 of ~20 columns, and
+    # every one skipped is one less to fetch, parse and hold. Names come from the
+    # chart declarations in charts.py, never from user input.
+    if not LOW_MEMORY:
+        return "*" if columns is None else ", ".join(dict.fromkeys(columns))
+    # An int64 from sqlite rather than an object-dtype string per row to parse.
+    return ", ".join(
+        "CAST(strftime('%s', date) AS INTEGER) AS date" if c == "date" else c
+        for c in dict.fromkeys(columns or available_columns())
+    )
+
+
+def available_columns() -> list[str]:
+    with sqlite3.connect(DB_PATH) as con:
+        return [d[1] for d in con.execute(f"PRAGMA table_info({HISTORY_VIEW})")]
+
+
+def _read_history(
+    start: datetime.datetime, end: datetime.datetime, columns: list[str] | None
+) -> pd.DataFrame:
+    # Archived months from their files, a column at a time and with their 5-minute
+    # rows; the rest from the history view (see archive.py).
+    parts = []
+    for part_start, part_end, source in archive.segments(start, end):
+        if source is None:
+            parts.append(
+                read_sql(
+                    f"SELECT {_projection(columns)} FROM {HISTORY_VIEW} "
+                    "WHERE date >= ? AND date < ? ORDER BY date",
+                    (f"{part_start:%Y-%m-%d %H:%M:%S}", f"{part_end:%Y-%m-%d %H:%M:%S}"),
+                )
+            )
+        else:
+            names = columns or available_columns()
+            parts.append(_normalize_dataframe(archive.read(source, names, part_start, part_end)))
+    filled = [part for part in parts if not part.empty]
+    if len(filled) > 1:
+        return pd.concat(filled, ignore_index=True)
+    return filled[0] if filled else parts[0]
+
+
+def load_day(day: datetime.date, columns: list[str] | None = None) -> pd.DataFrame:
+    start = datetime.datetime.combine(day, datetime.time())
+    return _read_history(start, start + datetime.timedelta(days=1), columns)
+
+
+def load_last_days(days: int = 7, columns: list[str] | None = None) -> pd.DataFrame:
+    # Stored dates are local ISO strings, so lexicographic >= works.
+    cutoff = (datetime.datetime.now() - datetime.timedelta(days=days)).strftime(
+        "%Y-%m-%d %H:%M:%S"
+    )
+    return read_sql(
+        f"SELECT {_projection(columns)} FROM {HISTORY_VIEW} WHERE date >= ? ORDER BY date",
+        (cutoff,),
+    )
+
+
+def window_version(start: datetime.datetime, end: datetime.datetime, columns: list[str]) -> tuple:
+    """Cheap stand-in for "has anything charted in [start, end) changed", for chartcache.
+
+    Row count, newest date and each column's sum, as report.fingerprint, so a value
+    rewritten in place (a backfill) shows too. One pass over the window's rows in the
+    date index, without a Python object per value.
+    """
+    totals = "".join(f", TOTAL({c})" for c in dict.fromkeys(columns) if c != "date")
+    with sqlite3.connect(DB_PATH) as con:
+        return con.execute(
+            f"SELECT COUNT(*), MAX(date){totals} FROM {HISTORY_VIEW} WHERE date >= ? AND date < ?",
+            (start.strftime("%Y-%m-%d %H:%M:%S"), end.strftime("%Y-%m-%d %H:%M:%S")),
+        ).fetchone()
+
+
+def load_range(
+    start: datetime.date,
+    end: datetime.date,
+    columns: list[str],
+    resolution: str | None = None,
+) -> tuple[str, pd.DataFrame]:
+    # Both days inclusive. The planner decides between raw rows and hourly or daily
+    # rollups, so a year costs about as many points as a day.
+    begin = datetime.datetime.combine(start, datetime.time())
+    stop = datetime.datetime.combine(end, datetime.time()) + datetime.timedelta(days=1)
+    with sqlite3.connect(DB_PATH) as con:
+        resolution, sql, params = planner.query(
+            con, begin, stop, columns, resolution=resolution
+        )
+    if resolution == "raw":
+        return resolution, _read_history(begin, stop, ["date", *columns])
+    return resolution, read_sql(sql, params)
+
+
+def load_room_days(sessions: list[int], column: str) -> pd.DataFrame:
+    # Daily mean and range of one metric over a room's sessions (rooms.py), through
+    # the session_id indexes rather than the whole history. Compacted hours count as
+    # their means, so the range narrows past the raw retention.
+    where, params = rooms.in_sessions(sessions)
+    return read_sql(
+        f"SELECT substr(date, 1, 10) || ' 00:00:00' AS date, AVG({column}) AS {column}, "
+        f"MIN({column}) AS {column}_min, MAX({column}) AS {column}_max "
+        f"FROM {HISTORY_VIEW} WHERE {where} GROUP BY 1 ORDER BY 1",
+        params,
+    )
+
+
+def load_live(days: int = 1, columns: list[str] | None = None) -> pd.DataFrame | None:
+    # The monitor's memory-mapped copy of its latest readings: no SQL, nothing to
+    # parse. None when there is no buffer to read, so the caller falls back to SQLite;
+    # raises live.Stalled when the monitor died or stopped writing. Only the rows and
+    # columns asked for are copied out of the map.
+    cutoff = np.datetime64(datetime.datetime.now() - datetime.timedelta(days=days), "s")
+    if columns is not None:
+        columns = [c for c in dict.fromkeys(["date", *columns]) if c in live.RECORD.names]
+    result = live.read_live(since=cutoff, columns=columns)
+    if result is None:
+        return None
+    rows, _ = result
+    df = pd.DataFrame({c: rows[c] for c in rows.dtype.names})
+    df["date"] = df["date"].dt.tz_localize("Europe/Brussels")
+    return df
+
+
+def load_current() -> dict | None:
+    # One row kept up to date by monitor.py; rebuilt from the last 24h if the monitor
+    # hasn't written one yet.
+    with sqlite3.connect(DB_PATH) as con:
+        state = snapshot.read(con)
+        if state is None:
+            state = snapshot.rebuild(con).state()
+    return state
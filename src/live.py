@@ -0,0 +1,173 @@
+"""Memory-mapped ring buffer of the latest readings, shared by monitor.py and the dashboard.
+
+The dashboard's "last 24 hours" view used to re-read SQLite on every rerun for values
+the monitor had only just written. monitor.py now also appends every sample to a
+fixed-layout file under /dev/shm, and the dashboard maps that file read-only and views
+it as a structured NumPy array: no SQL, no string parsing, no per-row Python.
+
+Layout: a 64-byte header followed by `capacity` RECORD slots. `count` is the number of
+samples ever appended, so the newest one sits at slot (count - 1) % capacity.
+
+Consistency is a seqlock: the writer makes `seq` odd, changes the slots, then makes it
+even again. A reader notes `seq`, copies what it needs and checks `seq` is unchanged;
+if not, or if it was odd, it retries. There is one writer and it writes every 5
+minutes, so a retry is rare. A `seq` that stays odd means the monitor died mid-write;
+a `written_at` more than STALE_INTERVALS polls old means it stopped between writes.
+"""
+
+import time
+
+import numpy as np
+
+from compact import CLEAN_VIEW
+from config import LIVE_BUFFER_HOURS, LIVE_BUFFER_PATH
+
+COLUMNS = (
+    "co2", "voc", "eco2", "temp", "hum", "pressure", "pm1", "pm25", "pm4", "pm10",
+    "out_temp", "out_hum", "out_pressure", "out_pm25", "out_pm10",
+    "out_wind_speed", "out_wind_dir",
+)
+MAGIC = 0x41514C56  # "AQLV"
+# Bump whenever HEADER or RECORD change, so a reader never misreads an old file.
+LAYOUT = 2
+HEADER = np.dtype(
+    [
+        ("magic", "<u4"),
+        ("layout", "<u4"),
+        ("capacity", "<u4"),
+        ("interval", "<u4"),  # the writer's poll_seconds
+        ("seq", "<u8"),
+        ("count", "<u8"),
+        ("written_at", "<f8"),  # time.time() of the last completed write
+    ]
+)
+HEADER_SIZE = 64
+# Polls without a write before a reader calls the buffer stale.
+STALE_INTERVALS = 3
+# Dates are the naive local time stored in `records`; metrics are NaN when unread.
+RECORD = np.dtype([("date", "<M8[s]")] + [(c, "<f4") for c in COLUMNS])
+
+
+def _capacity(poll_seconds, hours=LIVE_BUFFER_HOURS):
+    return int(hours * 3600 // poll_seconds) + 1
+
+
+class LiveWriter:
+    """The monitor's end: owns the file and is its only writer."""
+
+    def __init__(self, poll_seconds, path=LIVE_BUFFER_PATH):
+        capacity = _capacity(poll_seconds)
+        size = HEADER_SIZE + capacity * RECORD.itemsize
+        with open(path, "a+b") as f:
+            f.truncate(size)
+        self._map = np.memmap(path, dtype=np.uint8, mode="r+", shape=(size,))
+        self._header = self._map[: HEADER.itemsize].view(HEADER)
+        self._ring = self._map[HEADER_SIZE:].view(RECORD)
+        self._begin()
+        self._header["count"] = 0
+        self._header["magic"] = MAGIC
+        self._header["layout"] = LAYOUT
+        self._header["capacity"] = capacity
+        self._header["interval"] = poll_seconds
+        self._end()
+
+    # Plain stores, no memory barriers: the reader's seq re-check is what catches a
+    # torn read, and there is an ~5 minute gap between writes.
+    def _begin(self):
+        if not self._header["seq"][0] % 2:
+            self._header["seq"] += 1
+
+    def _end(self):
+        self._header["written_at"] = time.time()
+        self._header["seq"] += 1
+
+    def _put(self, reading):
+        count = int(self._header["count"][0])
+        slot = self._ring[count % len(self._ring)]
+        slot["date"] = np.datetime64(reading["date"], "s")
+        for column in COLUMNS:
+            value = reading.get(column)
+            slot[column] = np.nan if value is None else value
+        self._header["count"] = count + 1
+
+    def append(self, reading):
+        """Add one `records` row (as a dict)."""
+        self._begin()
+        self._put(reading)
+        self._end()
+
+    def seed(self, con):
+        """Fill the buffer from `records`, so a restart doesn't empty the live view."""
+        cur = con.execute(
+            f"SELECT date, {', '.join(COLUMNS)} FROM {CLEAN_VIEW} "
+            "ORDER BY date DESC LIMIT ?",
+            (len(self._ring),),
+        )
+        columns = [d[0] for d in cur.description]
+        rows = [dict(zip(columns, row)) for row in cur.fetchall()]
+        self._begin()
+        for reading in reversed(rows):
+            self._put(reading)
+        self._end()
+
+
+class Stalled(Exception):
+    """The writer stopped: halfway through an update (seq stayed odd), or between two."""
+
+
+def _copy(halves, since, columns):
+    # Straight from the mapped slots into a packed array holding only the rows and
+    # columns asked for.
+    if since is None:
+        keep = [np.ones(len(half), bool) for half in halves]
+    else:
+        keep = [half["date"] >= since for half in halves]
+    out = np.empty(sum(map(np.count_nonzero, keep)), np.dtype([(c, RECORD[c]) for c in columns]))
+    for column in columns:
+        np.concatenate([half[column][k] for half, k in zip(halves, keep)], out=out[column])
+    return out
+
+
+def read_live(
+    path=LIVE_BUFFER_PATH, since=None, columns=None, attempts=5, retry_delay_seconds=0.01
+):
+    """Return the buffered readings from `since` on, oldest first, and the last write time.
+
+    The slots are mapped read-only and the two halves of the ring are views into the
+    map; the rows from `since` (a datetime64) and the `columns` asked for are the only
+    copy made, and are returned once `seq` shows no write overlapped it. Returns None
+    when there is no usable buffer (the monitor isn't running, or wrote an older
+    layout). Raises Stalled when the writer never finished its last update, or hasn't
+    written for STALE_INTERVALS polls.
+    """
+    try:
+        mapped = np.memmap(path, dtype=np.uint8, mode="r")
+    except (FileNotFoundError, ValueError):  # ValueError: an empty file
+        return None
+    if len(mapped) < HEADER_SIZE:
+        return None
+    header = mapped[: HEADER.itemsize].view(HEADER)
+    if header["magic"][0] != MAGIC or header["layout"][0] != LAYOUT:
+        return None
+    capacity = int(header["capacity"][0])
+    if len(mapped) < HEADER_SIZE + capacity * RECORD.itemsize:
+        return None
+    ring = mapped[HEADER_SIZE : HEADER_SIZE + capacity * RECORD.itemsize].view(RECORD)
+    columns = RECORD.names if columns is None else columns
+
+    for _ in range(attempts):
+        seq = int(header["seq"][0])
+        if not seq % 2:
+            count = int(header["count"][0])
+            start = count % capacity if count > capacity else 0
+            rows = _copy((ring[start : min(count, capacity)], ring[:start]), since, columns)
+            written_at = float(header["written_at"][0])
+            if int(header["seq"][0]) == seq:
+                break
+        time.sleep(retry_delay_seconds)
+    else:
+        raise Stalled(f"live buffer seq stuck at {int(header['seq'][0])}")
+    age = time.time() - written_at
+    if age > STALE_INTERVALS * int(header["interval"][0]):
+        raise Stalled(f"live buffer last written {age:.0f} s ago")
+    return rows, written_at
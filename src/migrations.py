@@ -0,0 +1,259 @@
+"""Versioned schema changes, applied by monitor.py when it starts.
+
+A migration is (version, name, schema step, backfill or None), and `schema_version`
+has a row for every version applied. The schema step -- new tables, columns, indexes --
+is quick, and runs in one transaction with its `schema_version` row, so a version is
+either applied or not. Rewriting existing rows is not quick on a long history, and in
+one transaction it would hold the write lock for minutes while the monitor and the
+dashboard wait. So a backfill works through `records` a batch of rows at a time: a
+generator that does one batch's writes per step and yields (last rowid, rows changed).
+Each batch commits together with that rowid in `schema_version.backfill_rowid`, and a
+pending backfill resumes from there after a crash or restart. monitor.py runs pending
+backfills on a background thread while it keeps sampling; until one is done the new
+column is NULL on old rows, which readers have to allow for anyway.
+
+A database from before this file gets every migration on its first start. The schema
+steps skip what is already there, so that only fills in what's missing.
+
+Add a migration by appending to MIGRATIONS; never change or renumber one that shipped.
+
+Show the state, or (--run) finish pending backfills in the foreground:
+    python3 src/migrations.py [--run]
+"""
+
+import argparse
+import datetime
+import sqlite3
+import threading
+import time
+
+import quality
+from compact import ensure_change_counter, ensure_tiers
+from config import DB_PATH
+
+# Rows per backfill transaction, and the pause after each so other writers get a turn.
+BATCH_ROWS = 2000
+BATCH_PAUSE_SECONDS = 0.05
+
+
+def _columns(con, table):
+    return [info[1] for info in con.execute(f"PRAGMA table_info({table})")]
+
+
+def add_columns(table, columns, column_type):
+    """A schema step adding whichever of `columns` `table` doesn't have yet."""
+
+    def step(con):
+        existing = _columns(con, table)
+        for column in columns:
+            if column not in existing:
+                con.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+    return step
+
+
+def _initial(con):
+    con.execute(
+        """CREATE TABLE IF NOT EXISTS records (
+        date timestamp,
+        co2 integer,
+        voc real,
+        eco2 real,
+        temp real,
+        hum real,
+        pressure real,
+        pm1 real,
+        pm25 real,
+        pm4 real,
+        pm10 real,
+        session_id integer
+        )"""
+    )
+    con.execute(
+        "CREATE TABLE IF NOT EXISTS sessions "
+        "(session_id integer, start_date timestamp, location text)"
+    )
+
+
+def _session_index(con):
+    # Per-room reads select by session (see rooms.py). Building it reads the whole
+    # table once; the dashboard keeps reading meanwhile, WAL readers don't wait.
+    con.execute("CREATE INDEX IF NOT EXISTS records_session ON records (session_id)")
+
+
+def _change_counter(con):
+    # api.py's ETag; a database without the hourly tier yet gets its triggers from
+    # compact.ensure_tiers, when it is created.
+    ensure_change_counter(con)
+
+
+MIGRATIONS = [
+    (1, "records and sessions", _initial, None),
+    # For databases from before the SPS30 was wired up.
+    (2, "particulate matter", add_columns("records", ("pm1", "pm25", "pm4", "pm10"), "real"), None),
+    (
+        3,
+        "outdoor weather",
+        add_columns(
+            "records",
+            (
+                "out_temp", "out_hum", "out_pressure", "out_pm25", "out_pm10",
+                "out_wind_speed", "out_wind_dir",
+            ),
+            "real",
+        ),
+        None,
+    ),
+    (4, "anomaly flags", add_columns("records", ("anomalies",), "integer"), None),
+    (5, "quality flags", add_columns("records", ("quality",), "integer"), quality.backfill_batches),
+    (6, "session index", _session_index, None),
+    (7, "change counter", _change_counter, None),
+]
+
+
+def ensure_table(con):
+    con.execute(
+        "CREATE TABLE IF NOT EXISTS schema_version (version integer PRIMARY KEY, "
+        "name text, applied_at timestamp, backfill_rowid integer, backfilled_at timestamp)"
+    )
+
+
+def applied(con):
+    ensure_table(con)
+    return {row[0] for row in con.execute("SELECT version FROM schema_version")}
+
+
+def migrate(con, migrations=MIGRATIONS):
+    """Apply the schema steps not applied yet, in order; return their versions."""
+    done = applied(con)
+    new = []
+    for version, name, schema, backfill in migrations:
+        if version in done:
+            continue
+        now = datetime.datetime.now()
+        with con:
+            con.execute("BEGIN IMMEDIATE")
+            schema(con)
+            # Nothing to rewrite in an empty table (a new database).
+            empty = con.execute("SELECT 1 FROM records LIMIT 1").fetchone() is None
+            con.execute(
+                "INSERT INTO schema_version (version, name, applied_at, backfilled_at) "
+                "VALUES (?, ?, ?, ?)",
+                (version, name, now, now if backfill is None or empty else None),
+            )
+        new.append(version)
+    if new:
+        # The views list the columns of `records`, so they follow any change to it.
+        ensure_tiers(con)
+    return new
+
+
+def pending(con, migrations=MIGRATIONS):
+    """[(version, name, backfill, rowid to resume after)] still to backfill, in order."""
+    ensure_table(con)
+    rows = dict(
+        con.execute(
+            "SELECT version, COALESCE(backfill_rowid, 0) FROM schema_version "
+            "WHERE backfilled_at IS NULL"
+        )
+    )
+    return [
+        (version, name, backfill, rows[version])
+        for version, name, _, backfill in migrations
+        if version in rows and backfill is not None
+    ]
+
+
+def backfill(con, migrations=MIGRATIONS, batch_rows=BATCH_ROWS, pause=0.0, progress=None):
+    """Run the pending backfills to the end; return the rows they changed.
+
+    Each batch is one BEGIN IMMEDIATE transaction, so it reads and writes under the
+    write lock and other writers wait at most one batch. `progress(version, rowid)`
+    is called after each.
+    """
+    changed = 0
+    for version, name, step, after in pending(con, migrations):
+        batches = step(con, after, batch_rows)
+        while True:
+            with con:
+                con.execute("BEGIN IMMEDIATE")
+                batch = next(batches, None)
+                if batch is None:
+                    con.execute(
+                        "UPDATE schema_version SET backfilled_at = ? WHERE version = ?",
+                        (datetime.datetime.now(), version),
+                    )
+                    break
+                rowid, rows = batch
+                con.execute(
+                    "UPDATE schema_version SET backfill_rowid = ? WHERE version = ?",
+                    (rowid, version),
+                )
+            changed += rows
+            if progress:
+                progress(version, rowid)
+            time.sleep(pause)
+    return changed
+
+
+def start_backfill(con, path=DB_PATH):
+    """Run the pending backfills on a background thread with its own connection to
+    `path`; return the thread, or None if there are none."""
+    if not pending(con):
+        return None
+
+    def work():
+        con = sqlite3.connect(path, timeout=60)
+        try:
+            changed = backfill(con, pause=BATCH_PAUSE_SECONDS)
+            print(f"Backfill done: {changed} rows updated")
+        except Exception as exc:
+            # Picks up from the last batch on the next start.
+            print("Backfill failed:", exc)
+        finally:
+            con.close()
+
+    thread = threading.Thread(target=work, name="backfill", daemon=True)
+    thread.start()
+    return thread
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show or finish the schema migrations.")
+    parser.add_argument(
+        "--run", action="store_true", help="apply and backfill what's pending, in the foreground"
+    )
+    args = parser.parse_args(argv)
+
+    with sqlite3.connect(DB_PATH, timeout=60) as con:
+        if args.run:
+            for version in migrate(con):
+                print(f"applied {version}")
+            last = con.execute("SELECT MAX(rowid) FROM records").fetchone()[0] or 1
+            changed = backfill(
+                con,
+                progress=lambda version, rowid: print(
+                    f"\r{version}: {min(rowid / last, 1):.0%}", end="", flush=True
+                ),
+            )
+            print(f"\n{changed} rows backfilled")
+        done = {
+            row[0]: row[1:]
+            for row in con.execute(
+                "SELECT version, applied_at, backfill_rowid, backfilled_at FROM schema_version"
+            )
+        }
+        last = con.execute("SELECT MAX(rowid) FROM records").fetchone()[0] or 1
+    for version, name, _, step in MIGRATIONS:
+        if version not in done:
+            state = "pending"
+        else:
+            applied_at, rowid, backfilled_at = done[version]
+            state = f"applied {applied_at[:16]}"
+            if step is not None and backfilled_at is None:
+                state += f", backfill at {min((rowid or 0) / last, 1):.0%}"
+        print(f"{version:>3}  {name:<22} {state}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,12 @@
+"""Sample the sensors every five minutes and store, flag, mirror and alert on each sample.
+
+The sensor drivers are only imported by the functions that talk to the hardware, so
+`run` -- the sampling loop and everything after the read -- works on any machine with
+another backend: simulate.py feeds it synthetic or recorded readings at any speed.
+A backend has `poll_seconds`, `read()` returning a dict with the `date` and the
+indoor metrics (or None when it has run out), and `wait()` for between samples.
+"""
+
 import atexit
 import datetime
 import json
@@ -6,34 +15,39 @@ import time
 import urllib.request
 from contextlib import suppress
 
-import bme280
-import mh_z19
-import smbus2
-try:
-    from sensirion_i2c_sps30 import Sps30Device, commands
-    from sensirion_driver_adapters.i2c_adapter.linux_i2c_channel_provider import (
-        LinuxI2cChannelProvider,
-    )
-except ImportError:
-    LinuxI2cChannelProvider = None  # type: ignore[assignment]
-    Sps30Device = None  # type: ignore[assignment]
-    commands = None  # type: ignore[assignment]
-
-from config import DB_PATH, LATITUDE, LONGITUDE
+import anomaly
+import checkpoints
+import migrations
+import planner
+import push
+import quality
+import rooms
+import rules
+import snapshot
+import static
+import thermal
+import ventilation
+from config import (
+    AIR_QUALITY_HOST,
+    DB_PATH,
+    FORECAST_HOST,
+    LATITUDE,
+    LIVE_BUFFER_PATH,
+    LONGITUDE,
+    STATIC_DIR,
+)
+from live import LiveWriter
 from utils import send_notification
 
 POLL_FREQUENCY_SECONDS = 300
-# Close-the-windows alert: fires once outdoor has risen to within this many degrees of
-# indoor (and is still below it). Re-arms once they diverge again by the reset amount.
-TEMP_CLOSE_THRESHOLD = 1.0
-TEMP_CLOSE_RESET_THRESHOLD = 2.0
-# Open-the-windows alert: fires once outdoor has dropped at least this many degrees below
-# indoor. Re-arms once the gap shrinks back under the reset amount.
-TEMP_OPEN_THRESHOLD = 2.0
-TEMP_OPEN_RESET_THRESHOLD = 1.0
+# How far ahead to look for outdoor catching up with indoor; further off reads as never.
+# Well past the close_windows rule's thresholds, and saves stepping through two days.
+CLOSE_HORIZON = datetime.timedelta(hours=6)
 
 
 def read_mhz19():
+    import mh_z19
+
     try:
         co2 = mh_z19.read()["co2"]
     except:
@@ -42,6 +56,9 @@ def read_mhz19():
 
 
 def init_bme280():
+    import bme280
+    import smbus2
+
     port = 1
     address = 0x77
     bus = smbus2.SMBus(port)
@@ -54,6 +71,8 @@ def init_bme280():
 
 
 def read_bme280(params):
+    import bme280
+
     try:
         data = bme280.sample(
             params["bus"], params["address"], params["calibration_params"]
@@ -74,6 +93,8 @@ CCS811_ADDRESS = 0x5B
 
 
 def init_ccs811(bus):
+    import smbus2
+
     try:
         if bus.read_byte_data(CCS811_ADDRESS, 0x20) != 0x81:  # HW_ID
             print("CCS811 not found; skipping TVOC readings.")
@@ -124,7 +145,12 @@ def read_ccs811(bus, temp, hum):
 
 
 def init_sps30():
-    if Sps30Device is None or LinuxI2cChannelProvider is None or commands is None:
+    try:
+        from sensirion_driver_adapters.i2c_adapter.linux_i2c_channel_provider import (
+            LinuxI2cChannelProvider,
+        )
+        from sensirion_i2c_sps30 import Sps30Device, commands
+    except ImportError:
         print(
             "sensirion_i2c_sps30 package not available; skipping particulate matter readings."
         )
@@ -169,39 +195,70 @@ def read_sps30(params):
     return pm1, pm25, pm4, pm10
 
 
-OUTDOOR_URL = (
-    "https://api.open-meteo.com/v1/forecast"
+class Sensors:
+    """The Pi's own sensors: the backend `run` uses when started as a script."""
+
+    poll_seconds = POLL_FREQUENCY_SECONDS
+
+    def __init__(self):
+        self.bme280_params = init_bme280()
+        self.ccs811_bus = init_ccs811(self.bme280_params["bus"])
+        self.sps30_params = init_sps30()
+
+    def read(self):
+        now = datetime.datetime.now()
+        co2 = read_mhz19()
+        temp, hum, pressure = read_bme280(self.bme280_params)
+        voc, eco2 = read_ccs811(self.ccs811_bus, temp, hum)
+        pm1, pm25, pm4, pm10 = read_sps30(self.sps30_params)
+        return {
+            "date": now, "co2": co2, "voc": voc, "eco2": eco2, "temp": temp, "hum": hum,
+            "pressure": pressure, "pm1": pm1, "pm25": pm25, "pm4": pm4, "pm10": pm10,
+        }
+
+    def wait(self):
+        time.sleep(self.poll_seconds)
+
+
+OUTDOOR_PATH = (
+    "/v1/forecast"
     f"?latitude={LATITUDE}&longitude={LONGITUDE}"
     "&current=temperature_2m,relative_humidity_2m,surface_pressure,"
     "wind_speed_10m,wind_direction_10m"
+    # Today's and tomorrow's hourly temperatures, in local time like our dates, for
+    # the close-the-windows prediction.
+    "&hourly=temperature_2m&timezone=Europe%2FBrussels&forecast_days=2"
 )
 # Outdoor particulates from the CAMS model (hourly, ~10 km resolution).
-AIR_QUALITY_URL = (
-    "https://air-quality-api.open-meteo.com/v1/air-quality"
+AIR_QUALITY_PATH = (
+    "/v1/air-quality"
     f"?latitude={LATITUDE}&longitude={LONGITUDE}"
     "&current=pm2_5,pm10"
 )
 
 
 def _fetch_current(url, keys, attempts=3, retry_delay_seconds=5):
+    """The `current` values for `keys`, followed by the `hourly` block (or None)."""
     last_exc = None
     for attempt in range(attempts):
         try:
             with urllib.request.urlopen(url, timeout=10) as response:
-                current = json.load(response)["current"]
-            return tuple(current.get(key) for key in keys)
+                data = json.load(response)
+            current = data["current"]
+            return (*(current.get(key) for key in keys), data.get("hourly"))
         except Exception as exc:
             last_exc = exc
             if attempt < attempts - 1:
                 time.sleep(retry_delay_seconds)
     print("Failed to fetch outdoor data:", last_exc)
-    return (None,) * len(keys)
+    return (None,) * (len(keys) + 1)
 
 
-def read_outdoor():
-    # Wind speed in km/h, direction in degrees (0 = north).
+def read_outdoor(host=FORECAST_HOST):
+    # Wind speed in km/h, direction in degrees (0 = north). Last comes the hourly
+    # temperature forecast.
     return _fetch_current(
-        OUTDOOR_URL,
+        host + OUTDOOR_PATH,
         (
             "temperature_2m",
             "relative_humidity_2m",
@@ -212,137 +269,158 @@ def read_outdoor():
     )
 
 
-def read_outdoor_air():
-    return _fetch_current(AIR_QUALITY_URL, ("pm2_5", "pm10"))
-
+def read_outdoor_air(host=AIR_QUALITY_HOST):
+    return _fetch_current(host + AIR_QUALITY_PATH, ("pm2_5", "pm10"))[:-1]
 
-def create_table(sql_query):
-    try:
-        cur.execute(sql_query)
-    except sqlite3.OperationalError:
-        # The table already exists.
-        pass
 
-
-def ensure_column(table, column, column_type):
-    cur.execute(f"PRAGMA table_info({table})")
-    existing_columns = [info[1] for info in cur.fetchall()]
-    if column not in existing_columns:
-        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+def read_weather(forecast_host=FORECAST_HOST, air_quality_host=AIR_QUALITY_HOST):
+    """The `out_*` columns for a reading, and the hourly temperature forecast."""
+    out_temp, out_hum, out_pressure, out_wind_speed, out_wind_dir, forecast = read_outdoor(
+        forecast_host
+    )
+    out_pm25, out_pm10 = read_outdoor_air(air_quality_host)
+    outdoor = {
+        "out_temp": out_temp, "out_hum": out_hum, "out_pressure": out_pressure,
+        "out_pm25": out_pm25, "out_pm10": out_pm10, "out_wind_speed": out_wind_speed,
+        "out_wind_dir": out_wind_dir,
+    }
+    return outdoor, forecast
 
 
-if __name__ == "__main__":
-    # Connect to the database and create thee tables if they don't exist yet.
+def open_database(path=DB_PATH):
+    """Connect, bringing the schema up to date (see migrations.py)."""
     # WAL so a dashboard read (the full-history chart scans the whole table) no
     # longer blocks our writes; the timeout rides out the brief locks WAL keeps
     # (checkpoints, schema changes) instead of dying on "database is locked".
-    con = sqlite3.connect(DB_PATH, timeout=60)
+    con = sqlite3.connect(path, timeout=60)
+    # Only takes effect on a fresh database (before the first table); lets compact.py
+    # hand space back in small steps. See compact.py --convert for existing ones.
+    con.execute("PRAGMA auto_vacuum=INCREMENTAL")
     con.execute("PRAGMA journal_mode=WAL")
+    migrations.migrate(con)
+    # Rewriting old rows for a new column happens alongside the sampling.
+    migrations.start_backfill(con, path)
+    snapshot.ensure_table(con)
+    thermal.ensure_table(con)
+    ventilation.ensure_tables(con)
+    planner.ensure_rollups(con)
+    con.commit()
+    return con
+
+
+def run(con, sensors, weather=read_weather, notify=send_notification,
+        live_path=LIVE_BUFFER_PATH, checkpointer=None, render=None, publish=None):
+    """Start a session and sample `sensors` until they run out; return the sample count.
+
+    With a checkpoints.Checkpointer, each write is timed for it. `render()`, if given,
+    is called after each write (a static.Renderer), and `publish(state)` with the new
+    header snapshot (a push.Publisher).
+    """
     cur = con.cursor()
-    create_table(
-        """CREATE TABLE records (
-        date timestamp,
-        co2 integer,
-        voc real,
-        eco2 real,
-        temp real,
-        hum real,
-        pressure real,
-        pm1 real,
-        pm25 real,
-        pm4 real,
-        pm10 real,
-        session_id integer
-        )"""
-    )
-    create_table(
-        """CREATE TABLE sessions (session_id integer, start_date timestamp, location text)"""
-    )
-    for column in (
-        "pm1",
-        "pm25",
-        "pm4",
-        "pm10",
-        "out_temp",
-        "out_hum",
-        "out_pressure",
-        "out_pm25",
-        "out_pm10",
-        "out_wind_speed",
-        "out_wind_dir",
-    ):
-        ensure_column("records", column, "real")
-
-    # Determine the current session id.
-    cur.execute("SELECT * FROM sessions LIMIT 1")
-    try:
-        result = cur.fetchone()
-        session_id = result[0] + 1
-    except TypeError:
-        session_id = 0
+
+    # Start the next session. A restart rarely means the monitor moved, so it stays
+    # in the room the last one was in until the dashboard says otherwise.
+    last = rooms.current(con)
+    session_id, location = (0, "") if last is None else (last[0] + 1, last[1])
     cur.execute(
         "INSERT INTO sessions VALUES (?, ? ,?)",
-        (session_id, datetime.datetime.now(), ""),
+        (session_id, datetime.datetime.now(), location),
     )
     con.commit()
 
-    # Initialise sensors.
-    bme280_params = init_bme280()
-    ccs811_bus = init_ccs811(bme280_params["bus"])
-    sps30_params = init_sps30()
-
-    # Take measurements every minute.
-    close_alert_sent = False
-    open_alert_sent = False
-    while True:
-        now = datetime.datetime.now()
-
-        # Read sensors.
-        co2 = read_mhz19()
-        temp, hum, pressure = read_bme280(bme280_params)
-        voc, eco2 = read_ccs811(ccs811_bus, temp, hum)
-        pm1, pm25, pm4, pm10 = read_sps30(sps30_params)
-        out_temp, out_hum, out_pressure, out_wind_speed, out_wind_dir = read_outdoor()
-        out_pm25, out_pm10 = read_outdoor_air()
-        print(
-            temp, hum, pressure, voc, eco2, pm1, pm25, pm4, pm10,
-            out_temp, out_hum, out_pressure, out_pm25, out_pm10,
-            out_wind_speed, out_wind_dir,
-        )
-
-        # Add measurements to database.
+    # Carry the dashboard header's 24h figures across the restart.
+    current = snapshot.rebuild(con)
+    # Likewise the anomaly baselines, so they don't start from scratch.
+    detectors = anomaly.rebuild(con)
+    # The thermal model carries on where it left off; only a first start fits one.
+    room = thermal.read(con) or thermal.rebuild(con)
+    # Mirror of the latest readings for the dashboard's live view. Only a convenience:
+    # the database stays the record, so a failure here must not stop the sampling.
+    try:
+        live_buffer = LiveWriter(sensors.poll_seconds, live_path)
+        live_buffer.seed(con)
+    except Exception as exc:
+        print("Failed to set up the live buffer:", exc)
+        live_buffer = None
+
+    # The alert rules declared in config.RULES.
+    alerts = rules.load()
+    # Warm-up counts from here, so this one starts fresh on every restart.
+    checks = quality.Checks()
+
+    samples = 0
+    scanned = None  # hour of the last hourly update
+    while (reading := sensors.read()) is not None:
+        now = reading["date"]
+        outdoor, forecast = weather()
+        reading.update(outdoor, session_id=session_id)
+        print(*(value for key, value in reading.items() if key != "date"))
+
+        # Add measurements to database, with the header snapshot in the same commit.
+        reading["quality"] = checks.update(reading)
+        # Everything downstream sees flagged values as missing, like readers of
+        # records_clean do; `records` keeps them as read.
+        clean = quality.masked(reading)
+        reading["anomalies"], raised = detectors.update(clean)
+        started = time.perf_counter()
+        # Take the write lock up front, so the wait for it can be told apart.
+        cur.execute("BEGIN IMMEDIATE")
+        locked = time.perf_counter()
         cur.execute(
-            "INSERT INTO records (date, co2, voc, eco2, temp, hum, pressure, pm1, pm25, pm4, pm10, out_temp, out_hum, out_pressure, out_pm25, out_pm10, out_wind_speed, out_wind_dir, session_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-            (now, co2, voc, eco2, temp, hum, pressure, pm1, pm25, pm4, pm10, out_temp, out_hum, out_pressure, out_pm25, out_pm10, out_wind_speed, out_wind_dir, session_id),
+            f"INSERT INTO records ({', '.join(reading)}) "
+            f"VALUES ({', '.join('?' * len(reading))})",
+            tuple(reading.values()),
         )
+        current.add(clean)
+        snapshot.write(cur, current)
+        room.update(clean)
+        thermal.write(cur, room)
         con.commit()
+        if checkpointer:
+            checkpointer.record_write(locked - started, time.perf_counter() - started)
+        if live_buffer:
+            live_buffer.append(clean)
+        if publish:
+            publish(current.state())
+        if render:
+            render()
+
+        if notification := anomaly.notification(raised, detectors.detectors):
+            notify(*notification)
+
+        # Minutes until outdoor catches up with indoor, for the close-the-windows rule:
+        # from the forecast, or from the current outdoor reading without one.
+        if (close_in := thermal.close_in(room, clean, forecast, CLOSE_HORIZON)) is not None:
+            clean["close_in"] = close_in
+        for rule in alerts:
+            if notification := rule.update(clean):
+                notify(*notification)
+
+        # Once an hour, bring the tables derived from the history up to date, so the
+        # dashboard and the API only have to read them.
+        if (hour := now.replace(minute=0, second=0, microsecond=0)) != scanned:
+            scanned = hour
+            try:
+                ventilation.update(con)
+            except sqlite3.Error as exc:
+                print("Failed to update the ventilation events:", exc)
+            try:
+                planner.extend(con, "1d", now)  # and the hourly rollup first
+            except sqlite3.Error as exc:
+                print("Failed to extend the rollups:", exc)
+
+        samples += 1
+        sensors.wait()
+    return samples
 
-        # Notify when indoor/outdoor temps cross the close/open-window zones.
-        if temp is not None and out_temp is not None:
-            diff = temp - out_temp  # positive = indoor warmer than outdoor
-
-            # Close the windows: outdoor has risen back up to near indoor.
-            if 0 <= diff <= TEMP_CLOSE_THRESHOLD and not close_alert_sent:
-                send_notification(
-                    "Close the windows",
-                    f"Outdoor temp ({out_temp:.1f}°C) is within "
-                    f"{TEMP_CLOSE_THRESHOLD:.0f}°C of indoor ({temp:.1f}°C).",
-                )
-                close_alert_sent = True
-            elif abs(diff) > TEMP_CLOSE_RESET_THRESHOLD:
-                close_alert_sent = False
-
-            # Open the windows: outdoor has dropped comfortably below indoor.
-            if diff >= TEMP_OPEN_THRESHOLD and not open_alert_sent:
-                send_notification(
-                    "Open the windows",
-                    f"Outdoor temp ({out_temp:.1f}°C) is "
-                    f"{diff:.1f}°C below indoor ({temp:.1f}°C).",
-                )
-                open_alert_sent = True
-            elif diff < TEMP_OPEN_RESET_THRESHOLD:
-                open_alert_sent = False
-
-        time.sleep(POLL_FREQUENCY_SECONDS)
 
+if __name__ == "__main__":
+    con = open_database()
+    run(
+        con,
+        Sensors(),
+        checkpointer=checkpoints.Checkpointer().start(),
+        render=static.Renderer() if STATIC_DIR else None,
+        publish=push.Publisher(),
+    )
     con.close()
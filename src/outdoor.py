@@ -0,0 +1,427 @@
+"""Fill in the outdoor columns of stored rows from Open-Meteo's hourly history.
+
+Rows from before migration 3 added the `out_*` columns, and rows stored while the
+network was down, have them NULL, which leaves holes in the indoor-vs-outdoor charts
+and in everything fitted on them (thermal.py, the alert rules' backtests). Open-Meteo
+serves whole hourly ranges in one request, so instead of asking per row:
+
+- stretches() finds the runs of rows missing a value of one service (weather, air
+  quality) in one pass over the date index,
+- windows() merges runs a few days apart into one request window, and each window is
+  one request to that service for all its hours,
+- interpolate() places the hourly values on the rows' timestamps with numpy,
+- fill() writes them a batch of rows per transaction, only into columns still NULL,
+  so the monitor's inserts wait at most one batch.
+
+Both tiers are filled: `records` at each sample's time, and `records_hourly` (rows
+compacted before the columns existed) with the value at the middle of the hour as its
+mean, minimum and maximum. Some values the services never have, such as air quality
+from before the CAMS record starts, so a window a service has answered is recorded in
+TRIED_TABLE and not asked again (--retry does). The archived months a window overlaps get the same values
+(fill_archive()), and after each window the rollups rebuild the buckets it changed, so
+charts, the API and reports show the filled values without a manual rewrite.
+
+Weather comes from the reanalysis archive, which lags a few days; the most recent days
+come from the forecast service's past days instead. Air quality is the CAMS model, as
+monitor.py reads it live.
+
+    python3 src/outdoor.py [--from YYYY-MM-DD] [--to YYYY-MM-DD] [--retry] [--dry-run]
+"""
+
+import argparse
+import datetime
+import json
+import sqlite3
+import time
+import urllib.parse
+import urllib.request
+
+import numpy as np
+
+import archive
+import planner
+from compact import CIRCULAR_COLUMNS, HOURLY_TABLE
+from config import (
+    AIR_QUALITY_HOST,
+    ARCHIVE_DIR,
+    ARCHIVE_HOST,
+    DB_PATH,
+    FORECAST_HOST,
+    LATITUDE,
+    LONGITUDE,
+)
+
+# The archive's last days are still empty; anything newer is asked of the forecast
+# service, which keeps its past three months.
+ARCHIVE_DELAY_DAYS = 5
+# Open-Meteo's names for the `out_*` columns, per service; monitor.read_weather reads
+# the same ones live.
+WEATHER = {
+    "out_temp": "temperature_2m",
+    "out_hum": "relative_humidity_2m",
+    "out_pressure": "surface_pressure",
+    "out_wind_speed": "wind_speed_10m",
+    "out_wind_dir": "wind_direction_10m",
+}
+AIR = {"out_pm25": "pm2_5", "out_pm10": "pm10"}
+OUTDOOR = {**WEATHER, **AIR}
+SERVICES = {"weather": WEATHER, "air": AIR}
+# The windows each service has answered, per tier: what is still missing in them, it
+# doesn't have.
+TRIED_TABLE = "outdoor_tried"
+# Runs of missing rows this close together share a request; no request is longer.
+MERGE_DAYS = 2
+MAX_REQUEST_DAYS = 92
+# Rows per write transaction, and the pause after each so other writers get a turn.
+BATCH_ROWS = 2000
+BATCH_PAUSE_SECONDS = 0.05
+
+
+def _missing(con, table, names=OUTDOOR):
+    columns = {info[1] for info in con.execute(f"PRAGMA table_info({table})")}
+    return [c for c in names if c in columns]
+
+
+def ensure_table(con):
+    con.execute(
+        f"CREATE TABLE IF NOT EXISTS {TRIED_TABLE} (tier text, service text, "
+        "first date, last date, PRIMARY KEY (tier, service, first))"
+    )
+    con.commit()
+
+
+def tried(con, table, service):
+    """[(first day, last day)] of the windows `service` has answered for `table`."""
+    if not con.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = ?", (TRIED_TABLE,)
+    ).fetchone():
+        return []
+    return [
+        (datetime.date.fromisoformat(first), datetime.date.fromisoformat(last))
+        for first, last in con.execute(
+            f"SELECT first, last FROM {TRIED_TABLE} WHERE tier = ? AND service = ? "
+            "ORDER BY first",
+            (table, service),
+        )
+    ]
+
+
+def untried(windows, done):
+    """The days of `windows` outside the `done` ones, as windows again."""
+    day = datetime.timedelta(days=1)
+    out = []
+    for first, last in windows:
+        for done_first, done_last in done:
+            if done_last < first or done_first > last:
+                continue
+            if done_first > first:
+                out.append((first, done_first - day))
+            first = max(first, done_last + day)
+        if first <= last:
+            out.append((first, last))
+    return out
+
+
+def stretches(con, table="records", start=None, end=None, columns=OUTDOOR):
+    """[(first date, last date, rows)] of the runs of rows missing one of `columns`.
+
+    A run is consecutive in date order, so one failed fetch is a run of one and a
+    month before the columns existed is a run of a month. `start` and `end` (stored
+    date strings) limit the search.
+    """
+    missing = " OR ".join(f"{c} IS NULL" for c in _missing(con, table, columns))
+    # Gaps and islands: within a run, the row's place among all rows and among the
+    # missing ones go up together, so their difference names the run.
+    return con.execute(
+        f"""SELECT MIN(date), MAX(date), COUNT(*) FROM (
+            SELECT date, missing,
+                ROW_NUMBER() OVER (ORDER BY date)
+                - ROW_NUMBER() OVER (PARTITION BY missing ORDER BY date) AS run
+            FROM (SELECT date, ({missing}) AS missing FROM {table}
+                  WHERE date >= ? AND date < ?)
+        ) WHERE missing GROUP BY run ORDER BY 1""",
+        # A full date as the open end: `date` has NUMERIC affinity, so "9999" would
+        # compare as a number, and every text sorts after numbers.
+        (start or "", end or "9999-12-31"),
+    ).fetchall()
+
+
+def windows(runs, merge_days=MERGE_DAYS, max_days=MAX_REQUEST_DAYS):
+    """Merge `runs` (from stretches()) into [(first day, last day)] request windows."""
+    out = []
+    for first, last, _ in runs:
+        first = datetime.date.fromisoformat(first[:10])
+        last = datetime.date.fromisoformat(last[:10])
+        if out and (first - out[-1][1]).days <= merge_days:
+            first = out.pop()[0]
+        while (last - first).days >= max_days:
+            out.append((first, first + datetime.timedelta(days=max_days - 1)))
+            first += datetime.timedelta(days=max_days)
+        out.append((first, last))
+    return out
+
+
+def _split(window, today, forecast_host, archive_host):
+    # The part the archive has, and the recent part the forecast service has.
+    first, last = window
+    cut = today - datetime.timedelta(days=ARCHIVE_DELAY_DAYS)
+    archive = (archive_host, "/v1/archive")
+    forecast = (forecast_host, "/v1/forecast")
+    if last < cut:
+        return [(*archive, first, last)]
+    if first >= cut:
+        return [(*forecast, first, last)]
+    return [(*archive, first, cut - datetime.timedelta(days=1)), (*forecast, cut, last)]
+
+
+def _fetch(host, path, first, last, names, attempts=3, retry_delay_seconds=5):
+    # Hourly `names` from `first` to `last` (days, inclusive), in local time like our
+    # dates; None when the service doesn't answer.
+    query = urllib.parse.urlencode(
+        {
+            "latitude": LATITUDE,
+            "longitude": LONGITUDE,
+            "hourly": ",".join(names),
+            "start_date": first.isoformat(),
+            "end_date": last.isoformat(),
+            "timezone": "Europe/Brussels",
+        }
+    )
+    last_exc = None
+    for attempt in range(attempts):
+        try:
+            with urllib.request.urlopen(f"{host}{path}?{query}", timeout=60) as response:
+                return json.load(response)["hourly"]
+        except Exception as exc:
+            last_exc = exc
+            if attempt < attempts - 1:
+                time.sleep(retry_delay_seconds)
+    print(f"Failed to fetch {first} to {last} from {host}:", last_exc)
+    return None
+
+
+def hourly(window, today=None, forecast_host=FORECAST_HOST, archive_host=ARCHIVE_HOST,
+           air_quality_host=AIR_QUALITY_HOST, services=SERVICES):
+    """{`out_*` column: (hour times, values)} for a window, in one request per service.
+
+    Only `services` are asked. A service that doesn't answer for the whole window
+    (weather can take two requests) is left out, so what is there is all it has.
+    """
+    # Through the next midnight, so the window's last rows have an hour after them.
+    window = (window[0], window[1] + datetime.timedelta(days=1))
+    parts = []
+    if "weather" in services:
+        parts += [
+            (host, path, first, last, WEATHER)
+            for host, path, first, last in _split(
+                window, today or datetime.date.today(), forecast_host, archive_host
+            )
+        ]
+    if "air" in services:
+        parts.append((air_quality_host, "/v1/air-quality", *window, AIR))
+    blocks = [(_fetch(host, path, first, last, list(columns.values())), columns)
+              for host, path, first, last, columns in parts]
+    failed = [columns for block, columns in blocks if block is None]
+    out = {}
+    for block, columns in blocks:
+        if columns in failed:
+            continue
+        times = np.array(block["time"], dtype="datetime64[s]")
+        for column, name in columns.items():
+            values = np.array(block.get(name, [None] * len(times)), dtype=float)  # null: nan
+            if column in out:
+                times_so_far, so_far = out[column]
+                out[column] = (
+                    np.concatenate([times_so_far, times]), np.concatenate([so_far, values])
+                )
+            else:
+                out[column] = (times, values)
+    return out
+
+
+def interpolate(times, values, at, circular=False):
+    """`values` at hourly `times`, linearly interpolated to `at`; nan where unknown.
+
+    Hours the service has no value for are skipped, and `at` outside the hours with a
+    value stays nan. A repeated hour (the autumn clock change, in local time) is taken
+    once. Directions go through their unit vectors, so 350° and 10° give 0°, not 180°.
+    """
+    times, first = np.unique(times.astype("datetime64[s]").astype(np.int64), return_index=True)
+    values = values[first]
+    known = ~np.isnan(values)
+    times, values = times[known], values[known]
+    result = np.full(len(at), np.nan)
+    if not len(times):
+        return result
+    at = at.astype("datetime64[s]").astype(np.int64)
+    inside = (at >= times[0]) & (at <= times[-1])
+    if circular:
+        radians = np.radians(values)
+        x = np.interp(at[inside], times, np.cos(radians))
+        y = np.interp(at[inside], times, np.sin(radians))
+        result[inside] = np.degrees(np.arctan2(y, x)) % 360
+    else:
+        result[inside] = np.interp(at[inside], times, values)
+    return result
+
+
+def fill(con, table, window, series, batch_rows=BATCH_ROWS, pause=0.0):
+    """Write `series` (from hourly()) into the rows of `window` still missing a value.
+
+    Returns the rows written. Each batch is one BEGIN IMMEDIATE transaction, and only
+    NULL columns are set, so a value stored meanwhile is kept.
+    """
+    columns = [c for c in _missing(con, table) if c in series]
+    if not columns:
+        return 0
+    start = window[0].isoformat()
+    end = (window[1] + datetime.timedelta(days=1)).isoformat()
+    rows = con.execute(
+        f"SELECT rowid, date FROM {table} WHERE date >= ? AND date < ? AND "
+        f"({' OR '.join(f'{c} IS NULL' for c in columns)}) ORDER BY date",
+        (start, end),
+    ).fetchall()
+    if not rows:
+        return 0
+    rowids = [rowid for rowid, _ in rows]
+    at = np.array([date for _, date in rows], dtype="datetime64[us]")
+    if table == HOURLY_TABLE:
+        # An hourly row's mean is closest to the value half way through its hour.
+        at = at + np.timedelta64(30, "m")
+        targets = [(c, (c, f"{c}_min", f"{c}_max")) for c in columns]
+    else:
+        targets = [(c, (c,)) for c in columns]
+    values = {c: interpolate(*series[c], at, c in CIRCULAR_COLUMNS) for c in columns}
+    # NaN -> None (NULL), column by column, then one tuple per row.
+    per_column = [
+        np.where(np.isnan(values[c]), None, values[c].round(2).astype(object))
+        for c, names in targets
+        for _ in names
+    ]
+    sets = ", ".join(f"{name} = COALESCE({name}, ?)" for _, names in targets for name in names)
+    update = f"UPDATE {table} SET {sets} WHERE rowid = ?"
+    params = list(zip(*per_column, rowids))
+    for batch in range(0, len(params), batch_rows):
+        with con:
+            con.execute("BEGIN IMMEDIATE")
+            con.executemany(update, params[batch : batch + batch_rows])
+        time.sleep(pause)
+    return len(params)
+
+
+def fill_archive(window, series, archive_dir=ARCHIVE_DIR):
+    """Write `series` into the archived rows of `window` still missing a value.
+
+    Returns the values written. Only the months the window overlaps are read, and only
+    the columns that got a value are written back.
+    """
+    start = np.datetime64(window[0].isoformat(), "s")
+    end = np.datetime64((window[1] + datetime.timedelta(days=1)).isoformat(), "s")
+    written = 0
+
+    def update(arrays):
+        nonlocal written
+        dates = arrays["date"]
+        inside = (dates >= start) & (dates < end)
+        changed = []
+        for column in OUTDOOR:
+            if column not in arrays or column not in series:
+                continue
+            gap = inside & np.isnan(arrays[column])
+            values = interpolate(*series[column], dates[gap], column in CIRCULAR_COLUMNS)
+            known = int(np.count_nonzero(~np.isnan(values)))
+            if known:
+                arrays[column][gap] = values.round(2)
+                written += known
+                changed.append(column)
+        return changed
+
+    month = datetime.datetime(window[0].year, window[0].month, 1)
+    while month.date() <= window[1]:
+        archive.rewrite(month, update, archive_dir)  # nothing if it isn't archived
+        month = (month + datetime.timedelta(days=32)).replace(day=1)
+    return written
+
+
+def requests(con, table, start=None, end=None, retry=False):
+    """[(service, window)] still to ask for `table`, in order."""
+    out = []
+    for service, columns in SERVICES.items():
+        pending = windows(stretches(con, table, start, end, columns))
+        out += [
+            (service, window)
+            for window in (pending if retry else untried(pending, tried(con, table, service)))
+        ]
+    return out
+
+
+def backfill(con, start=None, end=None, pause=0.0, archive_dir=ARCHIVE_DIR, retry=False,
+             **hosts):
+    """Fill every missing stretch in both tiers and the archive; return {part: count}:
+    values written to the archive, rows to each "tier/service".
+
+    Each window goes to the one service missing from it, and is recorded once that
+    service has answered. The rollups' triggers mark the buckets a window changes, and
+    extending them afterwards rebuilds those, so a long backfill shows up window by
+    window.
+    """
+    ensure_table(con)
+    planner.ensure_rollups(con)
+    written = {"archive": 0}
+    for table in ("records", HOURLY_TABLE):
+        written.update({f"{table}/{service}": 0 for service in SERVICES})
+        for service, window in requests(con, table, start, end, retry):
+            series = hourly(window, services=(service,), **hosts)
+            if not series:
+                continue  # asked again next time
+            rows = fill(con, table, window, series, pause=pause)
+            values = fill_archive(window, series, archive_dir)
+            with con:
+                con.execute(
+                    f"INSERT OR REPLACE INTO {TRIED_TABLE} VALUES (?, ?, ?, ?)",
+                    (table, service, window[0].isoformat(), window[1].isoformat()),
+                )
+            if rows or values:
+                planner.extend(con, "1d")
+            written[f"{table}/{service}"] += rows
+            written["archive"] += values
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--from", dest="start", help="first day to fill, YYYY-MM-DD")
+    parser.add_argument("--to", dest="end", help="last day to fill, YYYY-MM-DD")
+    parser.add_argument(
+        "--retry", action="store_true",
+        help="ask again for windows a service has answered before, e.g. once it has "
+        "more history",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="only list the missing stretches"
+    )
+    args = parser.parse_args(argv)
+    end = args.end and (
+        datetime.date.fromisoformat(args.end) + datetime.timedelta(days=1)
+    ).isoformat()
+
+    con = sqlite3.connect(DB_PATH, timeout=60)
+    try:
+        if args.dry_run:
+            for table in ("records", HOURLY_TABLE):
+                runs = stretches(con, table, args.start, end)
+                asks = requests(con, table, args.start, end, args.retry)
+                print(f"{table}: {sum(r[2] for r in runs)} rows in {len(runs)} stretches, "
+                      f"{len(asks)} requests")
+                for first, last, rows in runs:
+                    print(f"  {first[:16]} to {last[:16]}  {rows} rows")
+            return
+        written = backfill(con, args.start, end, pause=BATCH_PAUSE_SECONDS, retry=args.retry)
+        for part, count in written.items():
+            print(f"{part}: {count} {'values' if part == 'archive' else 'rows'} filled")
+    finally:
+        con.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""Pick the cheapest data source that still fills a chart, for any date range.
+
+A chart is only so many pixels wide, so a year of 5-minute rows (~105k) draws no
+better than a year of daily points (365) -- it just costs three hundred times more to
+read, parse and ship to the browser. plan() picks the coarsest resolution that still
+gives the chart enough points, and query() reads it:
+
+- "raw": the `history` view, i.e. 5-minute rows (hourly ones once compacted);
+- "1h" / "1d": the `rollup_1h` / `rollup_1d` tables, with the mean under the metric's
+  own name plus `<metric>_min` / `<metric>_max`, like `records_hourly`.
+
+monitor.py extends the rollups to the last complete hour or day once an hour, and a
+query() that may write (the dashboard's) does so first too; building over a long
+history goes EXTEND_STEP at a time, one short transaction each. Read-only readers
+(api.py) take the rollups as built: the buckets after them, like the still-open one
+at the end, are aggregated on the fly from `history`.
+
+Rows that change under a built bucket (quality flags, an outdoor backfill, compaction
+moving a day to the hourly tier) are caught by triggers on both tiers, which list the
+bucket's hour and day in `rollup_dirty`; the next extend() re-aggregates those first.
+"""
+
+import datetime
+
+from compact import CIRCULAR_COLUMNS, CLEAN_VIEW, HISTORY_VIEW, HOURLY_TABLE, metric_columns
+
+# Seconds per point at each resolution, finest first.
+RESOLUTIONS = {"raw": 300, "1h": 3600, "1d": 86400}
+# About one point per horizontal pixel of a full-width chart.
+MAX_POINTS = 1500
+ROLLUP_TABLES = {"1h": "rollup_1h", "1d": "rollup_1d"}
+# (resolution, bucket) pairs whose rows changed after the bucket was aggregated.
+DIRTY_TABLE = "rollup_dirty"
+# SQL for the start of the bucket a stored (naive local ISO) date falls in.
+BUCKETS = {
+    "1h": "substr(date, 1, 13) || ':00:00'",
+    "1d": "substr(date, 1, 10) || ' 00:00:00'",
+}
+STEPS = {"1h": datetime.timedelta(hours=1), "1d": datetime.timedelta(days=1)}
+# History aggregated per transaction when a rollup catches up.
+EXTEND_STEP = datetime.timedelta(days=31)
+
+
+def plan(start, end, max_points=MAX_POINTS):
+    """The finest resolution that keeps [start, end) under `max_points` points."""
+    seconds = (end - start).total_seconds()
+    for resolution, step in RESOLUTIONS.items():
+        if seconds / step <= max_points:
+            return resolution
+    return resolution
+
+
+def _metrics(con):
+    # A mean of compass degrees is meaningless, and nothing charts wind direction.
+    return [c for c in metric_columns(con) if c not in CIRCULAR_COLUMNS]
+
+
+def _stamp(value):
+    return value.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _floor(value, resolution):
+    value = value.replace(minute=0, second=0, microsecond=0)
+    return value.replace(hour=0) if resolution == "1d" else value
+
+
+def _dirty_trigger(table, event, rows):
+    # Lists the hour and day of each of `rows` (OLD, NEW) in DIRTY_TABLE, but only for
+    # hours rollup_1h already has: later ones get aggregated when they close anyway.
+    built = f"(SELECT MAX(date) FROM {ROLLUP_TABLES['1h']})"
+    when = " OR ".join(f"{BUCKETS['1h'].replace('date', f'{r}.date')} <= {built}" for r in rows)
+    values = ", ".join(
+        f"('{resolution}', {bucket.replace('date', f'{r}.date')})"
+        for r in rows
+        for resolution, bucket in BUCKETS.items()
+    )
+    return (
+        f"CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_dirty AFTER {event} ON {table} "
+        f"WHEN {when} BEGIN INSERT OR IGNORE INTO {DIRTY_TABLE} VALUES {values}; END"
+    )
+
+
+def ensure_rollups(con):
+    metrics = _metrics(con)
+    con.execute(
+        f"CREATE TABLE IF NOT EXISTS {DIRTY_TABLE} "
+        "(resolution text, date timestamp, PRIMARY KEY (resolution, date)) WITHOUT ROWID"
+    )
+    for resolution, table in ROLLUP_TABLES.items():
+        con.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} "
+            "(date timestamp PRIMARY KEY, samples integer, session_id integer)"
+        )
+        existing = {info[1] for info in con.execute(f"PRAGMA table_info({table})")}
+        for metric in metrics:
+            for column in (metric, f"{metric}_min", f"{metric}_max"):
+                if column not in existing:
+                    con.execute(f"ALTER TABLE {table} ADD COLUMN {column} real")
+            if f"{metric}_n" not in existing:
+                con.execute(f"ALTER TABLE {table} ADD COLUMN {metric}_n integer")
+                if metric in existing:
+                    # Built before per-metric counts were kept: redo every bucket.
+                    con.execute(
+                        f"INSERT OR IGNORE INTO {DIRTY_TABLE} SELECT ?, date FROM {table}",
+                        (resolution,),
+                    )
+    for table in ("records", HOURLY_TABLE):
+        con.execute(_dirty_trigger(table, "INSERT", ("NEW",)))
+        con.execute(_dirty_trigger(table, "UPDATE", ("OLD", "NEW")))
+        con.execute(_dirty_trigger(table, "DELETE", ("OLD",)))
+    con.commit()
+
+
+def _aggregate_select(resolution, metrics):
+    """SELECT list folding `history` rows into one row per bucket."""
+    parts = [f"{BUCKETS[resolution]} AS bucket", "COUNT(*)", "MAX(session_id)"]
+    for m in metrics:
+        parts += [f"AVG({m})", f"MIN({m})", f"MAX({m})", f"COUNT({m})"]
+    return ", ".join(parts)
+
+
+def _targets(metrics):
+    columns = ["date", "samples", "session_id"]
+    for m in metrics:
+        columns += [m, f"{m}_min", f"{m}_max", f"{m}_n"]
+    return ", ".join(columns)
+
+
+def _built_until(con, resolution):
+    last = con.execute(f"SELECT MAX(date) FROM {ROLLUP_TABLES[resolution]}").fetchone()[0]
+    if last is None:
+        return None
+    return datetime.datetime.fromisoformat(last) + STEPS[resolution]
+
+
+def _dirty_runs(con, resolution, built):
+    """Runs of consecutive invalidated buckets before `built`, as [since, until) pairs."""
+    runs = []
+    for (bucket,) in con.execute(
+        f"SELECT date FROM {DIRTY_TABLE} WHERE resolution = ? AND date < ? ORDER BY date",
+        (resolution, _stamp(built)),
+    ):
+        since = datetime.datetime.fromisoformat(bucket)
+        if runs and runs[-1][1] == since:
+            runs[-1][1] += STEPS[resolution]
+        else:
+            runs.append([since, since + STEPS[resolution]])
+    return runs
+
+
+def _aggregate(con, resolution, metrics, since, until):
+    """(Re)build the buckets in [since, until); a bucket left with no rows goes."""
+    table = ROLLUP_TABLES[resolution]
+    bounds = (_stamp(since), _stamp(until))
+    con.execute(f"DELETE FROM {table} WHERE date >= ? AND date < ?", bounds)
+    if resolution == "1h":
+        # Raw rows are grouped; compacted hours already are hours, with their true
+        # min/max, so they are copied rather than re-aggregated from their means.
+        con.execute(
+            f"INSERT OR REPLACE INTO {table} ({_targets(metrics)}) "
+            f"SELECT {_aggregate_select(resolution, metrics)} FROM {CLEAN_VIEW} "
+            "WHERE date >= ? AND date < ? GROUP BY bucket",
+            bounds,
+        )
+        # A compacted hour only kept how many rows it had, so that stands in for its
+        # metrics' counts.
+        copied = ["date", "samples", "session_id"]
+        for m in metrics:
+            copied += [m, f"{m}_min", f"{m}_max", f"CASE WHEN {m} IS NOT NULL THEN samples END"]
+        con.execute(
+            f"INSERT OR REPLACE INTO {table} ({_targets(metrics)}) "
+            f"SELECT {', '.join(copied)} FROM {HOURLY_TABLE} WHERE date >= ? AND date < ?",
+            bounds,
+        )
+    else:
+        # Days from hours, each hour's mean weighted by how many values it had.
+        parts = [f"{BUCKETS['1d']} AS bucket", "SUM(samples)", "MAX(session_id)"]
+        for m in metrics:
+            parts += [
+                f"SUM({m} * {m}_n) / SUM({m}_n)",
+                f"MIN({m}_min)",
+                f"MAX({m}_max)",
+                f"SUM({m}_n)",
+            ]
+        con.execute(
+            f"INSERT OR REPLACE INTO {table} ({_targets(metrics)}) "
+            f"SELECT {', '.join(parts)} FROM {ROLLUP_TABLES['1h']} "
+            "WHERE date >= ? AND date < ? GROUP BY bucket",
+            bounds,
+        )
+
+
+def extend(con, resolution, now=None):
+    """Aggregate every bucket that closed, or was invalidated, since the last extend."""
+    if resolution == "1d":
+        extend(con, "1h", now)
+    until = _floor(now or datetime.datetime.now(), resolution)
+    since = _built_until(con, resolution)
+    dirty = con.execute(
+        f"SELECT 1 FROM {DIRTY_TABLE} WHERE resolution = ? LIMIT 1", (resolution,)
+    ).fetchone()
+    if since is not None and since >= until and dirty is None:
+        return
+    metrics = _metrics(con)
+    with con:
+        con.execute("BEGIN IMMEDIATE")
+        since = _built_until(con, resolution)
+        runs = [] if since is None else _dirty_runs(con, resolution, since)
+        # Later buckets are (re)built by the forward pass below.
+        con.execute(f"DELETE FROM {DIRTY_TABLE} WHERE resolution = ?", (resolution,))
+        for run_since, run_until in runs:
+            _aggregate(con, resolution, metrics, run_since, run_until)
+    if since is None:
+        first = con.execute(f"SELECT MIN(date) FROM {HISTORY_VIEW}").fetchone()[0]
+        if first is None:
+            return
+        since = _floor(datetime.datetime.fromisoformat(first), resolution)
+    while since < until:
+        step = min(since + EXTEND_STEP, until)
+        with con:
+            con.execute("BEGIN IMMEDIATE")
+            _aggregate(con, resolution, metrics, since, step)
+        since = step
+
+
+def _readable(con, resolution, columns):
+    # Whether the rollup exists with all of `columns`; only a writer can add them.
+    table = ROLLUP_TABLES[resolution]
+    return set(columns) <= {info[1] for info in con.execute(f"PRAGMA table_info({table})")}
+
+
+def query(
+    con, start, end, columns, max_points=MAX_POINTS, now=None, resolution=None, build=True
+):
+    """Return (resolution, sql, params) reading `columns` over [start, end).
+
+    `columns` are metric names; aggregated resolutions also return their _min/_max.
+    Rows come back as `date` plus those columns, oldest first. Pass `resolution` to
+    skip the planning, e.g. for a chart that is daily by nature. With build=False
+    nothing is written: the rollups are read as they are, the rest aggregated on the fly.
+    """
+    resolution = resolution or plan(start, end, max_points)
+    columns = [c for c in columns if c != "date"]
+    if resolution == "raw":
+        sql = (
+            f"SELECT date, {', '.join(columns)} FROM {HISTORY_VIEW} "
+            "WHERE date >= ? AND date < ? ORDER BY date"
+        )
+        return resolution, sql, (_stamp(start), _stamp(end))
+
+    if build:
+        ensure_rollups(con)
+        extend(con, resolution, now)
+    picked = [f"{c}{suffix}" for c in columns for suffix in ("", "_min", "_max")]
+    tail = ", ".join(
+        f"{fn}({c}) AS {c}{suffix}"
+        for c in columns
+        for fn, suffix in (("AVG", ""), ("MIN", "_min"), ("MAX", "_max"))
+    )
+    on_the_fly = (
+        f"SELECT {BUCKETS[resolution]} AS bucket, {tail} FROM {HISTORY_VIEW} "
+        "WHERE date >= ? AND date < ? GROUP BY bucket"
+    )
+    start_bucket = _floor(start, resolution)
+    if not _readable(con, resolution, picked):
+        sql = f"SELECT bucket AS date, {', '.join(picked)} FROM ({on_the_fly}) ORDER BY date"
+        return resolution, sql, (_stamp(start_bucket), _stamp(end))
+    sql = (
+        f"SELECT date, {', '.join(picked)} FROM {ROLLUP_TABLES[resolution]} "
+        f"WHERE date >= ? AND date < ? UNION ALL {on_the_fly} ORDER BY date"
+    )
+    split = max(_built_until(con, resolution) or start_bucket, start_bucket)
+    return resolution, sql, (
+        _stamp(start_bucket), _stamp(min(split, end)), _stamp(split), _stamp(end),
+    )
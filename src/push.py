@@ -0,0 +1,106 @@
+"""Live updates: monitor.py announces each sample, api.py streams it to open pages.
+
+Without this, a page only learns about a new reading by being rebuilt -- Streamlit
+reruns every query and chart, the static page reloads everything. Instead monitor.py
+sends the header snapshot (snapshot.py's state: the reading, the 24h extremes, the
+TVOC baseline) after each commit, as one UDP datagram to PUSH_ADDRESS on this machine.
+UDP because the monitor must never wait on a viewer: with nothing listening the
+datagram is dropped, and sending costs microseconds either way.
+
+api.py runs a Hub that receives them, renders the cards once, and hands the event to
+every open `/events` stream (server-sent events). The static page (static.py) swaps
+in the cards and appends the row to its 24h charts, so a new sample costs each viewer
+one message of a couple of kilobytes.
+"""
+
+import datetime
+import json
+import queue
+import socket
+import threading
+from contextlib import suppress
+from zoneinfo import ZoneInfo
+
+from cards import current_cards
+from config import PUSH_ADDRESS
+
+# Events queued per viewer; one that falls this far behind misses the oldest.
+QUEUE_EVENTS = 16
+TZ = ZoneInfo("Europe/Brussels")  # as frames.py localises the charts' dates
+
+
+class Publisher:
+    """monitor.py's end: call with each new snapshot state."""
+
+    def __init__(self, address=PUSH_ADDRESS):
+        self.address = address
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def __call__(self, state):
+        try:
+            self._socket.sendto(json.dumps(state).encode(), self.address)
+        except OSError:
+            pass  # nobody listening, or too big to send: the page catches up on reload
+
+
+def event(state):
+    """The SSE payload for a snapshot state: the state, its cards, a chart-ready row."""
+    taken = datetime.datetime.fromisoformat(state["reading"]["date"]).replace(tzinfo=TZ)
+    return json.dumps(
+        {
+            "state": state,
+            "cards": "".join(current_cards(state)),
+            "taken": taken.strftime("%d-%m-%Y %H:%M"),
+            # Dated like the rows in the charts' data.
+            "row": dict(state["reading"], date=taken.isoformat()),
+        }
+    )
+
+
+class Hub:
+    """api.py's end: receives the datagrams and fans them out to the subscribers."""
+
+    def __init__(self, address=PUSH_ADDRESS):
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind(address)
+        self.address = self._socket.getsockname()
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self.received = 0
+
+    def subscribe(self):
+        subscriber = queue.Queue(QUEUE_EVENTS)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, state):
+        message = event(state)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            while True:
+                try:
+                    subscriber.put_nowait(message)
+                    break
+                except queue.Full:
+                    with suppress(queue.Empty):
+                        subscriber.get_nowait()
+
+    def _run(self):
+        while True:
+            data, _ = self._socket.recvfrom(65536)
+            try:
+                state = json.loads(data)
+                self.received += 1
+                self.publish(state)
+            except (ValueError, KeyError, TypeError) as exc:
+                print("Ignoring a malformed update:", exc)
+
+    def start(self):
+        threading.Thread(target=self._run, name="push", daemon=True).start()
+        return self
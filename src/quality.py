@@ -0,0 +1,160 @@
+"""Data-quality flags, set by monitor.py as each sample is stored.
+
+Some readings are known to be wrong the moment they arrive: the SPS30's first
+particulate reading after a start is a spike, the MH-Z19 reads low while its lamp
+warms up, the CCS811 reports 0 ppb / 400 ppm until it has burnt in, and a sensor that
+repeats the exact same float for an hour has stopped measuring. The dashboard used to
+blank the first PM value of every chart, which only hid the start-up spike when the
+chart's window happened to begin at a monitor start, and redid it on every rerun.
+
+Instead each row gets a `quality` bitmask, four bits per metric (see `bits`), and the
+`records_clean` view (compact.ensure_tiers) reads every flagged value as NULL. Readers
+go through that view, or `history` on top of it, so nothing downstream re-derives it;
+the raw value stays in `records`.
+"""
+
+import datetime
+
+WARMUP, BURN_IN, OUT_OF_RANGE, STUCK = 1, 2, 4, 8
+KINDS = {WARMUP: "warm-up", BURN_IN: "burn-in", OUT_OF_RANGE: "out of range", STUCK: "stuck"}
+
+# metric: (plausible range, valid readings to flag after a monitor start, readings of
+# the exact same value in a row that count as stuck). Ranges are the sensors' own
+# (CCS811 TVOC tops out at 1187 ppb) or physics (no room has less CO2 than outside).
+# Integer readings repeat naturally, so the CCS811 isn't checked for sticking and the
+# MH-Z19 only after two hours; nor is a reading pinned at the bottom of its range, like
+# PM at 0 in clean air.
+METRICS = {
+    "co2": ((300, 5000), 1, 24),
+    "voc": ((0, 1187), 0, None),
+    "eco2": ((400, 8192), 0, None),
+    "temp": ((-40, 85), 0, 12),
+    "hum": ((0, 100), 0, 12),
+    "pressure": ((300, 1100), 0, 12),
+    "pm1": ((0, 1000), 1, 12),
+    "pm25": ((0, 1000), 1, 12),
+    "pm4": ((0, 1000), 1, 12),
+    "pm10": ((0, 1000), 1, 12),
+}
+ALL = WARMUP | BURN_IN | OUT_OF_RANGE | STUCK
+
+
+def bits(metric, kinds=ALL, metrics=METRICS):
+    """The `quality` bits for `kinds` of one metric; 0 for a metric that isn't checked."""
+    if metric not in metrics:
+        return 0
+    return kinds << (4 * list(metrics).index(metric))
+
+
+def describe(mask, metrics=METRICS):
+    """[(metric, [kind names])] flagged in a `quality` value."""
+    mask = mask or 0
+    out = []
+    for i, metric in enumerate(metrics):
+        flags = (mask >> (4 * i)) & ALL
+        if flags:
+            out.append((metric, [name for kind, name in KINDS.items() if flags & kind]))
+    return out
+
+
+def clean(metric):
+    """SQL for `metric` from `records`, NULL where its quality bits are set."""
+    mask = bits(metric)
+    if not mask:
+        return metric
+    return f"CASE WHEN quality & {mask} THEN NULL ELSE {metric} END AS {metric}"
+
+
+def masked(reading, metrics=METRICS):
+    """A copy of a reading dict with the values its `quality` flags set to None."""
+    mask = reading.get("quality") or 0
+    return {
+        column: None if mask and mask & bits(column, ALL, metrics) else value
+        for column, value in reading.items()
+    }
+
+
+class Checks:
+    """Per-metric state for the checks that need more than the current reading."""
+
+    def __init__(self, metrics=METRICS):
+        self.metrics = metrics
+        self._seen = dict.fromkeys(metrics, 0)
+        self._last = dict.fromkeys(metrics)
+        self._repeats = dict.fromkeys(metrics, 0)
+
+    def update(self, reading):
+        """Take in one reading dict (raw values); return its `quality` bitmask."""
+        mask = 0
+        # The CCS811 pair sits at exactly 0 / 400 until it has burnt in.
+        if reading.get("voc") == 0 and reading.get("eco2") == 400:
+            mask |= bits("voc", BURN_IN, self.metrics) | bits("eco2", BURN_IN, self.metrics)
+        for metric, ((low, high), warmup, stuck_after) in self.metrics.items():
+            value = reading.get(metric)
+            if value is None or value != value:  # value != value: NaN
+                continue
+            self._seen[metric] += 1
+            if self._seen[metric] <= warmup:
+                mask |= bits(metric, WARMUP, self.metrics)
+            if not low <= value <= high:
+                mask |= bits(metric, OUT_OF_RANGE, self.metrics)
+            self._repeats[metric] = self._repeats[metric] + 1 if value == self._last[metric] else 1
+            self._last[metric] = value
+            if stuck_after and self._repeats[metric] >= stuck_after and value != low:
+                mask |= bits(metric, STUCK, self.metrics)
+        return mask
+
+
+# Rows further apart than this are taken to straddle a monitor restart when backfilling.
+RESTART_GAP = datetime.timedelta(minutes=10)
+# Rows re-read (not rewritten) before the resume point, so the stuck checks are primed.
+RESUME_ROWS = 50
+
+
+def backfill_batches(con, after_rowid=0, batch_rows=5000):
+    """Set `quality` on rows stored before monitor.py flagged them, a batch at a time.
+
+    Replays the rows in insertion order through Checks that start afresh at every new
+    session or gap, so warm-up lands on the first readings after each start. Only rows
+    whose `quality` is NULL are written. Yields (last rowid, rows set) after each
+    batch's writes and leaves committing to the caller (migrations.py), which stores
+    the rowid to resume from.
+    """
+    existing = {info[1] for info in con.execute("PRAGMA table_info(records)")}
+    columns = [c for c in METRICS if c in existing]
+    select = (
+        f"SELECT rowid, date, session_id, quality, {', '.join(columns)} FROM records "
+        "WHERE rowid > ? ORDER BY rowid LIMIT ?"
+    )
+    checks, last_session, last_date = None, None, None
+    last_rowid = max(0, after_rowid - RESUME_ROWS)
+    while True:
+        rows = con.execute(select, (last_rowid, batch_rows)).fetchall()
+        pending = []
+        for rowid, date, session_id, stored, *values in rows:
+            date = datetime.datetime.fromisoformat(date)
+            restarted = session_id != last_session or date - last_date > RESTART_GAP
+            if checks is None or restarted:
+                checks = Checks()
+            last_session, last_date = session_id, date
+            mask = checks.update(dict(zip(columns, values)))
+            if stored is None and rowid > after_rowid:
+                pending.append((mask, rowid))
+        con.executemany("UPDATE records SET quality = ? WHERE rowid = ?", pending)
+        if rows:
+            last_rowid = rows[-1][0]
+        yield last_rowid, len(pending)
+        if len(rows) < batch_rows:
+            return
+
+
+def backfill(con, batch_rows=5000):
+    """All of backfill_batches in one go, a transaction per batch; returns rows set."""
+    updated = 0
+    batches = backfill_batches(con, batch_rows=batch_rows)
+    while True:
+        with con:
+            step = next(batches, None)
+        if step is None:
+            return updated
+        updated += step[1]
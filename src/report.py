@@ -1,31 +1,176 @@
-"""Create timeseries plots for a specified time interval."""
+"""Create timeseries plots for a specified time interval.
 
+    python3 src/report.py 2023-01-22 2023-02-20 --metrics co2 temp --resolutions raw 1h
+
+The range is read from the database once, with one parameterised query for all the
+requested metrics, and aggregated once per resolution; the plots are then drawn in a
+process pool, one task per metric and resolution. Aggregated plots show the mean with
+the min-max band around it. Aggregates are cached under output/.cache, keyed by the
+range and a fingerprint of the rows in it, so redrawing an unchanged range costs one
+aggregate query instead of re-reading it. A changed range replaces its cache files.
+"""
+
+import argparse
+import datetime
+import hashlib
+import os
 import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
 import pandas as pd
+
+import archive
+from compact import HISTORY_VIEW
 from config import DB_PATH
-from datetime import datetime
-import matplotlib.pyplot as plt
 
+OUTPUT_DIR = Path(__file__).resolve().parent.parent / "output"
+DEFAULT_METRICS = ("co2", "temp", "hum", "pressure", "pm25", "voc")
+# "raw" is every stored row; the rest are pandas resample rules.
+RESOLUTIONS = ("raw", "5min", "1h", "1D")
+
+
+def _parse_day(value):
+    return datetime.datetime.strptime(value, "%Y-%m-%d")
+
+
+def _bounds(from_date, to_date):
+    # Both days inclusive; stored dates are naive local ISO strings, so >= / < work.
+    end = to_date + datetime.timedelta(days=1)
+    return from_date.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+
+
+def fingerprint(con, start, end, metrics):
+    """Cheap stand-in for "has anything in the range changed", like frames.window_version.
+
+    Row count and newest date, plus each metric's sum, so a value rewritten in place
+    (quality masking, an outdoor backfill) changes it too.
+    """
+    totals = "".join(f", TOTAL({m})" for m in sorted(metrics))
+    return con.execute(
+        f"SELECT COUNT(*), MAX(date){totals} FROM {HISTORY_VIEW} WHERE date >= ? AND date < ?",
+        (start, end),
+    ).fetchone()
+
+
+def read_range(con, start, end, metrics):
+    # Archived months from their files, only the metrics' columns; the rest from the
+    # database. Metric names are checked against the schema before they get here.
+    parts = []
+    for part_start, part_end, source in archive.segments(_parse_day(start), _parse_day(end)):
+        if source is not None:
+            parts.append(archive.read(source, metrics, part_start, part_end))
+            continue
+        df = pd.read_sql_query(
+            f"SELECT date, {', '.join(metrics)} FROM {HISTORY_VIEW} "
+            "WHERE date >= ? AND date < ? ORDER BY date",
+            con,
+            params=(f"{part_start:%Y-%m-%d %H:%M:%S}", f"{part_end:%Y-%m-%d %H:%M:%S}"),
+        )
+        df["date"] = pd.to_datetime(df["date"], format="ISO8601")
+        parts.append(df)
+    df = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+    return df.set_index("date").apply(pd.to_numeric, errors="coerce")
+
+
+def aggregate(df, resolution):
+    """Mean, min and max per bucket, named like records_hourly: co2, co2_min, co2_max."""
+    if resolution == "raw":
+        return df
+    buckets = df.resample(resolution)
+    parts = [buckets.mean(), buckets.min().add_suffix("_min"), buckets.max().add_suffix("_max")]
+    return pd.concat(parts, axis=1).dropna(how="all")
+
+
+def load_aggregates(con, start, end, metrics, resolutions, cache_dir):
+    """{resolution: frame}, from the cache where the range is unchanged since last time.
+
+    Files are named range_resolution_metrics_fingerprint; writing one deletes the
+    files it supersedes, those for the same range, resolution and metrics.
+    """
+    metrics_digest = hashlib.sha1(repr(sorted(metrics)).encode()).hexdigest()[:8]
+    key = repr(fingerprint(con, start, end, metrics))
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    prefixes = {r: f"{start}_{end}_{r}_{metrics_digest}_" for r in resolutions}
+    paths = {r: cache_dir / f"{prefixes[r]}{digest}.pkl" for r in resolutions}
+    frames = {r: pd.read_pickle(p) for r, p in paths.items() if p.exists()}
+    missing = [r for r in resolutions if r not in frames]
+    if missing:
+        df = read_range(con, start, end, metrics)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        for resolution in missing:
+            frames[resolution] = aggregate(df, resolution)
+            frames[resolution].to_pickle(paths[resolution])
+            for stale in cache_dir.glob(f"{prefixes[resolution]}*.pkl"):
+                if stale != paths[resolution]:
+                    stale.unlink(missing_ok=True)
+    return frames
+
+
+def plot_metric(task):
+    """Draw one metric at one resolution. Runs in a worker process."""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    metric, resolution, frame, path = task
+    fig, ax = plt.subplots(figsize=(20, 5))
+    ax.plot(frame.index, frame[metric], linewidth=0.8 if resolution == "raw" else 1.5)
+    if f"{metric}_min" in frame:
+        ax.fill_between(
+            frame.index, frame[f"{metric}_min"], frame[f"{metric}_max"], alpha=0.25, linewidth=0
+        )
+    ax.set_ylabel(metric)
+    ax.set_title(f"{metric} ({resolution})")
+    fig.savefig(path, bbox_inches="tight")
+    plt.close(fig)
+    return path
 
-from_date = "22/01/2023"
-to_date = "20/02/2023" # None
 
-from_date = datetime.strptime(from_date, "%d/%m/%Y")
-to_date = datetime.strptime(to_date, "%d/%m/%Y") if to_date else datetime.now()
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("from_date", type=_parse_day, help="first day, YYYY-MM-DD")
+    parser.add_argument(
+        "to_date", type=_parse_day, nargs="?", default=datetime.datetime.now(),
+        help="last day, YYYY-MM-DD (default: today)",
+    )
+    parser.add_argument("--metrics", nargs="+", default=list(DEFAULT_METRICS))
+    parser.add_argument("--resolutions", nargs="+", default=["raw"], choices=RESOLUTIONS)
+    parser.add_argument("--out", type=Path, default=OUTPUT_DIR)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args(argv)
 
-print(from_date, to_date)
-# delta_days = (to_date - from_date + 1) * 60 * 24
+    start, end = _bounds(args.from_date, args.to_date)
+    with sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True) as con:
+        known = {info[1] for info in con.execute(f"PRAGMA table_info({HISTORY_VIEW})")}
+        unknown = sorted(set(args.metrics) - known)
+        if unknown:
+            parser.error(f"unknown metrics: {', '.join(unknown)}")
+        frames = load_aggregates(
+            con, start, end, args.metrics, args.resolutions, args.out / ".cache"
+        )
 
-con = sqlite3.connect(DB_PATH, detect_types=sqlite3.PARSE_DECLTYPES)
-df = pd.read_sql_query(f'SELECT *, date as "[timestamp]" FROM records WHERE date > "{from_date}" and date <= "{to_date}" ORDER BY date DESC', con)
-# # Transform the date to a localised datetime.
-df['date'] = pd.to_datetime(df['date'])
-df["date"] = df["date"].dt.tz_localize("Europe/Brussels")
+    # Each task ships only its own columns to the worker, not the whole range.
+    tasks = [
+        (
+            metric,
+            resolution,
+            frame[[c for c in (metric, f"{metric}_min", f"{metric}_max") if c in frame]],
+            args.out / f"{metric}_{resolution}_{start}_{args.to_date:%Y-%m-%d}.png",
+        )
+        for resolution, frame in frames.items()
+        if not frame.empty
+        for metric in args.metrics
+    ]
+    if not tasks:
+        print("No measurements in", start, "to", f"{args.to_date:%Y-%m-%d}")
+        return
+    args.out.mkdir(parents=True, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for path in pool.map(plot_metric, tasks):
+            print(path)
 
-def plot_metric(df: pd.DataFrame, metric: str) -> None:
-    plt.figure(figsize=(20,5))
-    plt.plot(df["date"], df[metric])
-    plt.ylabel(metric)
-    plt.savefig(f"/home/pi/Documents/rpi-airquality/output/{metric}_over_time.jpg")
 
-plot_metric(df, "co2")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Which room each session was recorded in, and the measurements per room.
+
+monitor.py starts a session on every start, and the dashboard's "Room" box names the
+room of the latest one in `sessions.location`. That table has a row per start, so it is
+the map from session to room: a room's rows are the ones whose session_id is in its
+list, which the session_id indexes (migration 6, compact.ensure_tiers) turn into a
+lookup per session instead of a scan of every row joined against `sessions`.
+
+Sessions from before monitor.py numbered them properly (it read the first session
+rather than the latest) all share session 1, so they go together under one room.
+"""
+
+from compact import CLEAN_VIEW, HOURLY_TABLE
+from summary import CO2_WARN
+
+# Columns averaged per room, besides the CO2 hours and the PM2.5 peak.
+MEAN_COLUMNS = ("co2", "temp", "hum", "pm25")
+
+
+def current(con):
+    """(session_id, room) of the latest session, room "" if unnamed; None before any."""
+    return con.execute(
+        "SELECT session_id, COALESCE(location, '') FROM sessions "
+        "ORDER BY session_id DESC, rowid DESC LIMIT 1"
+    ).fetchone()
+
+
+def assign(con, room, session_id=None):
+    """Name the room of `session_id`, by default the latest session."""
+    if session_id is None:
+        session_id = current(con)[0]
+    with con:
+        con.execute(
+            "UPDATE sessions SET location = ? WHERE session_id = ?", (room.strip(), session_id)
+        )
+
+
+def sessions_by_room(con):
+    """{room: [session ids]} for the sessions with a room, rooms in order of first use."""
+    rooms = {}
+    for session_id, room in con.execute(
+        "SELECT DISTINCT session_id, location FROM sessions "
+        "WHERE location IS NOT NULL AND location != '' ORDER BY session_id"
+    ):
+        rooms.setdefault(room, []).append(session_id)
+    return rooms
+
+
+def in_sessions(sessions):
+    """The WHERE clause and parameters selecting the rows of `sessions`."""
+    return f"session_id IN ({', '.join('?' * len(sessions))})", tuple(sessions)
+
+
+def _hours(sessions):
+    # Both tiers as one row per hour: the raw rows grouped by hour (stored dates are
+    # naive local ISO strings, so the first 13 characters name it), the compacted ones
+    # as stored. Compaction cuts on hour boundaries, so no hour is in both.
+    where, params = in_sessions(sessions)
+    means = ", ".join(f"AVG({c}) AS {c}" for c in MEAN_COLUMNS)
+    stored = ", ".join(MEAN_COLUMNS)
+    return (
+        f"SELECT COUNT(*) AS samples, {means}, MAX(pm25) AS pm25_max FROM {CLEAN_VIEW} "
+        f"WHERE {where} GROUP BY substr(date, 1, 13) "
+        f"UNION ALL SELECT samples, {stored}, pm25_max FROM {HOURLY_TABLE} WHERE {where}",
+        params * 2,
+    )
+
+
+def aggregates(con, rooms=None):
+    """Per room: hours recorded, means weighted by samples, CO2 hours and the PM2.5 peak.
+
+    A CO2 hour is one whose mean is over summary.CO2_WARN. Returns a dict per room, in
+    the order of `rooms` ({room: [session ids]}, by default sessions_by_room()).
+    """
+    if rooms is None:
+        rooms = sessions_by_room(con)
+    means = ", ".join(
+        f"SUM({c} * samples) / SUM(CASE WHEN {c} IS NOT NULL THEN samples END)"
+        for c in MEAN_COLUMNS
+    )
+    out = []
+    for room, sessions in rooms.items():
+        hours, params = _hours(sessions)
+        row = con.execute(
+            f"SELECT COUNT(*), {means}, COUNT(CASE WHEN co2 > ? THEN 1 END), MAX(pm25_max) "
+            f"FROM ({hours})",
+            (CO2_WARN, *params),
+        ).fetchone()
+        hours_recorded, *values, co2_hours, pm25_max = row
+        out.append(
+            {
+                "room": room,
+                "hours": hours_recorded,
+                **dict(zip(MEAN_COLUMNS, values)),
+                "co2_hours": co2_hours,
+                "pm25_max": pm25_max,
+            }
+        )
+    return out
+
@@ -0,0 +1,185 @@
+"""Declarative alert rules: evaluated per sample by monitor.py, backtested here.
+
+A rule (see RULES in config.py) watches one value -- a metric, or the difference of two
+written "temp - out_temp" -- and has two lists of conditions, all of which must hold:
+
+- "fire": notify, if the rule is armed, and disarm it;
+- "rearm": arm it again. Keeping this away from "fire" is the hysteresis that stops a
+  value hovering on a threshold from notifying every five minutes.
+
+Conditions are (op, threshold) with op one of <, <=, >, >= or the same prefixed with
+"abs" to compare the magnitude. "cooldown_minutes" (default 0) additionally mutes a
+rule for that long after it notified. "title" and "message" are format strings over
+the reading's columns plus `value`.
+
+A missing reading leaves a rule as it was: the watched value, or any column the title
+or message shows. A sample matching both lists counts as "fire".
+
+Backtest: python3 src/rules.py [--from YYYY-MM-DD] [--to YYYY-MM-DD]
+
+replays the stored history through the same rules, with the same condition code
+applied to whole columns at once instead of sample by sample, and reports how many
+notifications each rule would have sent.
+"""
+
+import argparse
+import datetime
+import operator
+import sqlite3
+import string
+import time
+
+from config import DB_PATH, RULES
+
+OPS = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge}
+
+
+def matches(conditions, value):
+    """Whether `value` meets every condition. Works on a number or a NumPy array."""
+    result = True
+    for op, threshold in conditions:
+        if op.startswith("abs"):
+            result = result & OPS[op[3:]](abs(value), threshold)
+        else:
+            result = result & OPS[op](value, threshold)
+    return result
+
+
+class Rule:
+    """One rule from config, with its armed/cooldown state."""
+
+    def __init__(self, spec):
+        self.name = spec["name"]
+        self.operands = tuple(spec["value"].split(" - "))
+        self.fire = spec["fire"]
+        self.rearm = spec.get("rearm", [])
+        self.cooldown = datetime.timedelta(minutes=spec.get("cooldown_minutes", 0))
+        self.title = spec["title"]
+        self.message = spec["message"]
+        if len(self.operands) > 2:
+            raise ValueError(f"rule {self.name}: value must be 'a' or 'a - b'")
+        for op, _ in self.fire + self.rearm:
+            if op.removeprefix("abs") not in OPS:
+                raise ValueError(f"rule {self.name}: unknown condition {op!r}")
+        # Columns the title and message show, other than `value`.
+        self.fields = {
+            name
+            for text in (self.title, self.message)
+            for _, name, _, _ in string.Formatter().parse(text)
+            if name and name != "value"
+        }
+        self.armed = True
+        self.last_sent = None
+
+    def value(self, reading):
+        """The watched value from a reading dict, or whole columns from a DataFrame."""
+        values = [reading.get(name) for name in self.operands]
+        if any(v is None for v in values):
+            return None
+        return values[0] - values[1] if len(values) == 2 else values[0]
+
+    def update(self, reading):
+        """Take in one `records` row as a dict; return (title, message) to send, or None."""
+        value = self.value(reading)
+        if value is None or any(reading.get(name) is None for name in self.fields):
+            return None
+        if matches(self.fire, value):
+            if not self.armed:
+                return None
+            self.armed = False
+            now = reading["date"]
+            if self.last_sent is not None and now - self.last_sent < self.cooldown:
+                return None
+            self.last_sent = now
+            return self.title, self.message.format(value=value, **reading)
+        if matches(self.rearm, value):
+            self.armed = True
+        return None
+
+
+def load(specs=RULES):
+    return [Rule(spec) for spec in specs]
+
+
+def backtest(df, rule):
+    """Dates at which `rule` would have notified, over a DataFrame of readings.
+
+    The armed state only changes on samples that match "fire" or "rearm", and a fire
+    only notifies when the previous such sample was a rearm (or there was none). So
+    keep those samples, and a notification is a fire not preceded by another fire.
+    """
+    import numpy as np
+
+    value = rule.value(df)
+    if value is None:
+        return np.array([], dtype="datetime64[ns]")
+    present = value.notna()
+    for name in rule.fields & set(df.columns):
+        present &= df[name].notna()
+    present = present.to_numpy()
+    values = value.to_numpy()[present]
+    dates = df["date"].to_numpy()[present]
+    fire = np.broadcast_to(matches(rule.fire, values), values.shape)
+    rearm = np.broadcast_to(matches(rule.rearm, values), values.shape)
+    kind = fire[fire | rearm]
+    notified = dates[fire | rearm][kind & ~np.concatenate(([False], kind[:-1]))]
+    if not rule.cooldown:
+        return notified
+    # Only the (few) notifications are left to walk through.
+    kept = []
+    for when in notified:
+        if not kept or when - kept[-1] >= np.timedelta64(rule.cooldown):
+            kept.append(when)
+    return np.array(kept, dtype=notified.dtype)
+
+
+def read_history(con, columns, start=None, end=None):
+    import pandas as pd
+
+    from compact import HISTORY_VIEW
+
+    sql = f"SELECT date, {', '.join(columns)} FROM {HISTORY_VIEW} WHERE date >= ?"
+    params = [start or ""]
+    if end:
+        sql += " AND date < ?"
+        params.append(end)
+    df = pd.read_sql_query(sql + " ORDER BY date", con, params=params)
+    df["date"] = pd.to_datetime(df["date"], format="ISO8601")
+    return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest the alert rules in config.py.")
+    parser.add_argument("--from", dest="start", help="first day, YYYY-MM-DD")
+    parser.add_argument("--to", dest="end", help="last day, YYYY-MM-DD")
+    args = parser.parse_args(argv)
+    end = None
+    if args.end:
+        end = (datetime.date.fromisoformat(args.end) + datetime.timedelta(days=1)).isoformat()
+
+    started = time.perf_counter()
+    rules = load()
+    with sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True) as con:
+        known = {info[1] for info in con.execute("PRAGMA table_info(records)")}
+        columns = sorted({n for rule in rules for n in (*rule.operands, *rule.fields)} & known)
+        df = read_history(con, columns, args.start, end)
+    if df.empty:
+        print("No measurements in that range.")
+        return
+    days = max((df["date"].iloc[-1] - df["date"].iloc[0]).days, 1)
+    print(f"{len(df)} readings, {df['date'].iloc[0]:%Y-%m-%d} to {df['date'].iloc[-1]:%Y-%m-%d}")
+    for rule in rules:
+        missing = set(rule.operands) - known
+        if missing:
+            print(f"{rule.name:<20} skipped: {', '.join(sorted(missing))} isn't stored")
+            continue
+        sent = backtest(df, rule)
+        line = f"{rule.name:<20} {len(sent):>5} notifications, {len(sent) / days:.2f}/day"
+        if len(sent):
+            line += f", last {str(sent[-1])[:16].replace('T', ' ')}"
+        print(line)
+    print(f"({time.perf_counter() - started:.2f} s)")
+
+
+if __name__ == "__main__":
+    main()
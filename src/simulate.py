@@ -0,0 +1,398 @@
+"""Run monitor.py's sampling loop off the Pi, on synthetic or recorded readings.
+
+    python3 src/simulate.py --days 365                    # a simulated year
+    python3 src/simulate.py --replay --from 2024-06-01    # the stored readings again
+    python3 src/simulate.py --days 2 --speed 600          # paced at 600x real time
+
+Everything after the sensor read is monitor.run itself -- quality flags, anomaly
+detectors, header snapshot, thermal model, live buffer, alert rules -- writing to a
+fresh database in a temporary directory (or --db). Open-Meteo and ntfy are stood in
+for by a local HTTP server, so the requests are real but stay on the machine; it
+serves the simulation's (or the recording's) outdoor weather and a forecast that
+turns out right, and keeps the notifications. By default samples come as fast as
+the loop takes them; the report gives the throughput and the per-sample latency,
+from the read to committed and alerted.
+
+The simulator is a single room with two occupants: a daily and yearly outdoor cycle,
+heating and sun, CO2 building up while people are home and decaying when a window is
+opened, cooking spikes in TVOC and particulates, and the odd failed sensor read.
+--replay plays back `records`, which only holds the last RAW_RETENTION_DAYS at full
+resolution (compact.py rolls older rows up), with its own outdoor values.
+"""
+
+import argparse
+import collections
+import datetime
+import functools
+import http.server
+import json
+import math
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+import urllib.parse
+from contextlib import redirect_stdout
+from pathlib import Path
+
+import checkpoints
+import monitor
+from config import DB_PATH
+from outdoor import OUTDOOR
+from utils import send_notification
+
+INDOOR = ("co2", "voc", "eco2", "temp", "hum", "pressure", "pm1", "pm25", "pm4", "pm10")
+FORECAST_HOURS = 48
+
+
+class StandIn(http.server.ThreadingHTTPServer):
+    """Local Open-Meteo and ntfy: serves `current` and `hourly`, keeps what is POSTed.
+
+    A request for a date range (outdoor.py's) is answered from `history`, a function
+    of the hour giving Open-Meteo names -> values.
+    """
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.url = f"http://127.0.0.1:{self.server_address[1]}"
+        self.current = {}  # Open-Meteo names -> values, set by the backend per sample
+        self.hourly = None
+        self.history = lambda hour: {}
+        self.requests = 0
+        self.notifications = []  # (title, message)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def set_weather(self, outdoor, forecast=None):
+        """Serve these `out_*` values (and, when given, hourly temperatures) from now on."""
+        self.current = {OUTDOOR[column]: value for column, value in outdoor.items()}
+        if forecast is not None:
+            self.hourly = forecast
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests += 1
+        path, query = urllib.parse.urlsplit(self.path)[2:4]
+        query = urllib.parse.parse_qs(query)
+        if "start_date" in query and path in ("/v1/forecast", "/v1/archive", "/v1/air-quality"):
+            self._reply({"hourly": self._history(query)})
+        elif path == "/v1/forecast":
+            self._reply({"current": self.server.current, "hourly": self.server.hourly})
+        elif path == "/v1/air-quality":
+            self._reply({"current": self.server.current})
+        else:
+            self.send_error(404)
+
+    def _history(self, query):
+        first = datetime.datetime.fromisoformat(query["start_date"][0])
+        last = datetime.datetime.fromisoformat(query["end_date"][0])
+        days = (last - first).days + 1
+        hours = [first + datetime.timedelta(hours=h) for h in range(24 * days)]
+        names = query["hourly"][0].split(",")
+        values = [self.server.history(hour) for hour in hours]
+        return {
+            "time": [hour.strftime("%Y-%m-%dT%H:%M") for hour in hours],
+            **{name: [v.get(name) for v in values] for name in names},
+        }
+
+    def do_POST(self):
+        message = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.notifications.append((self.headers["Title"], message.decode("utf-8")))
+        self._reply({})
+
+    def _reply(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _forecast(day, temperature):
+    """An Open-Meteo `hourly` block for FORECAST_HOURS from midnight of `day`."""
+    start = datetime.datetime.combine(day, datetime.time())
+    times = [start + datetime.timedelta(hours=h) for h in range(FORECAST_HOURS)]
+    return {
+        "time": [t.strftime("%Y-%m-%dT%H:%M") for t in times],
+        "temperature_2m": [temperature(t) for t in times],
+    }
+
+
+class Simulator:
+    """Synthetic readings every `interval` seconds over `days`, from `start`."""
+
+    def __init__(self, stand_in, start, days, interval=300, seed=0):
+        self.stand_in = stand_in
+        self.poll_seconds = interval
+        self.now = start
+        self.end = start + datetime.timedelta(days=days)
+        self.rng = random.Random(seed)
+        self.day = None
+        self.weather = 0.0  # slow outdoor anomaly on top of the seasonal curve, °C
+        self.temp, self.co2, self.hum, self.pressure = 20.0, 600.0, 50.0, 1013.0
+        self.voc, self.pm, self.wind_dir = 50.0, 0.0, 200.0
+        self.window = 0  # samples left with the window open
+
+    @staticmethod
+    def normal_outdoor(when):
+        """Seasonal plus daily outdoor temperature, °C; coldest mid-January and 04:00."""
+        day = when.timetuple().tm_yday
+        hour = when.hour + when.minute / 60
+        return 11 - 7 * math.cos(2 * math.pi * (day - 15) / 365) + 4 * math.sin(
+            2 * math.pi * (hour - 10) / 24
+        )
+
+    def read(self):
+        if self.now >= self.end:
+            return None
+        rng, now = self.rng, self.now
+        hours = self.poll_seconds / 3600
+        hour = now.hour + now.minute / 60
+        home = now.weekday() >= 5 or not 8 <= hour < 18
+        cooking = home and (12.5 <= hour < 13 or 19 <= hour < 19.75) and rng.random() < 0.5
+
+        self.weather += (rng.gauss(0, 1.5) - self.weather) * hours / 48
+        out_temp = self.normal_outdoor(now) + self.weather
+        out_pm25 = max(2.0, 8 + 4 * math.sin(2 * math.pi * hour / 24) + rng.gauss(0, 1))
+        forecast = None
+        if self.day != now.date():
+            self.day = now.date()
+            offset = self.weather
+            forecast = _forecast(self.day, lambda t: round(self.normal_outdoor(t) + offset, 1))
+
+        # A window goes open when CO2 gets stuffy and stays open 10-30 minutes.
+        if self.window:
+            self.window -= 1
+        elif home and self.co2 > 1100 and rng.random() < 0.3:
+            self.window = rng.randint(2, 6)
+        open_ = 1.0 if self.window else 0.0
+        exchange = 0.05 + 0.6 * open_
+        sun = 0.4 * max(0.0, math.sin(2 * math.pi * (hour - 6) / 24))
+        heating = 1.5 if self.temp < 19 and 7 <= hour < 23 and not open_ else 0.0
+        self.temp += (exchange * (out_temp - self.temp) + sun + heating) * hours
+        self.temp += rng.gauss(0, 0.02)
+        ach = 0.3 + 4 * open_
+        self.co2 += (400 * 2 * home - ach * (self.co2 - 420)) * hours
+        self.hum += (45 + 5 * home + 10 * cooking - 10 * open_ - self.hum) * hours
+        self.pressure = min(1040.0, max(985.0, self.pressure + rng.gauss(0, 0.2)))
+        self.voc = max(0.0, self.voc + (50 + 600 * cooking - self.voc) * min(1, 2 * hours))
+        self.pm += (20 * cooking - self.pm) * min(1, 2 * hours)
+        self.wind_dir = (self.wind_dir + rng.gauss(0, 10)) % 360
+        pm25 = 0.5 * out_pm25 + self.pm + abs(rng.gauss(0, 0.5))
+
+        self.stand_in.set_weather(
+            {
+                "out_temp": round(out_temp, 1),
+                "out_hum": round(min(100.0, max(30.0, 80 - 2 * self.weather)), 0),
+                "out_pressure": round(self.pressure - 5, 1),
+                "out_wind_speed": round(abs(12 + rng.gauss(0, 4)), 1),
+                "out_wind_dir": round(self.wind_dir),
+                "out_pm25": round(out_pm25, 1),
+                "out_pm10": round(1.6 * out_pm25, 1),
+            },
+            forecast,
+        )
+        self.now += datetime.timedelta(seconds=self.poll_seconds)
+        voc = max(0, round(self.voc + rng.gauss(0, 5)))
+        return {
+            "date": now,
+            # The MH-Z19 fails a read now and then.
+            "co2": None if rng.random() < 0.002 else round(self.co2 + rng.gauss(0, 10)),
+            "voc": voc,
+            "eco2": 400 + 2 * voc,
+            "temp": round(self.temp, 2),
+            "hum": round(self.hum + rng.gauss(0, 0.3), 2),
+            "pressure": round(self.pressure + rng.gauss(0, 0.05), 2),
+            "pm1": round(0.8 * pm25, 1),
+            "pm25": round(pm25, 1),
+            "pm4": round(1.1 * pm25, 1),
+            "pm10": round(1.2 * pm25, 1),
+        }
+
+    def wait(self):
+        pass
+
+
+class Replay:
+    """Stored `records` rows, oldest first, with their own outdoor values as the weather."""
+
+    poll_seconds = monitor.POLL_FREQUENCY_SECONDS
+
+    def __init__(self, source, stand_in, start=None, end=None):
+        self.stand_in = stand_in
+        existing = {info[1] for info in source.execute("PRAGMA table_info(records)")}
+        self.indoor = [c for c in INDOOR if c in existing]
+        self.outdoor = [c for c in OUTDOOR if c in existing]
+        where, params = "WHERE date >= ?", [start or ""]
+        if end:
+            where += " AND date < ?"
+            params.append(end)
+        # The forecast that turns out right: hourly means of the recorded out_temp.
+        self.hourly = {}
+        if "out_temp" in existing:
+            self.hourly = dict(
+                source.execute(
+                    f"SELECT substr(date, 1, 13), AVG(out_temp) FROM records {where} "
+                    "GROUP BY substr(date, 1, 13)",
+                    params,
+                )
+            )
+        self.rows = source.execute(
+            f"SELECT {', '.join(['date'] + self.indoor + self.outdoor)} FROM records "
+            f"{where} ORDER BY date",
+            params,
+        )
+        self.day = None
+
+    def read(self):
+        row = self.rows.fetchone()
+        if row is None:
+            return None
+        now = datetime.datetime.fromisoformat(row[0])
+        forecast = None
+        if self.day != now.date():
+            self.day = now.date()
+            forecast = _forecast(
+                self.day, lambda t: self.hourly.get(t.strftime("%Y-%m-%d %H"))
+            )
+        self.stand_in.set_weather(
+            dict(zip(self.outdoor, row[1 + len(self.indoor) :])), forecast
+        )
+        return {"date": now, **dict(zip(self.indoor, row[1 : 1 + len(self.indoor)]))}
+
+    def wait(self):
+        pass
+
+
+class Clocked:
+    """Wraps a backend: times each sample and paces them at `speed` x real time (0: flat out)."""
+
+    def __init__(self, backend, speed=0):
+        self.backend = backend
+        self.speed = speed
+        self.poll_seconds = backend.poll_seconds
+        self.latencies = []
+        self.first = self.last = None
+        self._started = None
+
+    def read(self):
+        reading = self.backend.read()
+        self._started = time.perf_counter()
+        if reading is not None:
+            self.first = self.first or reading["date"]
+            self.last = reading["date"]
+        return reading
+
+    def wait(self):
+        latency = time.perf_counter() - self._started
+        self.latencies.append(latency)
+        self.backend.wait()
+        if self.speed:
+            time.sleep(max(0.0, self.poll_seconds / self.speed - latency))
+
+
+def _percentile(ordered, share):
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--replay", action="store_true", help="play back stored records")
+    parser.add_argument("--from", dest="start", help="replay from this day, YYYY-MM-DD")
+    parser.add_argument("--to", dest="end", help="replay up to this day, YYYY-MM-DD")
+    parser.add_argument("--days", type=float, default=30, help="days to simulate")
+    parser.add_argument("--interval", type=int, default=monitor.POLL_FREQUENCY_SECONDS,
+                        help="seconds between simulated samples")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--speed", type=float, default=0,
+                        help="times real time; 0 (default) runs flat out")
+    parser.add_argument("--db", type=Path, help="database to write (default: a fresh one)")
+    parser.add_argument("--checkpoint-seconds", type=float, default=1.0,
+                        help="checkpoint interval, in real seconds")
+    args = parser.parse_args(argv)
+
+    workdir = Path(tempfile.mkdtemp(prefix="airquality-simulate-"))
+    db = args.db or workdir / "airquality.db"
+    if db.resolve() == Path(DB_PATH).resolve():
+        parser.error("--db must not be the real database")
+    stand_in = StandIn().start()
+    source = None
+    if args.replay:
+        source = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)
+        end = None
+        if args.end:
+            end = (datetime.date.fromisoformat(args.end) + datetime.timedelta(days=1)).isoformat()
+        backend = Replay(source, stand_in, args.start, end)
+    else:
+        # Ending today, so the result looks current to the dashboard.
+        start = datetime.datetime.combine(datetime.date.today(), datetime.time())
+        backend = Simulator(
+            stand_in, start - datetime.timedelta(days=args.days), args.days, args.interval,
+            args.seed,
+        )
+    sensors = Clocked(backend, args.speed)
+
+    con = monitor.open_database(db)
+    checkpointer = checkpoints.Checkpointer(
+        db, args.checkpoint_seconds, health_path=workdir / "health.json"
+    ).start()
+    log = workdir / "monitor.log"
+    started = time.perf_counter()
+    with open(log, "w") as out, redirect_stdout(out):
+        samples = monitor.run(
+            con,
+            sensors,
+            weather=functools.partial(monitor.read_weather, stand_in.url, stand_in.url),
+            notify=functools.partial(send_notification, server=stand_in.url, topic="simulate"),
+            live_path=workdir / "live",
+            checkpointer=checkpointer,
+        )
+    elapsed = time.perf_counter() - started
+    con.close()
+    if source:
+        source.close()
+    stand_in.shutdown()
+
+    if not samples:
+        print("No readings to run.")
+        return
+    span = (sensors.last - sensors.first).total_seconds() + sensors.poll_seconds
+    latencies = sorted(sensors.latencies)
+    print(
+        f"{samples} samples, {sensors.first:%Y-%m-%d %H:%M} to {sensors.last:%Y-%m-%d %H:%M}, "
+        f"in {elapsed:.1f} s: {samples / elapsed:.0f} samples/s, "
+        f"{span / elapsed:.0f}x real time"
+    )
+    print(
+        "latency ms: "
+        + ", ".join(
+            f"{name} {1000 * _percentile(latencies, share):.2f}"
+            for name, share in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1))
+        )
+    )
+    titles = collections.Counter(title for title, _ in stand_in.notifications)
+    print(
+        f"{len(stand_in.notifications)} notifications"
+        + "".join(f"\n  {count:>5}  {title}" for title, count in titles.most_common())
+    )
+    health = checkpointer.stats
+    print(
+        f"WAL up to {health['max_wal_bytes'] / 1024:.0f} kB; "
+        f"{health['checkpoints']} checkpoints ({health['checkpoints_busy']} busy, "
+        f"slowest {1000 * health['max_checkpoint_seconds']:.1f} ms); "
+        f"{health['lock_waits']} lock waits "
+        f"(longest {1000 * health['max_lock_wait_seconds']:.1f} ms)"
+    )
+    print(f"{stand_in.requests} weather requests; database {db}, monitor output {log}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""The dashboard header's numbers, kept up to date by monitor.py as samples land.
+
+The header needs the latest reading, the last 24 hours' temperature extremes and the
+TVOC baseline. Working those out on every page view means a 24h query, a pandas
+normalisation and a median pass per rerun, for numbers that only change once every
+five minutes. monitor.py instead keeps a Snapshot running, and writes its state to the
+one-row `current` table in the same transaction as the sample, so the dashboard reads a
+single row.
+"""
+
+import datetime
+import json
+import sqlite3
+from collections import deque
+
+from compact import CLEAN_VIEW
+from utils import baseline_deviation
+
+WINDOW = datetime.timedelta(hours=24)
+
+
+def _as_datetime(value):
+    # sqlite hands stored timestamps back as the ISO strings they were written as.
+    return datetime.datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+class Snapshot:
+    """Latest reading plus running 24h temperature extremes and TVOC baseline.
+
+    The extremes use monotonic deques: each holds only the readings that can still
+    become the window's minimum (or maximum), so adding a sample and dropping the ones
+    that aged out is O(1) amortised instead of a scan of the day. Ties keep the earlier
+    reading, as pandas' idxmin/idxmax did.
+    """
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self.reading = None
+        self._lows = deque()  # (date, temp), temps increasing
+        self._highs = deque()  # (date, temp), temps decreasing
+        self._voc = deque()  # (date, voc)
+
+    def add(self, reading):
+        """Take in one `records` row as a dict."""
+        reading = dict(reading, date=_as_datetime(reading["date"]))
+        self.reading = reading
+        now = reading["date"]
+        temp, voc = reading.get("temp"), reading.get("voc")
+        if temp is not None:
+            while self._lows and self._lows[-1][1] > temp:
+                self._lows.pop()
+            self._lows.append((now, temp))
+            while self._highs and self._highs[-1][1] < temp:
+                self._highs.pop()
+            self._highs.append((now, temp))
+        if voc is not None:
+            self._voc.append((now, voc))
+
+        oldest = now - self.window
+        for samples in (self._lows, self._highs, self._voc):
+            while samples and samples[0][0] < oldest:
+                samples.popleft()
+
+    def state(self):
+        """JSON-ready dict of everything the header shows."""
+        if self.reading is None:
+            return None
+        reading = dict(self.reading, date=self.reading["date"].isoformat(sep=" "))
+        state = {"reading": reading}
+        if self._lows:
+            (low_at, low), (high_at, high) = self._lows[0], self._highs[0]
+            state.update(
+                temp_min=low, temp_min_at=low_at.isoformat(sep=" "),
+                temp_max=high, temp_max_at=high_at.isoformat(sep=" "),
+            )
+        voc = reading.get("voc")
+        deviation = (
+            baseline_deviation([v for _, v in self._voc], voc) if voc is not None else None
+        )
+        if deviation is not None:
+            state["voc_baseline"], state["voc_deviation"] = deviation
+        return state
+
+
+def rebuild(con, now=None):
+    """Replay the last 24h of `records` into a fresh Snapshot.
+
+    Used once when monitor.py starts, so the header is right straight after a restart,
+    and by the dashboard when the monitor has not written a snapshot yet.
+    """
+    now = now or datetime.datetime.now()
+    snapshot = Snapshot()
+    cur = con.execute(
+        f"SELECT * FROM {CLEAN_VIEW} WHERE date >= ? ORDER BY date",
+        ((now - snapshot.window).strftime("%Y-%m-%d %H:%M:%S"),),
+    )
+    columns = [d[0] for d in cur.description]
+    for row in cur:
+        snapshot.add(dict(zip(columns, row)))
+    if snapshot.reading is None:
+        # Nothing in the last day, but the header still wants to show how stale it is.
+        cur = con.execute(f"SELECT * FROM {CLEAN_VIEW} ORDER BY date DESC LIMIT 1")
+        columns = [d[0] for d in cur.description]
+        if (row := cur.fetchone()) is not None:
+            snapshot.add(dict(zip(columns, row)))
+    return snapshot
+
+
+def ensure_table(con):
+    con.execute(
+        "CREATE TABLE IF NOT EXISTS current "
+        "(id integer PRIMARY KEY CHECK (id = 0), state text)"
+    )
+
+
+def write(con, snapshot):
+    """Replace the stored snapshot. Doesn't commit: it belongs with the sample's insert."""
+    con.execute(
+        "INSERT OR REPLACE INTO current (id, state) VALUES (0, ?)",
+        (json.dumps(snapshot.state()),),
+    )
+
+
+def read(con):
+    """The stored snapshot state, or None when monitor.py has not written one yet."""
+    try:
+        row = con.execute("SELECT state FROM current").fetchone()
+    except sqlite3.OperationalError:  # monitor.py hasn't created the table yet.
+        return None
+    return json.loads(row[0]) if row and row[0] else None
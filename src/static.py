@@ -0,0 +1,251 @@
+"""The dashboard's front page as static files, for any web server to hand out.
+
+Streamlit reruns the whole script -- SQLite reads, pandas, Altair -- for every visitor
+and every refresh, which keeps a Pi Zero busy for seconds per page view. What most
+views want is the same each time: the current cards, the last 24 hours and the last
+7 days. render() builds exactly those with the dashboard's own builders (charts.py)
+once per new sample, and writes
+
+    OUT_DIR/index.html            the cards, and a slot per chart
+    OUT_DIR/charts/<name>.json    one Vega-Lite spec per chart, data included
+
+The page draws the specs in the browser with vega-embed (from a CDN). With api.py
+running it takes live updates from its /events stream (see push.py), appending each
+new sample to the 24h charts; otherwise it reloads itself every REFRESH_SECONDS. Every file is written under a temporary name and
+renamed, so a visitor never gets half of one; index.html goes last, so the charts
+it points at are always there.
+
+With config.STATIC_DIR set, monitor.py starts a render after each sample (a Renderer);
+or run it from cron, or on its own timer:
+    python3 src/static.py OUT_DIR [--every SECONDS]
+and serve OUT_DIR, e.g. `python3 -m http.server -d OUT_DIR 8000`.
+"""
+
+import argparse
+import datetime
+import html
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import cards
+from config import API_PORT, STATIC_DIR
+
+# Reload the whole page this often without live updates (api.py not running), and
+# with them, for the 7-day charts.
+REFRESH_SECONDS = 60
+LIVE_REFRESH_SECONDS = 3600
+# Same as the dashboard's warning.
+STALE_MINUTES = 10
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>Air quality</title>
+<script src="https://cdn.jsdelivr.net/npm/vega@{vega}"></script>
+<script src="https://cdn.jsdelivr.net/npm/vega-lite@{vega_lite}"></script>
+<script src="https://cdn.jsdelivr.net/npm/vega-embed@{vega_embed}"></script>
+<style>
+    body {{font-family: sans-serif; max-width: 60rem; margin: 0 auto; padding: 0 1rem;}}
+    .chart {{width: 100%; margin-bottom: 1rem;}}
+    .warning {{padding: 0.6rem 0.9rem; background: #fff3cd; border-radius: 0.5rem;}}
+{card_css}
+</style>
+</head>
+<body>
+<h1>Current air quality</h1>
+<p>🗓 <span id="taken">{taken}</span></p>
+<p class="warning" id="stale" hidden></p>
+<div class="metrics" id="cards">{cards}</div>
+<h1>Last 24 hours</h1>
+{day}
+<h1>Last 7 days</h1>
+{week}
+<script>
+let taken = {taken_ms};
+function checkStale() {{
+    const minutes = (Date.now() - taken) / 60000;
+    const stale = document.getElementById("stale");
+    stale.textContent = `⚠️ Last measurement is ${{Math.floor(minutes)}} minutes old — the monitor may be down.`;
+    stale.hidden = minutes <= {stale};
+}}
+checkStale();
+setInterval(checkStale, 60000);
+
+const views = {{}};
+for (const name of {names}) {{
+    vegaEmbed(`#chart-${{name}}`, `charts/${{name}}.json?v={version}`, {{actions: false}})
+        .then(result => {{ views[name] = result; }});
+}}
+
+// New samples from api.py's /events: new cards, and the row appended to the 24h
+// charts, to every dataset that has all of its fields (not PM's long form). The
+// whole page is only reloaded while that isn't connected, or for the 7-day charts.
+let reload = setTimeout(() => location.reload(), {refresh} * 1000);
+const events = new EventSource(`${{location.protocol}}//${{location.hostname}}:{api_port}/events`);
+events.onopen = () => {{
+    clearTimeout(reload);
+    reload = setTimeout(() => location.reload(), {live_refresh} * 1000);
+}};
+events.onmessage = message => {{
+    const update = JSON.parse(message.data);
+    const at = Date.parse(update.row.date);
+    if (at <= taken) return;
+    taken = at;
+    document.getElementById("taken").textContent = update.taken;
+    document.getElementById("cards").innerHTML = update.cards;
+    checkStale();
+    for (const [name, result] of Object.entries(views)) {{
+        if (!name.startsWith("day-")) continue;
+        for (const [dataset, rows] of Object.entries(result.spec.datasets || {{}})) {{
+            const fields = rows.length ? Object.keys(rows[0]) : [];
+            if (!fields.includes("date") || !fields.every(f => f in update.row)) continue;
+            const row = Object.fromEntries(fields.map(f => [f, update.row[f]]));
+            result.view.change(
+                dataset,
+                vega.changeset().insert([row]).remove(d => Date.parse(d.date) < at - 86400000)
+            );
+        }}
+        result.view.run();
+    }}
+}};
+</script>
+</body>
+</html>
+"""
+
+def _write(path, text):
+    partial = path.with_name(f".{path.name}.tmp")
+    partial.write_text(text, encoding="utf-8")
+    os.replace(partial, path)
+
+
+def _slot(name, caption=None):
+    text = f"<p>{html.escape(caption)}</p>\n" if caption else ""
+    return f'{text}<div class="chart" id="chart-{name}"></div>'
+
+
+def render(out_dir=STATIC_DIR):
+    """Write the page and its chart specs to `out_dir`; return the chart names."""
+    # Here rather than at the top: monitor.py imports this module for Renderer, and
+    # only the render process should pay for pandas and Altair.
+    import altair as alt
+
+    import charts
+    import frames
+    import live
+
+    out_dir = Path(out_dir)
+    (out_dir / "charts").mkdir(parents=True, exist_ok=True)
+    current = frames.load_current()
+    if current is None:
+        _write(out_dir / "index.html", "<p>No measurements have been recorded yet.</p>")
+        return []
+    last_record = charts.latest_reading(current)
+
+    try:
+        day_df = frames.load_live(columns=charts.DAY_COLUMNS)
+    except live.Stalled:
+        day_df = None
+    if day_df is None:
+        day_df = frames.load_last_days(1, columns=charts.DAY_COLUMNS)
+    day = charts.day_charts(day_df) if not day_df.empty else []
+
+    available = [c for c in charts.WEEK_FEATURES if c in frames.available_columns()]
+    week_df = frames.load_last_days(
+        7, columns=[c for col in available for c in charts.metric_columns(col)]
+    )
+    week = []
+    for col in available if not week_df.empty else ():
+        chart = charts.plot_week_overview(week_df, col, charts.WEEK_FEATURES[col])
+        if chart is not None:
+            week.append((f"week-{col}", chart, charts.week_caption(col)))
+
+    specs = [(f"day-{name}", chart) for name, chart in day]
+    specs += [(name, chart) for name, chart, _ in week]
+    for name, chart in specs:
+        spec = chart.properties(width="container").to_json(indent=None)
+        _write(out_dir / "charts" / f"{name}.json", spec)
+
+    taken = last_record["date"]
+    _write(
+        out_dir / "index.html",
+        PAGE.format(
+            refresh=REFRESH_SECONDS,
+            live_refresh=LIVE_REFRESH_SECONDS,
+            api_port=API_PORT,
+            vega=alt.VEGA_VERSION,
+            vega_lite=alt.VEGALITE_VERSION,
+            vega_embed=alt.VEGAEMBED_VERSION,
+            card_css=cards.CARD_CSS,
+            taken=taken.strftime("%d-%m-%Y %H:%M"),
+            taken_ms=int(taken.timestamp() * 1000),
+            stale=STALE_MINUTES,
+            cards="".join(cards.current_cards(current)),
+            day="\n".join(_slot(f"day-{name}") for name, _ in day)
+            or "<p>No measurements recorded in the last 24 hours.</p>",
+            week="\n".join(_slot(name, caption) for name, _, caption in week)
+            or "<p>No measurements recorded in the last 7 days.</p>",
+            names=json.dumps([name for name, _ in specs]),
+            # The specs keep their names, so the browser is told when they changed.
+            version=int(taken.timestamp()),
+        ),
+    )
+    return [name for name, _ in specs]
+
+
+class Renderer:
+    """Runs render() in a separate process, at most one at a time.
+
+    monitor.py calls it after each sample. A render takes seconds on a Pi; one still
+    running means the sample is skipped, and the next one catches the page up.
+    """
+
+    def __init__(self, out_dir=STATIC_DIR):
+        self.out_dir = out_dir
+        self.process = None
+        self.skipped = 0
+
+    def __call__(self):
+        if self.process is not None and self.process.poll() is None:
+            self.skipped += 1
+            return
+        self.process = subprocess.Popen([sys.executable, __file__, str(self.out_dir)])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render the dashboard to static files.")
+    parser.add_argument(
+        "out_dir", nargs="?", type=Path, default=STATIC_DIR, help="default: config.STATIC_DIR"
+    )
+    parser.add_argument(
+        "--every", type=float, metavar="SECONDS", help="keep rendering, this often"
+    )
+    args = parser.parse_args(argv)
+    if args.out_dir is None:
+        parser.error("no OUT_DIR given and config.STATIC_DIR is not set")
+
+    while True:
+        started = time.perf_counter()
+        try:
+            names = render(args.out_dir)
+            print(
+                f"{datetime.datetime.now():%H:%M:%S} rendered {len(names)} charts "
+                f"in {time.perf_counter() - started:.1f}s"
+            )
+        except Exception as exc:
+            if args.every is None:
+                raise
+            print("Render failed:", exc)
+        if args.every is None:
+            break
+        time.sleep(max(0.0, args.every - (time.perf_counter() - started)))
+
+
+if __name__ == "__main__":
+    main()
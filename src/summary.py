@@ -14,7 +14,9 @@ import sqlite3
 import time
 import urllib.request
 
+from compact import CLEAN_VIEW
 from config import DB_PATH, LATITUDE, LONGITUDE
+from thermal import ThermalModel, forecast_curve, read as read_thermal
 from utils import send_notification
 
 # CO2 is the Belgian indoor-air target value and sits in the EN 16798-1 Cat I band; it
@@ -116,14 +118,14 @@ def collect(now=None):
     )
     # Stored dates are naive local ISO strings, so lexicographic >= works (as in dashboard.py).
     night = _query(
-        "SELECT date, co2 FROM records WHERE date >= ? AND date <= ? ORDER BY date",
+        f"SELECT date, co2 FROM {CLEAN_VIEW} WHERE date >= ? AND date <= ? ORDER BY date",
         (_stamp(night_start), _stamp(night_end)),
     )
     day = _query(
-        "SELECT date, pm25, pm10 FROM records WHERE date >= ? ORDER BY date",
+        f"SELECT date, pm25, pm10 FROM {CLEAN_VIEW} WHERE date >= ? ORDER BY date",
         (_stamp(now - datetime.timedelta(hours=24)),),
     )
-    latest = _query("SELECT temp FROM records ORDER BY date DESC LIMIT 1")
+    latest = _query(f"SELECT temp FROM {CLEAN_VIEW} ORDER BY date DESC LIMIT 1")
 
     co2_peak, co2_peak_at = _peak(night, 1)
     over = sum(1 for _, co2 in night if co2 is not None and co2 > CO2_WARN)
@@ -166,7 +168,7 @@ def collect(now=None):
             vent = {
                 "out": outdoor_now,
                 "in": indoor_temp,
-                "shut_by": _shut_by(forecast["hourly"], indoor_temp, now),
+                "shut_by": _shut_by(forecast["hourly"], indoor_temp, now, _thermal_model()),
             }
 
     return {
@@ -187,13 +189,19 @@ def collect(now=None):
     }
 
 
-def _shut_by(hourly, indoor_temp, now):
-    """First hour today when outdoor catches up to indoor -- i.e. close the windows."""
-    for stamp, temp in zip(hourly["time"], hourly["temperature_2m"]):
-        when = datetime.datetime.fromisoformat(stamp)
-        if when > now and temp is not None and temp >= indoor_temp:
-            return when.strftime("%H:%M")
-    return None
+def _shut_by(hourly, indoor_temp, now, model=None):
+    """When today outdoor catches up to indoor -- i.e. close the windows.
+
+    Steps the room's fitted thermal model (thermal.py) through the forecast, so a room
+    that warms along with the day is accounted for; without one, indoor holds still.
+    """
+    when = (model or ThermalModel()).crossing(indoor_temp, now, forecast_curve(hourly))
+    return when.strftime("%H:%M") if when else None
+
+
+def _thermal_model():
+    with sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True) as con:
+        return read_thermal(con)
 
 
 def co2_streak(now, nights=7):
@@ -202,7 +210,7 @@ def co2_streak(now, nights=7):
         # Shifting by NIGHT_START_HOUR-hours groups an overnight stretch under the date it
         # started on, so 22:00 and the 05:00 that follows land in the same bucket.
         f"SELECT date(datetime(date, '-{NIGHT_START_HOUR} hours')) AS night, MAX(co2) "
-        "FROM records WHERE date >= ? AND co2 IS NOT NULL "
+        f"FROM {CLEAN_VIEW} WHERE date >= ? AND co2 IS NOT NULL "
         f"AND (CAST(strftime('%H', date) AS INTEGER) >= {NIGHT_START_HOUR} "
         f"OR CAST(strftime('%H', date) AS INTEGER) < {NIGHT_END_HOUR}) "
         "GROUP BY night ORDER BY night DESC",
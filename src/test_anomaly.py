@@ -0,0 +1,64 @@
+"""Self-check for the streaming anomaly detectors. Run with: python src/test_anomaly.py"""
+
+import datetime
+
+from anomaly import LEVEL, RATE, Anomalies, Detector, bits, describe, notification
+
+# Nothing is judged until the detector has seen what normal looks like.
+d = Detector(floor=20.0, max_step=400.0)
+assert all(d.update(600.0)[0] is None for _ in range(12))
+
+# A steady reading sits on its baseline; a wiggle inside the floor is noise.
+for _ in range(100):
+    d.update(600.0)
+assert abs(d.update(600.0)[0]) < 0.01
+assert abs(d.update(630.0)[0]) < 3.5
+
+# A spike clears the threshold, and barely moves the baseline it is judged against.
+assert d.update(1500.0)[0] > 3.5
+assert d.baseline < 620.0
+
+# A jump bigger than max_step is a rate anomaly even before the level catches up.
+assert d.update(1000.0)[1]
+assert not d.update(1050.0)[1]
+
+# Missing readings are skipped, not zeroes.
+assert d.update(None) == (None, False)
+assert d.update(float("nan")) == (None, False)
+
+# The mask round-trips through describe(). A retired metric keeps its bits, so masks
+# stored before it was retired still read the same.
+mask = bits("co2", LEVEL) | bits("temp", LEVEL | RATE)
+assert describe(mask) == [("co2", LEVEL), ("temp", LEVEL | RATE)]
+assert describe(None) == []
+assert bits("temp", LEVEL) == 1 << 6 and "eco2" not in Anomalies().detectors
+
+# Hysteresis: the alarm raises once after two flagged samples, stays quiet while the
+# reading hovers around the threshold, and re-arms only after a calm stretch.
+a = Anomalies({"co2": (20.0, None)})
+raised = []
+for value in [600.0] * 50 + [2000.0, 2000.0, 2000.0, 600.0, 2000.0, 2000.0]:
+    raised += a.update({"co2": value})[1]
+assert len(raised) == 1 and raised[0][0] == "co2"
+for value in [600.0] * 6 + [2000.0, 2000.0]:
+    raised += a.update({"co2": value})[1]
+assert len(raised) == 2
+
+# Only alert metrics notify, each once per cooldown, and alarms raised by the same
+# sample go out together. Flags are set either way.
+start = datetime.datetime(2024, 1, 1)
+a = Anomalies({"co2": (20.0, None), "pm1": (1.0, None), "pm25": (1.0, None)},
+              alert=("co2", "pm25"), cooldown_minutes=60)
+sent, masks = [], []
+for i, value in enumerate([1.0] * 50 + [50.0] * 3 + [1.0] * 6 + [50.0] * 3):
+    date = start + datetime.timedelta(minutes=5 * i)
+    mask, raised = a.update({"date": date, "co2": 400 * value, "pm1": value, "pm25": value})
+    masks.append(mask)
+    if message := notification(raised, a.detectors):
+        sent.append(message)
+assert len(sent) == 1 and sent[0][0] == "Unusual co2, pm25", sent
+assert len(sent[0][1].splitlines()) == 2
+assert describe(masks[-1], a.metrics) == [("co2", LEVEL), ("pm1", LEVEL), ("pm25", LEVEL)]
+assert notification([], a.detectors) is None
+
+print("ok")
@@ -0,0 +1,127 @@
+"""Self-check for the JSON API. Run with: python src/test_api.py"""
+
+import datetime
+import http.client
+import io
+import json
+import tempfile
+import urllib.error
+import urllib.request
+from contextlib import redirect_stdout
+from pathlib import Path
+
+import monitor
+import planner
+from api import Server
+from push import Hub, Publisher
+from simulate import Clocked, Simulator, StandIn
+
+workdir = Path(tempfile.mkdtemp())
+con = monitor.open_database(workdir / "test.db")
+stand_in = StandIn().start()
+start = datetime.datetime(2024, 7, 1)
+with redirect_stdout(io.StringIO()):
+    monitor.run(
+        con,
+        Clocked(Simulator(stand_in, start, days=2)),
+        weather=lambda: ({}, None),
+        live_path=workdir / "live",
+    )
+hub = Hub(("127.0.0.1", 0)).start()
+server = Server(("127.0.0.1", 0), workdir / "test.db", hub=hub).start()
+url = f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def get(path, etag=None):
+    request = urllib.request.Request(url + path, headers={"If-None-Match": etag} if etag else {})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, response.headers["ETag"], json.load(response)
+    except urllib.error.HTTPError as exc:
+        body = exc.read()
+        return exc.code, exc.headers["ETag"], json.loads(body) if body else None
+
+
+status, etag, reading = get("/latest")
+assert status == 200 and reading["date"].startswith("2024-07-02 23:55"), reading
+# Unchanged data: the client's copy is still good.
+assert get("/latest", etag)[:2] == (304, etag)
+assert get("/summary", etag)[0] == 304
+
+status, _, summary = get("/summary")
+assert summary["reading"] == reading
+assert summary["last_24h"]["samples"] == 288 and "co2" in summary["last_24h"]
+
+status, _, day = get("/range?from=2024-07-01&to=2024-07-01&cols=co2,temp")
+assert day["resolution"] == "raw" and day["columns"] == ["date", "co2", "temp"]
+assert len(day["rows"]) == 288 and day["rows"][0][0].startswith("2024-07-01 00:00")
+status, _, hours = get("/range?from=2024-07-01&to=2024-07-02&cols=co2&resolution=1h")
+assert hours["resolution"] == "1h" and len(hours["rows"]) == 48
+assert hours["columns"] == ["date", "co2", "co2_min", "co2_max"]
+
+# Times with an offset are converted to the stored local time, so they mix with ones
+# without: midnight in Brussels is 22:00 UTC in July.
+status, _, mixed = get("/range?from=2024-07-01&to=2024-07-02T00:00:00%2B02:00&cols=co2")
+assert status == 200 and len(mixed["rows"]) == 288, (status, mixed)
+status, _, utc = get("/range?from=2024-06-30T22:00:00Z&to=2024-07-01T01:00:00Z&cols=co2")
+assert utc["rows"][0][0] == "2024-07-01 00:00:00" and len(utc["rows"]) == 36, utc["rows"][0]
+
+for bad in (
+    "cols=co2",
+    "from=2024-07-01&to=2024-07-02&cols=co2;DROP",
+    "from=x&to=y&cols=co2",
+    "from=2024-07-01&to=9999-12-31T23:00:00-05:00&cols=co2",
+):
+    assert get(f"/range?{bad}")[0] == 400, bad
+
+# The API only reads: without the rollups monitor.py builds, coarse ranges come from
+# the history on the fly, the same as from the rollups, and nothing gets created.
+for table in ("rollup_1d", "rollup_1h"):
+    con.execute(f"DROP TABLE {table}")
+con.commit()
+server.cache.clear()
+assert get("/range?from=2024-07-01&to=2024-07-02&cols=co2&resolution=1h")[2] == hours
+assert not con.execute("SELECT name FROM sqlite_master WHERE name LIKE 'rollup_1%'").fetchall()
+planner.ensure_rollups(con)  # the invalidation triggers on `records` read them
+assert get("/nothing")[0] == 404
+
+# Live updates: the latest sample on connecting, then each new one as it is published.
+stream = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=10)
+stream.request("GET", "/events")
+response = stream.getresponse()
+assert response.getheader("Content-Type") == "text/event-stream"
+
+
+def next_event():
+    while not (line := response.fp.readline()).startswith(b"data: "):
+        pass
+    return json.loads(line[len(b"data: "):])
+
+
+update = next_event()
+assert update["state"]["reading"] == reading and "class='metric'" in update["cards"]
+assert update["row"]["date"] == "2024-07-02T23:55:00+02:00", update["row"]["date"]
+
+# A new sample is a new version, and goes out to the stream.
+with redirect_stdout(io.StringIO()):
+    monitor.run(
+        con,
+        Clocked(Simulator(stand_in, start + datetime.timedelta(days=2), days=1 / 288)),
+        weather=lambda: ({}, None),
+        live_path=workdir / "live",
+        publish=Publisher(hub.address),
+    )
+status, new_etag, reading = get("/latest", etag)
+assert status == 200 and new_etag != etag and reading["date"].startswith("2024-07-03 00:00")
+update = next_event()
+assert update["state"]["reading"] == reading and hub.received == 1
+# So is a value filled in place, as outdoor.py does, though no row is added.
+con.execute("UPDATE records SET out_temp = 21.5 WHERE date = (SELECT MIN(date) FROM records)")
+con.commit()
+status, filled_etag, _ = get("/latest", new_etag)
+assert status == 200 and filled_etag != new_etag, (status, filled_etag)
+stream.close()
+server.shutdown()
+stand_in.shutdown()
+
+print("ok")
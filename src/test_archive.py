@@ -0,0 +1,68 @@
+"""Self-check for the monthly archive. Run with: python src/test_archive.py"""
+
+import datetime
+import sqlite3
+import tempfile
+
+import numpy as np
+
+import archive
+from compact import compact
+from migrations import migrate
+
+if not archive.available():
+    print("ok (skipped: needs pyarrow)")
+    raise SystemExit
+
+archive_dir = tempfile.mkdtemp()
+con = sqlite3.connect(":memory:")
+migrate(con)
+# June to mid-August, every 5 minutes; no outdoor values before July.
+start = datetime.datetime(2024, 6, 1)
+rows = []
+for step in range(76 * 288):
+    date = start + datetime.timedelta(minutes=5 * step)
+    rows.append((date.strftime("%Y-%m-%d %H:%M:%S"), 400 + step % 500, 21.5,
+                 None if date.month == 6 else 14.0, step // 288))
+con.executemany(
+    "INSERT INTO records (date, co2, temp, out_temp, session_id) VALUES (?, ?, ?, ?, ?)", rows
+)
+con.commit()
+
+# Only closed months, once each.
+now = datetime.datetime(2024, 8, 15)
+assert archive.export_closed(con, now, archive_dir) == [
+    (datetime.datetime(2024, 6, 1), 30 * 288), (datetime.datetime(2024, 7, 1), 31 * 288)
+]
+assert archive.export_closed(con, now, archive_dir) == []
+assert archive.archived(archive_dir) == [datetime.datetime(2024, 6, 1), datetime.datetime(2024, 7, 1)]
+
+# A range is split into archived months and one SQLite part for the rest.
+parts = archive.segments(datetime.datetime(2024, 6, 20), datetime.datetime(2024, 8, 10), archive_dir)
+assert [(a.day, b.day, p and p.name) for a, b, p in parts] == [
+    (20, 1, "2024-06.arrow"), (1, 1, "2024-07.arrow"), (1, 10, None)
+], parts
+assert archive.segments(datetime.datetime(2024, 8, 1), datetime.datetime(2024, 10, 1), archive_dir) == [
+    (datetime.datetime(2024, 8, 1), datetime.datetime(2024, 10, 1), None)
+]
+
+# Only the asked-for columns and rows; the same values as the database.
+july = archive.read(
+    archive.path(datetime.datetime(2024, 7, 1), archive_dir), ["co2", "out_temp"],
+    datetime.datetime(2024, 7, 2), datetime.datetime(2024, 7, 3),
+)
+assert list(july.columns) == ["date", "co2", "out_temp"] and len(july) == 288
+stored = con.execute(
+    "SELECT co2 FROM records WHERE date >= '2024-07-02' AND date < '2024-07-03' ORDER BY date"
+).fetchall()
+assert np.array_equal(july["co2"].to_numpy(), [r[0] for r in stored])
+assert july["date"].iloc[0] == np.datetime64("2024-07-02T00:00:00")
+june = archive.read(archive.path(datetime.datetime(2024, 6, 1), archive_dir), ["out_temp", "pm25"])
+assert june["out_temp"].isna().all() and june["pm25"].isna().all()
+
+# Compaction leaves the archive its 5-minute rows.
+compact(con, now=now, days=0, pause=0)
+assert con.execute("SELECT COUNT(*) FROM records WHERE date < '2024-08-01'").fetchone() == (0,)
+assert len(archive.read(archive.path(datetime.datetime(2024, 6, 1), archive_dir), ["co2"])) == 30 * 288
+
+print("ok")
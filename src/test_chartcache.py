@@ -0,0 +1,52 @@
+"""Self-check for the chart spec cache. Run with: python src/test_chartcache.py"""
+
+import tempfile
+from pathlib import Path
+
+import chartcache
+
+cache_dir = Path(tempfile.mkdtemp())
+builds = []
+
+
+def build(value):
+    def spec():
+        builds.append(value)
+        return {"mark": "line", "datasets": {"data-1": [{"date": "2024-07-01", "co2": value}]}}
+
+    return spec
+
+
+def cached(version, value, persist=False):
+    return chartcache.cached("day", ("2024-07-01",), version, build(value), persist, cache_dir)
+
+
+# Built once per version; a new version is a rebuild.
+first = cached(1, 400, persist=True)
+assert cached(1, 999, persist=True) is first and builds == [400]
+assert cached(2, 500)["datasets"]["data-1"][0]["co2"] == 500 and builds == [400, 500]
+
+# A closed window is on disk, so a restart doesn't build it again; an open one isn't.
+chartcache._memory.clear()
+assert cached(1, 999, persist=True) == first and builds == [400, 500]
+assert cached(2, 600)["datasets"]["data-1"][0]["co2"] == 600 and builds == [400, 500, 600]
+assert len(list(cache_dir.glob("day-*.json"))) == 1
+
+# A new version of a closed window replaces the old one on disk; other charts stay.
+cached(3, 700, persist=True)
+chartcache.cached("week", ("2024-07-01",), 1, build(800), True, cache_dir)
+assert len(list(cache_dir.glob("day-*.json"))) == 1 and len(list(cache_dir.glob("*.json"))) == 2
+
+# Past DISK_BYTES the least recently used files go, never the one just written.
+defaults = chartcache._prune.__defaults__
+chartcache._prune.__defaults__ = (sum(p.stat().st_size for p in cache_dir.glob("*.json")),)
+chartcache.cached("range", ("2024-07",), 1, build(900), True, cache_dir)
+assert sorted(p.name.split("-")[0] for p in cache_dir.glob("*.json")) == ["range", "week"]
+chartcache._prune.__defaults__ = defaults
+
+# Memory is bounded.
+for version in range(100, 100 + 2 * chartcache.MEMORY_ENTRIES):
+    cached(version, version)
+assert len(chartcache._memory) == chartcache.MEMORY_ENTRIES
+
+print("ok")
@@ -0,0 +1,49 @@
+"""Self-check for the WAL checkpoint policy. Run with: python src/test_checkpoints.py"""
+
+import sqlite3
+import tempfile
+from pathlib import Path
+
+import checkpoints
+from checkpoints import TRUNCATE_ABOVE_BYTES, Checkpointer, read_health, wal_bytes
+
+workdir = Path(tempfile.mkdtemp())
+path = workdir / "test.db"
+writer = sqlite3.connect(path, isolation_level=None)
+writer.execute("PRAGMA journal_mode=WAL")
+writer.execute("PRAGMA wal_autocheckpoint=0")  # leave it all to the Checkpointer
+writer.execute("CREATE TABLE records (date timestamp, blob blob)")
+checkpointer = Checkpointer(path, health_path=workdir / "health.json")
+con = sqlite3.connect(path, timeout=checkpoints.TRUNCATE_TIMEOUT_SECONDS)
+
+# A long read pins the WAL: the checkpoint can't copy past it, so it can't truncate.
+reader = sqlite3.connect(path, isolation_level=None)
+reader.execute("BEGIN")
+reader.execute("SELECT COUNT(*) FROM records").fetchone()
+for _ in range(2 * TRUNCATE_ABOVE_BYTES // 100_000):
+    writer.execute("INSERT INTO records VALUES (datetime('now'), zeroblob(100000))")
+checkpointer.checkpoint(con)
+assert wal_bytes(path) > TRUNCATE_ABOVE_BYTES
+last = checkpointer.stats["last_checkpoint"]
+assert last["mode"] == "PASSIVE" and last["copied"] < last["frames"], last
+
+# Once it's done, the next round catches up and hands the space back.
+reader.execute("COMMIT")
+checkpointer.checkpoint(con)
+assert wal_bytes(path) == 0 and checkpointer.stats["truncates"] == 1, checkpointer.stats
+assert checkpointer.stats["max_wal_bytes"] > TRUNCATE_ABOVE_BYTES
+
+# A small WAL is left to be reused.
+writer.execute("INSERT INTO records VALUES (datetime('now'), zeroblob(1000))")
+checkpointer.checkpoint(con)
+assert wal_bytes(path) > 0 and checkpointer.stats["truncates"] == 1
+
+checkpointer.record_write(0.0001, 0.002)
+checkpointer.record_write(0.2, 0.25)
+checkpointer.write()
+health = read_health(workdir / "health.json")
+assert health["writes"] == 2 and health["lock_waits"] == 1, health
+assert health["max_lock_wait_seconds"] == 0.2
+assert read_health(workdir / "missing.json") is None
+
+print("ok")
@@ -0,0 +1,42 @@
+"""Self-check for the live ring buffer. Run with: python src/test_live.py"""
+
+import datetime
+import os
+import tempfile
+
+import numpy as np
+
+import live
+
+path = os.path.join(tempfile.mkdtemp(), "live")
+start = datetime.datetime(2024, 1, 1)
+writer = live.LiveWriter(poll_seconds=3600, path=path)  # 25 slots
+for i in range(30):
+    writer.append({"date": start + datetime.timedelta(hours=i), "co2": 400 + i, "temp": None})
+
+# Wrapped round: the oldest five were overwritten, and the rest come back in order.
+rows, _ = live.read_live(path)
+assert len(rows) == 25 and rows["co2"][0] == 405 and rows["co2"][-1] == 429, rows["co2"]
+assert np.isnan(rows["temp"]).all()
+
+# Only the rows from `since` and the columns asked for are copied out.
+since = np.datetime64(start + datetime.timedelta(hours=27), "s")
+rows, _ = live.read_live(path, since=since, columns=["date", "co2"])
+assert rows.dtype.names == ("date", "co2") and list(rows["co2"]) == [427, 428, 429], rows
+
+# A write that never finished, or none for a few polls, is a stalled monitor.
+writer._begin()
+try:
+    live.read_live(path, attempts=2, retry_delay_seconds=0)
+    raise AssertionError("expected Stalled")
+except live.Stalled:
+    pass
+writer._end()
+writer._header["written_at"] -= (live.STALE_INTERVALS + 1) * 3600
+try:
+    live.read_live(path)
+    raise AssertionError("expected Stalled")
+except live.Stalled as exc:
+    assert "last written" in str(exc), exc
+
+print("ok")
@@ -0,0 +1,73 @@
+"""Self-check for the schema migrations. Run with: python src/test_migrations.py"""
+
+import sqlite3
+
+from compact import CLEAN_VIEW
+from migrations import MIGRATIONS, add_columns, backfill, migrate, pending
+
+# A database from before migrations.py and the quality flags.
+con = sqlite3.connect(":memory:")
+con.execute("CREATE TABLE records (date timestamp, co2 integer, temp real, session_id integer)")
+con.execute("CREATE TABLE sessions (session_id integer, start_date timestamp, location text)")
+rows = [(f"2024-01-01 00:{5 * i:02d}:00", 600 + i, 21.0 + i / 10, 0) for i in range(7)]
+con.executemany("INSERT INTO records VALUES (?, ?, ?, ?)", rows)
+con.commit()
+
+assert migrate(con) == [version for version, *_ in MIGRATIONS]
+columns = [info[1] for info in con.execute("PRAGMA table_info(records)")]
+assert {"pm25", "out_temp", "anomalies", "quality"} <= set(columns), columns
+assert con.execute(f"SELECT COUNT(*) FROM {CLEAN_VIEW}").fetchone()[0] == 7
+assert migrate(con) == []
+assert [p[0] for p in pending(con)] == [5]
+
+
+# A crash after the first batch keeps that batch and where it got to...
+class Crash(Exception):
+    pass
+
+
+def crash(version, rowid):
+    raise Crash
+
+
+try:
+    backfill(con, batch_rows=3, progress=crash)
+except Crash:
+    pass
+assert con.execute("SELECT backfill_rowid FROM schema_version WHERE version = 5").fetchone() == (3,)
+assert con.execute("SELECT COUNT(quality) FROM records").fetchone()[0] == 3
+# ...and the rerun picks up from there and finishes.
+assert backfill(con, batch_rows=3) == 4
+assert con.execute("SELECT COUNT(quality) FROM records").fetchone()[0] == 7
+# Only the very first CO2 reading is warm-up; resuming didn't restart the checks.
+flagged = [r[0] for r in con.execute("SELECT quality != 0 FROM records ORDER BY rowid")]
+assert flagged == [1, 0, 0, 0, 0, 0, 0], flagged
+assert pending(con) == [] and backfill(con) == 0
+
+
+# A failing schema step leaves neither the change nor a version behind.
+def broken(con):
+    add_columns("records", ("extra",), "real")(con)
+    raise ValueError
+
+
+try:
+    migrate(con, MIGRATIONS + [(8, "broken", broken, None)])
+except ValueError:
+    pass
+assert "extra" not in [info[1] for info in con.execute("PRAGMA table_info(records)")]
+assert con.execute("SELECT MAX(version) FROM schema_version").fetchone() == (7,)
+
+# A new database has nothing to backfill.
+fresh = sqlite3.connect(":memory:")
+migrate(fresh)
+assert pending(fresh) == []
+
+# Migration 7's step counts the changes to the tiers there are, here only `records`.
+early = sqlite3.connect(":memory:")
+early.execute("CREATE TABLE records (date timestamp)")
+{version: schema for version, _, schema, _ in MIGRATIONS}[7](early)
+early.execute("INSERT INTO records (date) VALUES ('2024-07-01 00:00:00')")
+assert early.execute("SELECT changes FROM data_changes").fetchone() == (1,)
+
+print("ok")
@@ -0,0 +1,132 @@
+"""Self-check for the outdoor backfill. Run with: python src/test_outdoor.py"""
+
+import datetime
+import io
+import sqlite3
+import tempfile
+from contextlib import redirect_stdout
+
+import numpy as np
+
+import archive
+import outdoor
+import planner
+from compact import HOURLY_TABLE, ensure_tiers
+from migrations import migrate
+from simulate import StandIn
+
+START = datetime.datetime(2024, 7, 1)
+
+
+def history(hour):
+    # Straight lines, so interpolation is exact; the wind turns through north.
+    hours = (hour - START) / datetime.timedelta(hours=1)
+    return {
+        "temperature_2m": 10 + hours, "relative_humidity_2m": 50, "surface_pressure": 1010,
+        "wind_speed_10m": 12, "wind_direction_10m": (350 + 20 * hours) % 360,
+        "pm2_5": 5 + hours / 10, "pm10": None,
+    }
+
+
+con = sqlite3.connect(":memory:")
+migrate(con)
+ensure_tiers(con)
+# Three days every 5 minutes; the outdoor fetch failed for two stretches, one of them
+# on the second day, and the first day was stored before the columns existed.
+rows = []
+for step in range(3 * 288):
+    date = START + datetime.timedelta(minutes=5 * step)
+    missing = step < 288 or 400 <= step < 412 or step == 700
+    rows.append((date.strftime("%Y-%m-%d %H:%M:%S"), None if missing else -1.0))
+con.executemany("INSERT INTO records (date, out_temp, out_hum, out_pressure, out_wind_speed, "
+                "out_wind_dir, out_pm25, out_pm10) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(date, *[value] * 7) for date, value in rows])
+# A compacted hour from the week before, also without outdoor values.
+con.execute(f"INSERT INTO {HOURLY_TABLE} (date, samples, co2) VALUES ('2024-06-24 10:00:00', 12, 600)")
+con.commit()
+
+runs = outdoor.stretches(con)
+assert runs == [
+    ("2024-07-01 00:00:00", "2024-07-01 23:55:00", 288),
+    ("2024-07-02 09:20:00", "2024-07-02 10:15:00", 12),
+    ("2024-07-03 10:20:00", "2024-07-03 10:20:00", 1),
+], runs
+# Runs two days apart at most share a request; a long one is cut up.
+assert outdoor.windows(runs) == [(datetime.date(2024, 7, 1), datetime.date(2024, 7, 3))]
+assert outdoor.windows(runs, merge_days=0, max_days=1) == [
+    (datetime.date(2024, 7, d), datetime.date(2024, 7, d)) for d in (1, 2, 3)
+]
+
+# Rollups built, and the month archived, before the values were filled in.
+planner.ensure_rollups(con)
+planner.extend(con, "1d", datetime.datetime(2024, 7, 8))
+archive_dir = tempfile.TemporaryDirectory()
+archive.export(con, datetime.datetime(2024, 7, 1), archive_dir.name)
+
+stand_in = StandIn().start()
+stand_in.history = history
+hosts = dict(
+    today=datetime.date(2024, 7, 8),
+    forecast_host=stand_in.url, archive_host=stand_in.url, air_quality_host=stand_in.url,
+)
+with redirect_stdout(io.StringIO()):
+    written = outdoor.backfill(con, archive_dir=archive_dir.name, **hosts)
+# The archive gets the six columns there are values for on the same 301 rows.
+assert written == {
+    "archive": 301 * 6, "records/weather": 301, "records/air": 301,
+    f"{HOURLY_TABLE}/weather": 1, f"{HOURLY_TABLE}/air": 1,
+}, written
+# One window over the archive and the forecast service's recent days, plus one
+# for air quality; then the hourly row's own window.
+assert stand_in.requests == 3 + 2, stand_in.requests
+
+# PM10 is never there, but air quality has answered for those days, so a rerun asks
+# nothing; --retry asks again.
+with redirect_stdout(io.StringIO()):
+    assert not any(outdoor.backfill(con, archive_dir=archive_dir.name, **hosts).values())
+assert stand_in.requests == 3 + 2, stand_in.requests
+assert [service for service, _ in outdoor.requests(con, "records", retry=True)] == ["air"]
+
+filled = dict(con.execute("SELECT date, out_temp FROM records"))
+assert filled["2024-07-01 00:25:00"] == round(10 + 25 / 60, 2)
+assert filled["2024-07-02 09:20:00"] == round(10 + 33 + 20 / 60, 2)
+assert filled["2024-07-02 10:20:00"] == -1.0  # stored values are kept
+# Directions interpolate across north, not back through south.
+north = con.execute("SELECT out_wind_dir FROM records WHERE date = '2024-07-01 00:30:00'")
+assert north.fetchone()[0] % 360 == 0
+# Hours with no value stay NULL.
+assert con.execute("SELECT COUNT(out_pm10) FROM records WHERE out_pm10 != -1").fetchone() == (0,)
+hour = con.execute(f"SELECT out_temp, out_temp_min, out_temp_max FROM {HOURLY_TABLE}").fetchone()
+assert hour == (round(10 - 7 * 24 + 10.5, 2),) * 3, hour
+
+# The rollups rebuilt the filled buckets.
+bucket = con.execute("SELECT out_temp FROM rollup_1h WHERE date = '2024-07-01 00:00:00'")
+assert abs(bucket.fetchone()[0] - np.mean(np.round(10 + np.arange(0, 60, 5) / 60, 2))) < 1e-9
+# So did the archive, the same values as the database.
+month = archive.read(archive.path(START, archive_dir.name), ["out_temp", "out_wind_dir"])
+stored = con.execute("SELECT out_temp, out_wind_dir FROM records ORDER BY date").fetchall()
+assert np.allclose(month[["out_temp", "out_wind_dir"]].to_numpy(), stored), month
+archive_dir.cleanup()
+
+# Only the column with nothing to fill from is left, so that is all a rerun finds.
+assert len(outdoor.stretches(con)) == 3
+assert outdoor.stretches(con, columns=outdoor.WEATHER) == []
+stand_in.shutdown()
+
+# A window's days already answered for are left out, and what remains splits around them.
+day = datetime.date(2024, 7, 1)
+assert outdoor.untried(
+    [(day, day + datetime.timedelta(days=9))],
+    [(day + datetime.timedelta(days=2), day + datetime.timedelta(days=3)),
+     (day + datetime.timedelta(days=8), day + datetime.timedelta(days=12))],
+) == [(day, day + datetime.timedelta(days=1)),
+      (day + datetime.timedelta(days=4), day + datetime.timedelta(days=7))]
+
+# Unknown hours and times outside the known ones stay nan; a repeated hour counts once.
+times = np.array(["2024-10-27T01:00", "2024-10-27T02:00", "2024-10-27T02:00", "2024-10-27T03:00",
+                  "2024-10-27T04:00"], dtype="datetime64[s]")
+values = np.array([1.0, 2.0, 9.0, np.nan, 4.0])
+at = np.array(["2024-10-27T00:30", "2024-10-27T02:30", "2024-10-27T03:00"], dtype="datetime64[s]")
+assert np.allclose(outdoor.interpolate(times, values, at), [np.nan, 2.5, 3.0], equal_nan=True)
+
+print("ok")
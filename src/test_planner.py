@@ -0,0 +1,55 @@
+"""Self-check for the rollups behind the range explorer. Run with: python src/test_planner.py"""
+
+import datetime
+import sqlite3
+
+import planner
+from compact import compact
+from migrations import migrate
+
+con = sqlite3.connect(":memory:")
+migrate(con)
+rows = []
+for step in range(2 * 24 * 12):
+    date = datetime.datetime(2024, 7, 1) + datetime.timedelta(minutes=5 * step)
+    # CO2 is read every sample; PM2.5 only on the first sample of each hour but 9:00,
+    # where it is read on all twelve.
+    pm25 = 20.0 if date.hour == 9 else 2.0 if date.minute == 0 else None
+    rows.append((date.strftime("%Y-%m-%d %H:%M:%S"), 400 + date.hour, pm25))
+con.executemany("INSERT INTO records (date, co2, pm25) VALUES (?, ?, ?)", rows)
+con.commit()
+
+
+def read(resolution, columns=("co2", "pm25"), now=datetime.datetime(2024, 7, 3)):
+    _, sql, params = planner.query(
+        con, datetime.datetime(2024, 7, 1), now, columns, now=now, resolution=resolution
+    )
+    return con.execute(sql, params).fetchall()
+
+
+# A day's mean weighs each hour by the values it had, not by its samples.
+day = read("1d")[0]
+assert day[0] == "2024-07-01 00:00:00" and day[1] == 411.5, day
+assert day[4] == (23 * 2.0 + 12 * 20.0) / 35, day
+
+# A value changed under built buckets shows in both rollups at the next read.
+con.execute("UPDATE records SET co2 = 1600 WHERE date = '2024-07-01 10:00:00'")
+con.commit()
+hour = [r for r in read("1h") if r[0] == "2024-07-01 10:00:00"][0]
+assert hour[1] == 410 + 1190 / 12 and hour[3] == 1600, hour
+assert abs(read("1d")[0][1] - (411.5 + 1190 / 288)) < 1e-9, read("1d")[0]
+assert con.execute(f"SELECT COUNT(*) FROM {planner.DIRTY_TABLE}").fetchone() == (0,)
+
+# Compaction moves the first day to the hourly tier without changing its rollups (of a
+# metric read every sample: compacted hours only keep the count of samples).
+before = read("1d", ["co2"]), read("1h", ["co2"])
+compact(con, now=datetime.datetime(2024, 7, 2), days=0, pause=0)
+assert con.execute("SELECT COUNT(*) FROM records WHERE date < '2024-07-02'").fetchone() == (0,)
+assert (read("1d", ["co2"]), read("1h", ["co2"])) == before
+
+# A deleted hour leaves no bucket behind.
+con.execute("DELETE FROM records WHERE date >= '2024-07-02 05:00' AND date < '2024-07-02 06:00'")
+con.commit()
+assert "2024-07-02 05:00:00" not in [r[0] for r in read("1h")]
+
+print("ok")
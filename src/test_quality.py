@@ -0,0 +1,54 @@
+"""Self-check for the ingest-time quality flags. Run with: python src/test_quality.py"""
+
+import sqlite3
+
+from compact import CLEAN_VIEW, ensure_tiers
+from quality import (
+    BURN_IN, OUT_OF_RANGE, STUCK, WARMUP, Checks, backfill, bits, describe, masked,
+)
+
+normal = {"co2": 650, "voc": 120, "eco2": 700, "temp": 21.3, "pm25": 3.2}
+
+# The first PM and CO2 readings after a start are warm-up; later ones are fine.
+checks = Checks()
+first = checks.update(normal)
+assert describe(first) == [("co2", ["warm-up"]), ("pm25", ["warm-up"])], describe(first)
+assert checks.update(dict(normal, temp=21.4)) == 0
+
+# A PM sensor that isn't ready yet doesn't use up its warm-up reading.
+checks = Checks()
+checks.update(dict(normal, pm25=None))
+assert checks.update(normal) & bits("pm25", WARMUP)
+
+# The CCS811's burn-in pair, and readings outside what the sensor can report.
+assert checks.update(dict(normal, voc=0, eco2=400)) == bits("voc", BURN_IN) | bits("eco2", BURN_IN)
+assert checks.update(dict(normal, co2=9000, temp=21.5)) == bits("co2", OUT_OF_RANGE)
+
+# The same float an hour long is a stuck sensor; clean air pinned at 0 is not.
+checks = Checks()
+masks = [checks.update({"temp": 21.25, "pm25": 0.0}) for _ in range(12)]
+assert masks[-2] == 0 and masks[-1] == bits("temp", STUCK)
+
+# Flagged values read as missing, and unchecked columns pass through.
+reading = dict(normal, date="2024-01-01 00:00:00", quality=bits("co2", OUT_OF_RANGE))
+assert masked(reading)["co2"] is None and masked(reading)["temp"] == 21.3
+assert masked(reading)["date"] == reading["date"]
+
+# The view does the same in SQL, and backfill flags old rows per restart.
+con = sqlite3.connect(":memory:")
+con.execute(
+    "CREATE TABLE records (date timestamp, co2 integer, voc real, eco2 real, temp real, "
+    "pm25 real, session_id integer, quality integer)"
+)
+rows = [
+    ("2024-01-01 00:00:00", 650, 0), ("2024-01-01 00:05:00", 660, 0),
+    ("2024-01-01 03:00:00", 640, 0), ("2024-01-01 03:05:00", 9000, 0),
+]
+con.executemany("INSERT INTO records (date, co2, session_id) VALUES (?, ?, ?)", rows)
+ensure_tiers(con)
+assert backfill(con, batch_rows=3) == 4
+assert backfill(con) == 0
+clean = [r[0] for r in con.execute(f"SELECT co2 FROM {CLEAN_VIEW} ORDER BY date")]
+assert clean == [None, 660, None, None], clean
+
+print("ok")
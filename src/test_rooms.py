@@ -0,0 +1,57 @@
+"""Self-check for the per-room reads. Run with: python src/test_rooms.py"""
+
+import datetime
+import sqlite3
+
+import rooms
+from compact import compact
+from migrations import migrate
+
+con = sqlite3.connect(":memory:")
+migrate(con)
+assert rooms.current(con) is None
+
+# Two days in the office (sessions 0 and 2), one in the bedroom (1), the last unnamed.
+con.executemany(
+    "INSERT INTO sessions VALUES (?, ?, ?)",
+    [(0, "2024-07-01", "Office"), (1, "2024-07-02", "Bedroom"), (2, "2024-07-03", "Office"),
+     (3, "2024-07-04", "")],
+)
+rows = []
+for day in range(4):
+    for step in range(24):
+        # Two hours a day from 9:00; the office's first is stuffy.
+        date = datetime.datetime(2024, 7, 1 + day, 9) + datetime.timedelta(minutes=5 * step)
+        co2 = 1000 if day != 1 and step < 12 else 600
+        rows.append((date.strftime("%Y-%m-%d %H:%M:%S"), co2, 21.0 + day, day))
+con.executemany("INSERT INTO records (date, co2, temp, session_id) VALUES (?, ?, ?, ?)", rows)
+con.commit()
+assert rooms.current(con) == (3, "")
+assert rooms.sessions_by_room(con) == {"Office": [0, 2], "Bedroom": [1]}
+
+# The same figures whether the hours are raw or compacted.
+before = rooms.aggregates(con)
+compact(con, now=datetime.datetime(2024, 7, 3, 12), days=0, pause=0)
+assert con.execute("SELECT COUNT(*) FROM records WHERE session_id = 0").fetchone() == (0,)
+assert rooms.aggregates(con) == before, (rooms.aggregates(con), before)
+office, bedroom = before
+assert office["room"] == "Office" and office["hours"] == 4 and office["co2_hours"] == 2
+assert office["co2"] == 800 and office["temp"] == 22.0
+assert bedroom == {
+    "room": "Bedroom", "hours": 2, "co2": 600, "temp": 22.0, "hum": None, "pm25": None,
+    "co2_hours": 0, "pm25_max": None,
+}, bedroom
+
+# Naming the room of the latest session.
+rooms.assign(con, " Kitchen ")
+assert rooms.current(con) == (3, "Kitchen")
+assert list(rooms.sessions_by_room(con)) == ["Office", "Bedroom", "Kitchen"]
+
+# The reads go through the session indexes, not a scan.
+where, params = rooms.in_sessions([0, 2])
+plan = " ".join(
+    row[-1] for row in con.execute(f"EXPLAIN QUERY PLAN SELECT * FROM history WHERE {where}", params)
+)
+assert "records_session" in plan and "records_hourly_session" in plan, plan
+
+print("ok")
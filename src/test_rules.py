@@ -0,0 +1,64 @@
+"""Self-check for the alert rules and their backtest. Run with: python src/test_rules.py"""
+
+import datetime
+
+import pandas as pd
+
+import config
+from rules import Rule, backtest
+
+start = datetime.datetime(2024, 1, 1)
+SPEC = {
+    "name": "open",
+    "value": "temp - out_temp",
+    "fire": [(">=", 2.0)],
+    "rearm": [("<", 1.0)],
+    "title": "Open",
+    "message": "{value:.1f}",
+}
+
+# Hovering around the fire threshold notifies once; dropping under rearm re-arms.
+diffs = [0.0, 2.5, 1.8, 2.2, 3.0, 0.5, 2.1, None, 2.4, 0.2]
+readings = [
+    {"date": start + datetime.timedelta(minutes=5 * i), "temp": 20.0,
+     "out_temp": None if d is None else 20.0 - d}
+    for i, d in enumerate(diffs)
+]
+rule = Rule(SPEC)
+sent = [r["date"] for r in readings if rule.update(r)]
+assert sent == [readings[1]["date"], readings[6]["date"]], sent
+
+# A missing reading changes nothing.
+assert rule.update(dict(readings[0], out_temp=None)) is None
+
+# The vectorised backtest agrees with the per-sample evaluation.
+df = pd.DataFrame(readings).astype({"out_temp": float})
+assert list(backtest(df, Rule(SPEC))) == [pd.Timestamp(d).to_datetime64() for d in sent]
+
+# A cooldown mutes a re-fire that comes too soon, in both.
+quiet = dict(SPEC, cooldown_minutes=60)
+rule = Rule(quiet)
+assert [r["date"] for r in readings if rule.update(r)] == [readings[1]["date"]]
+assert len(backtest(df, Rule(quiet))) == 1
+
+# A column the message shows but that is missing skips the sample too, rather than
+# failing to format: close_in can come from the forecast without an out_temp.
+close = Rule(next(spec for spec in config.RULES if spec["name"] == "close_windows"))
+assert close.update({"date": start, "close_in": 10.0, "temp": 22.0, "out_temp": None}) is None
+title, message = close.update({"date": start, "close_in": 10.0, "temp": 22.0, "out_temp": 21.5})
+assert "21.5" in message, message
+
+# Abs conditions compare the magnitude.
+band = Rule(dict(SPEC, fire=[("abs<", 0.5)], rearm=[("abs>", 1.0)]))
+assert band.update({"date": start, "temp": 20.0, "out_temp": 20.3})
+assert not band.update({"date": start, "temp": 20.0, "out_temp": 19.8})
+
+# A typo in config fails at startup, not at the first matching sample.
+try:
+    Rule(dict(SPEC, fire=[("=>", 2.0)]))
+except ValueError:
+    pass
+else:
+    raise AssertionError("unknown op accepted")
+
+print("ok")
@@ -0,0 +1,51 @@
+"""Self-check for monitor.run on simulated readings. Run with: python src/test_simulate.py"""
+
+import datetime
+import functools
+import io
+import tempfile
+from contextlib import redirect_stdout
+from pathlib import Path
+
+import monitor
+import rooms
+from simulate import Clocked, Simulator, StandIn
+from utils import send_notification
+
+workdir = Path(tempfile.mkdtemp())
+stand_in = StandIn().start()
+sensors = Clocked(Simulator(stand_in, datetime.datetime(2024, 7, 1), days=2))
+con = monitor.open_database(workdir / "test.db")
+with redirect_stdout(io.StringIO()):
+    samples = monitor.run(
+        con,
+        sensors,
+        weather=functools.partial(monitor.read_weather, stand_in.url, stand_in.url),
+        notify=functools.partial(send_notification, server=stand_in.url, topic="test"),
+        live_path=workdir / "live",
+    )
+stand_in.shutdown()
+
+assert samples == 2 * 288 == len(sensors.latencies), samples
+rows = con.execute("SELECT COUNT(*), COUNT(out_temp), COUNT(quality) FROM records").fetchone()
+assert rows == (samples, samples, samples), rows
+# Every sample fetched both the forecast and the air quality from the stand-in.
+assert stand_in.requests == 2 * samples, stand_in.requests
+assert all(title for title, _ in stand_in.notifications)
+assert con.execute("SELECT state FROM thermal_model").fetchone()[0]
+# The hourly ventilation scan kept up, so the dashboard only has to read its table.
+assert con.execute("SELECT until FROM ventilation_scan").fetchone()[0] >= "2024-07-02"
+assert con.execute("SELECT COUNT(*) FROM ventilation_events").fetchone()[0] > 0
+
+# A rerun on the same database is a new session carrying on from the stored state,
+# in the same room.
+rooms.assign(con, "Office")
+for _ in range(2):
+    sensors = Clocked(Simulator(stand_in, datetime.datetime(2024, 7, 3), days=0))
+    with redirect_stdout(io.StringIO()):
+        assert monitor.run(con, sensors, weather=lambda: ({}, None), live_path=workdir / "live") == 0
+sessions = con.execute("SELECT session_id, location FROM sessions ORDER BY rowid").fetchall()
+assert sessions == [(0, "Office"), (1, "Office"), (2, "Office")], sessions
+con.close()
+
+print("ok")
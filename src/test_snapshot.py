@@ -0,0 +1,47 @@
+"""Self-check for the running header figures. Run with: python src/test_snapshot.py"""
+
+import datetime
+
+from snapshot import Snapshot
+
+start = datetime.datetime(2024, 1, 1)
+
+
+def at(minutes):
+    return start + datetime.timedelta(minutes=minutes)
+
+
+s = Snapshot()
+for i, temp in enumerate([20.0, 18.0, 22.0, 18.0, 21.0]):
+    s.add({"date": at(5 * i), "temp": temp, "voc": None})
+state = s.state()
+
+# Ties keep the earlier reading, like idxmin does.
+assert (state["temp_min"], state["temp_min_at"]) == (18.0, str(at(5))), state
+assert (state["temp_max"], state["temp_max_at"]) == (22.0, str(at(10))), state
+assert state["reading"]["temp"] == 21.0
+
+# Once the extremes age out of the 24h window the next ones take over.
+s.add({"date": at(6 + 24 * 60), "temp": 20.5, "voc": None})
+state = s.state()
+assert (state["temp_min"], state["temp_min_at"]) == (18.0, str(at(15))), state
+s.add({"date": at(16 + 24 * 60), "temp": 20.5, "voc": None})
+assert s.state()["temp_min"] == 20.5, s.state()
+assert s.state()["temp_max"] == 21.0, s.state()
+
+# A missing reading leaves the extremes alone rather than wiping them.
+s.add({"date": at(17 + 24 * 60), "temp": None, "voc": None})
+assert s.state()["temp_max"] == 21.0
+
+# The TVOC baseline needs history before it says anything, then matches utils'.
+v = Snapshot()
+for i in range(11):
+    v.add({"date": at(5 * i), "temp": None, "voc": 120.0})
+assert "voc_baseline" not in v.state()
+v.add({"date": at(55), "temp": None, "voc": 400.0})
+assert v.state()["voc_baseline"] == 120.0 and v.state()["voc_deviation"] > 3.5
+
+# Nothing read yet means nothing to show.
+assert Snapshot().state() is None
+
+print("ok")
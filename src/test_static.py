@@ -0,0 +1,55 @@
+"""Self-check for the static dashboard. Run with: python src/test_static.py"""
+
+import datetime
+import io
+import json
+import tempfile
+from contextlib import redirect_stdout
+from pathlib import Path
+
+import config
+
+workdir = Path(tempfile.mkdtemp())
+# Before anything reads them as defaults.
+config.DB_PATH = workdir / "test.db"
+config.LIVE_BUFFER_PATH = workdir / "live"
+
+import monitor  # noqa: E402
+import static  # noqa: E402
+from simulate import Clocked, Simulator, StandIn  # noqa: E402
+
+out = workdir / "site"
+con = monitor.open_database(config.DB_PATH)
+# Nothing stored yet: a page that says so, and no charts.
+assert static.render(out) == []
+assert "No measurements" in (out / "index.html").read_text()
+
+# Two days up to now, through the monitor with a render after every sample.
+stand_in = StandIn().start()
+start = datetime.datetime.now().replace(microsecond=0) - datetime.timedelta(days=2)
+renders = []
+with redirect_stdout(io.StringIO()):
+    monitor.run(
+        con,
+        Clocked(Simulator(stand_in, start, days=2)),
+        weather=lambda: ({}, None),
+        live_path=config.LIVE_BUFFER_PATH,
+        render=lambda: renders.append(1),
+    )
+stand_in.shutdown()
+con.close()
+assert len(renders) == 2 * 288, len(renders)
+
+names = static.render(out)
+assert {"day-co2", "day-temp", "week-co2", "week-temp"} <= set(names), names
+page = (out / "index.html").read_text()
+assert "class='metric'" in page and "No measurements" not in page
+for name in names:
+    assert f'id="chart-{name}"' in page, name
+    spec = json.loads((out / "charts" / f"{name}.json").read_text())
+    assert spec["$schema"].startswith("https://vega.github.io/schema/vega-lite/")
+    assert spec["width"] == "container" and spec["datasets"], name
+# Nothing left half-written.
+assert not list(out.rglob("*.tmp"))
+
+print("ok")
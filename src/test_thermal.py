@@ -0,0 +1,71 @@
+"""Self-check for the thermal model. Run with: python src/test_thermal.py"""
+
+import datetime
+import math
+
+from thermal import MIN_SAMPLES, ThermalModel, close_in, forecast_curve
+
+TRUE = [0.3, 0.05, 0.4, -0.2]
+STEP = datetime.timedelta(minutes=5)
+
+
+def outdoor(when):
+    hour = when.hour + when.minute / 60
+    return 15 + 6 * math.sin(2 * math.pi * (hour - 9) / 24)
+
+
+# A room following a known law; the fit should land close to it.
+model = ThermalModel()
+when, temp = datetime.datetime(2024, 6, 1), 20.0
+for _ in range(14 * 288):
+    model.update({"date": when, "temp": temp, "out_temp": outdoor(when)})
+    angle = 2 * math.pi * (when.hour + when.minute / 60) / 24
+    rate = sum(
+        t * x
+        for t, x in zip(TRUE, [outdoor(when) - temp, 1, math.sin(angle), math.cos(angle)])
+    )
+    temp += rate * STEP.total_seconds() / 3600
+    when += STEP
+assert model.trained
+assert all(abs(a - b) < 0.02 for a, b in zip(model.theta, TRUE)), model.theta
+
+# A gap isn't taken as one step; missing values are skipped.
+samples = model.samples
+model.update({"date": when + datetime.timedelta(hours=2), "temp": temp, "out_temp": 15.0})
+model.update({"date": when + datetime.timedelta(hours=2, minutes=5), "temp": None, "out_temp": 15.0})
+assert model.samples == samples
+
+# State survives a round trip.
+copy = ThermalModel.from_state(model.state())
+assert copy.theta == model.theta and copy.last == model.last
+
+# Crossing: an untrained model holds indoor still, so it's the forecast's own crossing.
+day = datetime.datetime(2024, 6, 20)
+hourly = {
+    "time": [(day + datetime.timedelta(hours=h)).isoformat() for h in range(25)],
+    "temperature_2m": [10.0 + h for h in range(25)],
+}
+curve = forecast_curve(hourly)
+assert curve(day + datetime.timedelta(minutes=30)) == 10.5
+assert curve(day + datetime.timedelta(hours=30)) is None
+fresh = ThermalModel()
+assert fresh.samples < MIN_SAMPLES
+assert fresh.crossing(20.0, day, curve) == day + datetime.timedelta(hours=10)
+assert fresh.crossing(40.0, day, curve) is None
+# The fitted room cools towards the cold night air, so outdoor catches up sooner.
+assert model.crossing(20.0, day, curve) < day + datetime.timedelta(hours=10)
+
+# close_in, for the close_windows rule: from the forecast when there is one...
+horizon = datetime.timedelta(hours=12)
+reading = {"date": day, "temp": 20.0, "out_temp": 10.0}
+assert close_in(fresh, reading, hourly, horizon) == 600
+assert close_in(fresh, reading, hourly, datetime.timedelta(hours=6)) == float("inf")
+# ...else from the outdoor reading held steady: already there, or never for a room
+# that holds still...
+assert close_in(fresh, dict(reading, out_temp=21.0), None, horizon) == 0
+assert close_in(fresh, reading, None, horizon) == float("inf")
+# ...and nothing to go on without one.
+assert close_in(fresh, dict(reading, out_temp=None), None, horizon) is None
+assert close_in(fresh, dict(reading, temp=None), hourly, horizon) is None
+
+print("ok")
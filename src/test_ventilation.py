@@ -0,0 +1,34 @@
+"""Self-check for the CO2 decay fits. Run with: python src/test_ventilation.py"""
+
+import numpy as np
+
+from ventilation import OUTDOOR_CO2, detect
+
+minutes = np.arange(0, 600, 5)
+seconds = minutes * 60.0
+co2 = np.full(len(minutes), 900.0)
+# Aired out at 100 and 300 minutes: 3 and 1 air changes per hour.
+for start, ach in ((20, 3.0), (60, 1.0)):
+    t = np.arange(24) * 5 / 60
+    co2[start : start + 24] = OUTDOOR_CO2 + (1400 - OUTDOOR_CO2) * np.exp(-ach * t)
+
+starts, ends, fitted, r2, pending = detect(seconds, co2)
+assert list(starts) == [20, 60], starts
+assert np.allclose(fitted, [3.0, 1.0]) and np.all(r2 > 0.999), (fitted, r2)
+assert pending is None
+
+# A decay still running at the end of the data is left for the next pass.
+starts, ends, fitted, r2, pending = detect(seconds[:70], co2[:70])
+assert list(starts) == [20] and pending == 60, (starts, pending)
+
+# A gap in the readings breaks a decay rather than bridging it.
+gappy = seconds.copy()
+gappy[22:] += 3600
+starts, ends, fitted, r2, pending = detect(gappy, co2)
+assert list(starts) == [22, 60] and np.allclose(fitted, [3.0, 1.0]), (starts, fitted)
+
+# Slow drift downwards is not airing out.
+drift = 900 - np.arange(len(minutes)) * 0.5
+assert len(detect(seconds, drift)[0]) == 0
+
+print("ok")
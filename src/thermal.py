@@ -0,0 +1,201 @@
+"""How fast the room warms or cools, learnt sample by sample, for "shut by" times.
+
+The close-the-windows moment is when outdoor catches up with indoor. Comparing the
+forecast with the indoor temperature right now assumes the room holds still, but
+with the windows open it follows outdoor, and the sun warms it through the day. So
+the indoor rate of change (°C per hour) is modelled as
+
+    rate = a * (out_temp - temp) + b + c * sin(2 pi h / 24) + d * cos(2 pi h / 24)
+
+with h the hour of day: exchange with outdoor plus a daily cycle (sun, heating,
+cooking). The coefficients are fitted by recursive least squares with a forgetting
+factor, which takes in one sample at a time at fixed cost and slowly forgets, so the
+model follows the seasons and how the windows are used without ever refitting from
+the whole history. monitor.py updates it on every sample and stores it in the
+`thermal_model` row; summary.py reads it. Pure Python, so summary.py stays stdlib-only.
+"""
+
+import bisect
+import datetime
+import json
+import math
+import sqlite3
+
+from compact import CLEAN_VIEW
+
+# Weight left on a sample after the next one: forgets with a ~3.5 day memory.
+FORGETTING = 0.999
+# Starting uncertainty of the coefficients; large means "learn fast at first".
+INITIAL_VARIANCE = 100.0
+# Cap on how uncertain forgetting may make the model during long quiet spells (when
+# nothing excites the gap term it would otherwise grow without bound).
+MAX_VARIANCE = 1e4
+# Readings further apart than this are not one step (a restart or missed samples).
+MAX_STEP = datetime.timedelta(minutes=15)
+# Samples before predictions use the fit; until then indoor is held constant.
+MIN_SAMPLES = 288
+SIMULATION_STEP = datetime.timedelta(minutes=5)
+SIZE = 4
+
+
+def features(temp, out_temp, when):
+    hour = when.hour + when.minute / 60
+    angle = 2 * math.pi * hour / 24
+    return [out_temp - temp, 1.0, math.sin(angle), math.cos(angle)]
+
+
+def _as_datetime(value):
+    return datetime.datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+class ThermalModel:
+    def __init__(self):
+        self.theta = [0.0] * SIZE
+        self.p = [
+            [INITIAL_VARIANCE if i == j else 0.0 for j in range(SIZE)] for i in range(SIZE)
+        ]
+        self.samples = 0
+        self.last = None  # (date, temp, out_temp) of the previous usable reading
+
+    @property
+    def trained(self):
+        return self.samples >= MIN_SAMPLES
+
+    def rate(self, temp, out_temp, when):
+        """Predicted indoor change in °C per hour; 0 until the model is trained."""
+        if not self.trained:
+            return 0.0
+        return sum(t * x for t, x in zip(self.theta, features(temp, out_temp, when)))
+
+    def update(self, reading):
+        """Take in one `records` row as a dict."""
+        when = _as_datetime(reading["date"])
+        temp, out_temp = reading.get("temp"), reading.get("out_temp")
+        if temp is None or out_temp is None:
+            return
+        last, self.last = self.last, (when, temp, out_temp)
+        if last is None or not datetime.timedelta(0) < when - last[0] <= MAX_STEP:
+            return
+        x = features(last[1], last[2], last[0])
+        y = (temp - last[1]) / ((when - last[0]).total_seconds() / 3600)
+
+        # k = P x / (lambda + x' P x); theta += k (y - theta' x); P = (P - k x' P) / lambda
+        px = [sum(self.p[i][j] * x[j] for j in range(SIZE)) for i in range(SIZE)]
+        gain = [v / (FORGETTING + sum(a * b for a, b in zip(x, px))) for v in px]
+        error = y - sum(t * v for t, v in zip(self.theta, x))
+        self.theta = [t + g * error for t, g in zip(self.theta, gain)]
+        # P is symmetric, so x' P is px transposed.
+        self.p = [[self.p[i][j] - gain[i] * px[j] for j in range(SIZE)] for i in range(SIZE)]
+        if sum(self.p[i][i] for i in range(SIZE)) < MAX_VARIANCE:
+            self.p = [[v / FORGETTING for v in row] for row in self.p]
+        self.samples += 1
+
+    def crossing(self, temp, start, outdoor, horizon=None):
+        """When outdoor first reaches indoor, stepping the model through a forecast.
+
+        `outdoor(when)` gives the forecast outdoor temperature, or None past its end.
+        Returns a datetime (`start` when outdoor is already there), or None if it
+        doesn't happen within the forecast, or within `horizon` (a timedelta) if given.
+        """
+        when = start
+        end = start + horizon if horizon is not None else None
+        while (end is None or when <= end) and (out_temp := outdoor(when)) is not None:
+            if out_temp >= temp:
+                return when
+            temp += self.rate(temp, out_temp, when) * SIMULATION_STEP.total_seconds() / 3600
+            when += SIMULATION_STEP
+        return None
+
+    def state(self):
+        last = self.last and (self.last[0].isoformat(sep=" "), *self.last[1:])
+        return {"theta": self.theta, "p": self.p, "samples": self.samples, "last": last}
+
+    @classmethod
+    def from_state(cls, state):
+        model = cls()
+        model.theta, model.p, model.samples = state["theta"], state["p"], state["samples"]
+        if state["last"]:
+            model.last = (_as_datetime(state["last"][0]), *state["last"][1:])
+        return model
+
+
+def forecast_curve(hourly):
+    """outdoor(when) for ThermalModel.crossing, from an Open-Meteo `hourly` block.
+
+    Interpolates linearly between the hourly temperatures; None outside them.
+    """
+    points = [
+        (datetime.datetime.fromisoformat(stamp), temp)
+        for stamp, temp in zip(hourly["time"], hourly["temperature_2m"])
+        if temp is not None
+    ]
+    times = [t for t, _ in points]
+
+    def outdoor(when):
+        i = bisect.bisect_left(times, when)
+        if i == len(times) or (i == 0 and when < times[0]):
+            return None
+        if times[i] == when:
+            return points[i][1]
+        (t0, v0), (t1, v1) = points[i - 1], points[i]
+        return v0 + (v1 - v0) * (when - t0) / (t1 - t0)
+
+    return outdoor
+
+
+def close_in(model, reading, hourly, horizon):
+    """Minutes until outdoor reaches indoor, from the reading's date, for close_windows.
+
+    Steps `model` through the forecast (an Open-Meteo `hourly` block, or None). Without
+    one it holds outdoor at the reading's out_temp, which still tells when outdoor is
+    already there or the room is cooling down to it. inf when that isn't within
+    `horizon` (a timedelta); None without a temp, or without any outdoor temperature.
+    """
+    temp, out_temp = reading.get("temp"), reading.get("out_temp")
+    if temp is None or (not hourly and out_temp is None):
+        return None
+
+    def steady(when):
+        return out_temp
+
+    outdoor = forecast_curve(hourly) if hourly else steady
+    now = _as_datetime(reading["date"])
+    at = model.crossing(temp, now, outdoor, horizon)
+    return (at - now).total_seconds() / 60 if at else float("inf")
+
+
+def ensure_table(con):
+    con.execute(
+        "CREATE TABLE IF NOT EXISTS thermal_model "
+        "(id integer PRIMARY KEY CHECK (id = 0), state text)"
+    )
+
+
+def write(con, model):
+    """Replace the stored model. Doesn't commit: it belongs with the sample's insert."""
+    con.execute(
+        "INSERT OR REPLACE INTO thermal_model (id, state) VALUES (0, ?)",
+        (json.dumps(model.state()),),
+    )
+
+
+def read(con):
+    """The stored model, or None when monitor.py has not written one yet."""
+    try:
+        row = con.execute("SELECT state FROM thermal_model").fetchone()
+    except sqlite3.OperationalError:  # monitor.py hasn't created the table yet.
+        return None
+    return ThermalModel.from_state(json.loads(row[0])) if row and row[0] else None
+
+
+def rebuild(con, now=None, days=14):
+    """Fit a fresh model to the last `days` of `records`; for a first start."""
+    now = now or datetime.datetime.now()
+    model = ThermalModel()
+    cur = con.execute(
+        f"SELECT date, temp, out_temp FROM {CLEAN_VIEW} WHERE date >= ? ORDER BY date",
+        ((now - datetime.timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S"),),
+    )
+    for date, temp, out_temp in cur:
+        model.update({"date": date, "temp": temp, "out_temp": out_temp})
+    return model
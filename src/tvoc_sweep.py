@@ -0,0 +1,178 @@
+"""Try TVOC spike-detection settings against the whole stored history at once.
+
+utils.MAD_FLOOR and utils.MIN_HISTORY, and the 24h window the dashboard's TVOC card
+looks back over, are otherwise tuned by changing them and waiting a few days. This
+replays every stored TVOC reading through utils.baseline_deviation's maths for a grid
+of settings and reports, per setting, how many spikes the card would have shown:
+
+    python3 src/tvoc_sweep.py --mad-floor 2 5 10 20 --min-history 12 36 72
+
+- spikes: separate runs of readings at or over the deviation threshold;
+- hours: how long the card showed a spike in total;
+- median_min: the typical length of one spike, in minutes;
+- ramps: spikes starting within RAMP_HOURS of the sensor coming back from a gap or a
+  zero reading, i.e. the post-power-cut climb utils.py warns about. A good setting
+  keeps this near zero without dropping the real spikes.
+
+Readings are laid out on a 5-minute grid (missing ones NaN, compacted hours one slot in
+twelve), so a window is a fixed number of slots and each window length is one NumPy
+pass: sort every sliding window once for the median and once for the MAD. The floor
+and history settings are then just cheap array comparisons. Windows are split into
+chunks of rows, fewer the wider the window so every chunk costs about the same memory,
+and spread over a process pool: one worker per core, or LOW_MEMORY_WORKERS on a
+LOW_MEMORY Pi.
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from compact import HISTORY_VIEW
+from config import DB_PATH, LOW_MEMORY
+from snapshot import WINDOW
+from utils import MAD_FLOOR, MIN_HISTORY
+
+SLOT = pd.Timedelta(minutes=5)
+# Same cut-off as the dashboard's cards.VOC_SPIKE_DEVIATION.
+THRESHOLD = 3.5
+# More than this without a reading counts as the sensor having been off.
+GAP_SLOTS = 12
+RAMP_HOURS = 6
+# Floats in one task's window matrix (rows x window width): 16 MB. A task holds about
+# four such matrices at once (the windows, sorted, their deviations, sorted), so this
+# bounds each worker's peak at roughly 64 MB whatever the window width.
+CHUNK_VALUES = 2_000_000
+LOW_MEMORY_WORKERS = 2
+
+_values = None  # the grid, set once per worker by _share
+
+
+def _share(values):
+    global _values
+    _values = values
+
+
+def _sorted_median(windows, counts):
+    """Median of each row of `windows` ignoring NaNs, which np.sort puts last."""
+    ordered = np.sort(windows, axis=1)
+    rows = np.arange(len(windows))
+    low = np.clip((counts - 1) // 2, 0, None)
+    high = np.clip(counts // 2, 0, None)
+    median = (ordered[rows, low] + ordered[rows, high]) / 2
+    return np.where(counts > 0, median, np.nan)
+
+
+def baseline_stats(task):
+    """Median, MAD and reading count of the window ending at each row in [start, stop)."""
+    width, start, stop = task
+    padded = np.concatenate((np.full(width - 1, np.nan), _values))
+    windows = np.lib.stride_tricks.sliding_window_view(padded, width)[start:stop]
+    counts = np.count_nonzero(~np.isnan(windows), axis=1)
+    median = _sorted_median(windows, counts)
+    mad = _sorted_median(np.abs(windows - median[:, None]), counts)
+    return width, start, median, mad, counts
+
+
+def load_grid(con):
+    df = pd.read_sql_query(
+        f"SELECT date, voc FROM {HISTORY_VIEW} WHERE voc IS NOT NULL ORDER BY date", con
+    )
+    df["date"] = pd.to_datetime(df["date"], format="ISO8601")
+    return df.set_index("date")["voc"].astype(float).resample(SLOT).mean()
+
+
+def restarts(values):
+    """Slot index of the latest restart (gap or zero reading) at or before each slot."""
+    index = np.arange(len(values))
+    present = ~np.isnan(values)
+    last_seen = np.maximum.accumulate(np.where(present, index, -1))
+    previous = np.concatenate(([-1], last_seen[:-1]))
+    restart = present & ((previous < 0) | (index - previous > GAP_SLOTS) | (values <= 0))
+    return np.maximum.accumulate(np.where(restart, index, -(10**9)))
+
+
+def score(values, median, mad, counts, last_restart, mad_floor, min_history, threshold):
+    """(spikes, hours, median minutes, ramps) for one floor/history setting."""
+    with np.errstate(invalid="ignore"):
+        deviation = 0.6745 * (values - median) / np.maximum(mad, mad_floor)
+        spike = (counts >= min_history) & (deviation >= threshold)
+    edges = np.diff(np.concatenate(([0], spike.astype(np.int8), [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    if not len(starts):
+        return 0, 0.0, 0.0, 0
+    minutes = (ends - starts) * SLOT.total_seconds() / 60
+    ramp_slots = RAMP_HOURS * 3600 / SLOT.total_seconds()
+    ramps = np.count_nonzero(starts - last_restart[starts] < ramp_slots)
+    return len(starts), minutes.sum() / 60, float(np.median(minutes)), int(ramps)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--mad-floor", nargs="+", type=float, default=[2, MAD_FLOOR, 10, 20])
+    parser.add_argument("--min-history", nargs="+", type=int, default=[6, MIN_HISTORY, 36, 72])
+    parser.add_argument(
+        "--window-hours", nargs="+", type=float, default=[6, WINDOW / pd.Timedelta(hours=1)]
+    )
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument(
+        "--workers", type=int, default=LOW_MEMORY_WORKERS if LOW_MEMORY else os.cpu_count()
+    )
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    with sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True) as con:
+        grid = load_grid(con)
+    if grid.empty:
+        print("No TVOC readings stored.")
+        return
+    values = grid.to_numpy()
+    widths = sorted({max(1, round(h * 3600 / SLOT.total_seconds())) for h in args.window_hours})
+    tasks = [
+        (width, start, min(start + rows, len(values)))
+        for width in widths
+        for rows in [max(1, CHUNK_VALUES // width)]
+        for start in range(0, len(values), rows)
+    ]
+    stats = {
+        w: [np.empty(len(values)), np.empty(len(values)), np.empty(len(values), int)]
+        for w in widths
+    }
+    with ProcessPoolExecutor(args.workers, initializer=_share, initargs=(values,)) as pool:
+        for width, start, median, mad, counts in pool.map(baseline_stats, tasks):
+            for out, part in zip(stats[width], (median, mad, counts)):
+                out[start : start + len(part)] = part
+    last_restart = restarts(values)
+
+    print(
+        f"{np.count_nonzero(~np.isnan(values))} TVOC readings, "
+        f"{grid.index[0]:%Y-%m-%d} to {grid.index[-1]:%Y-%m-%d}, threshold {args.threshold}"
+    )
+    print(
+        f"{'window_h':>8} {'floor':>6} {'history':>7} {'spikes':>7} {'hours':>7} "
+        f"{'median_min':>10} {'ramps':>6}"
+    )
+    for width in widths:
+        for mad_floor in args.mad_floor:
+            for min_history in args.min_history:
+                spikes, hours, typical, ramps = score(
+                    values, *stats[width], last_restart, mad_floor, min_history, args.threshold
+                )
+                current = (
+                    width == WINDOW / SLOT
+                    and mad_floor == MAD_FLOOR
+                    and min_history == MIN_HISTORY
+                )
+                print(
+                    f"{width * SLOT.total_seconds() / 3600:>8g} {mad_floor:>6g} {min_history:>7d} "
+                    f"{spikes:>7d} {hours:>7.1f} {typical:>10.0f} {ramps:>6d} {'*' if current else ''}"
+                )
+    print(f"* current settings ({time.perf_counter() - started:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
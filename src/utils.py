@@ -5,11 +5,14 @@ from statistics import median
 
 from config import NTFY_TOPIC
 
+NTFY_SERVER = "https://ntfy.sh"
+
 # Below this the spread of the recent history is treated as sensor noise rather
 # than as real variation. Without it a very flat baseline shrinks the deviation
 # scale to nearly nothing and every small wiggle reads as a spike. In ppb, so it
 # is the knob to turn if the TVOC card cries wolf (raise it) or stays silent
-# through an obvious cooking spike (lower it).
+# through an obvious cooking spike (lower it). tvoc_sweep.py shows what a value
+# would have done over the stored history.
 MAD_FLOOR = 5.0
 # Enough samples to have seen a quiet stretch; at 5 minutes apart, an hour.
 # Known gap: after the sensor loses power it climbs from ~0 to its real baseline
@@ -46,8 +49,10 @@ def baseline_deviation(history, current, mad_floor=MAD_FLOOR):
     return baseline, 0.6745 * (current - baseline) / max(mad, mad_floor)
 
 
-def send_notification(title, message, priority="high", tags="warning"):
-    if not NTFY_TOPIC:
+def send_notification(
+    title, message, priority="high", tags="warning", server=NTFY_SERVER, topic=NTFY_TOPIC
+):
+    if not topic:
         return
     # HTTP headers are latin-1, so an emoji in the title otherwise kills the whole
     # notification. RFC 2047-encode it instead (ntfy decodes encoded-words); the body is
@@ -59,7 +64,7 @@ def send_notification(title, message, priority="high", tags="warning"):
         title = Header(title, "utf-8").encode()
     try:
         req = urllib.request.Request(
-            f"https://ntfy.sh/{NTFY_TOPIC}",
+            f"{server}/{topic}",
             data=message.encode("utf-8"),
             headers={"Title": title, "Priority": priority, "Tags": tags},
             method="POST",
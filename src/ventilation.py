@@ -0,0 +1,153 @@
+"""Air changes per hour, measured from how fast CO2 falls after airing out.
+
+With nobody adding CO2, indoor CO2 decays exponentially towards the outdoor level:
+
+    co2(t) = OUTDOOR_CO2 + (co2(0) - OUTDOOR_CO2) * exp(-ach * t)
+
+so log(co2 - OUTDOOR_CO2) is a straight line in t (hours) with slope -ach, the room's
+air-change rate. A decay event is a run of readings each lower than the last, starting
+at least MIN_EXCESS over outdoor and losing a fair share of that. All events found in a read are fitted together: the
+least-squares sums for every event come out of one np.bincount each, so years of
+history are one pass.
+
+Results go in the `ventilation_events` table. The `ventilation_scan` row remembers how
+far the history has been searched, so a later update() only reads what came after;
+a decay still under way at the end of the data is left for the next run to finish.
+
+monitor.py updates once an hour; to catch up by hand, or from cron when the monitor
+runs elsewhere:
+    python3 src/ventilation.py
+"""
+
+import sqlite3
+
+import numpy as np
+
+from compact import CLEAN_VIEW
+from config import DB_PATH
+
+TABLE = "ventilation_events"
+SCAN_TABLE = "ventilation_scan"
+# Typical outdoor CO2, in ppm.
+OUTDOOR_CO2 = 420
+# A decay has to start this far over outdoor to be worth fitting...
+MIN_EXCESS = 200
+# ...and stops counting once within this of it, where sensor noise swamps the log.
+TAIL_EXCESS = 50
+# Readings in a decay, including the peak: 20 minutes at 5-minute sampling.
+MIN_SAMPLES = 5
+# ...over which at least this share of the excess has to go, or it's drift, not airing.
+MIN_DROP = 0.3
+# Readings further apart than this break a decay (a missed sample or two is a gap).
+MAX_STEP_SECONDS = 450
+# Fits that explain less of the variance than this aren't an exponential decay: someone
+# came back in, or the window was opened and closed halfway.
+MIN_R2 = 0.9
+
+
+def ensure_tables(con):
+    con.execute(
+        f"CREATE TABLE IF NOT EXISTS {TABLE} (start timestamp PRIMARY KEY, end timestamp, "
+        "samples integer, co2_start real, co2_end real, ach real, r2 real)"
+    )
+    con.execute(
+        f"CREATE TABLE IF NOT EXISTS {SCAN_TABLE} "
+        "(id integer PRIMARY KEY CHECK (id = 0), until timestamp)"
+    )
+
+
+def detect(seconds, co2, outdoor=OUTDOOR_CO2):
+    """Find and fit decay events in one series.
+
+    Returns (starts, ends, ach, r2) as arrays of sample indices and fit results, for
+    every run of falling readings long enough to fit, plus `pending`: the index where
+    a run reaching the last reading begins (it may still continue), or None.
+    """
+    excess = co2 - outdoor
+    # link[i]: reading i+1 continues a decay from reading i.
+    link = (
+        (np.diff(co2) < 0)
+        & (np.diff(seconds) <= MAX_STEP_SECONDS)
+        & (excess[1:] > TAIL_EXCESS)
+    )
+    edges = np.diff(np.concatenate(([0], link.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)  # index of the run's last reading
+    pending = None
+    if len(ends) and ends[-1] == len(co2) - 1:
+        pending = starts[-1]
+        starts, ends = starts[:-1], ends[:-1]
+    keep = (
+        (ends - starts + 1 >= MIN_SAMPLES)
+        & (excess[starts] >= MIN_EXCESS)
+        & (co2[starts] - co2[ends] >= MIN_DROP * excess[starts])
+    )
+    starts, ends = starts[keep], ends[keep]
+    if not len(starts):
+        return starts, ends, np.array([]), np.array([]), pending
+
+    # Every event's readings laid end to end, tagged with the event they belong to.
+    lengths = ends - starts + 1
+    event = np.repeat(np.arange(len(starts)), lengths)
+    offset = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    index = np.repeat(starts, lengths) + offset
+    t = (seconds[index] - seconds[starts][event]) / 3600
+    y = np.log(excess[index])
+
+    def total(values):
+        return np.bincount(event, weights=values, minlength=len(starts))
+
+    n, st, sy, stt, sty, syy = (
+        lengths, total(t), total(y), total(t * t), total(t * y), total(y * y)
+    )
+    var_t = n * stt - st**2
+    var_y = n * syy - sy**2
+    cov = n * sty - st * sy
+    slope = cov / var_t
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r2 = np.where(var_y > 0, cov**2 / (var_t * var_y), 0.0)
+    return starts, ends, -slope, r2, pending
+
+
+def update(con):
+    """Search the history read since the last update for new events; return how many."""
+    ensure_tables(con)
+    row = con.execute(f"SELECT until FROM {SCAN_TABLE}").fetchone()
+    since = row[0] if row else ""
+    rows = con.execute(
+        f"SELECT date, CAST(strftime('%s', date) AS INTEGER), co2 FROM {CLEAN_VIEW} "
+        "WHERE date >= ? AND co2 IS NOT NULL ORDER BY date",
+        (since,),
+    ).fetchall()
+    if not rows:
+        return 0
+    dates = [r[0] for r in rows]
+    seconds = np.array([r[1] for r in rows], dtype=float)
+    co2 = np.array([r[2] for r in rows], dtype=float)
+
+    starts, ends, ach, r2, pending = detect(seconds, co2)
+    good = (r2 >= MIN_R2) & (ach > 0)
+    events = [
+        (dates[s], dates[e], int(e - s + 1), co2[s], co2[e], float(a), float(fit))
+        for s, e, a, fit in zip(starts[good], ends[good], ach[good], r2[good])
+    ]
+    until = dates[pending] if pending is not None else dates[-1]
+    with con:
+        con.executemany(
+            f"INSERT OR REPLACE INTO {TABLE} "
+            "(start, end, samples, co2_start, co2_end, ach, r2) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            events,
+        )
+        con.execute(f"INSERT OR REPLACE INTO {SCAN_TABLE} (id, until) VALUES (0, ?)", (until,))
+    return len(events)
+
+
+if __name__ == "__main__":
+    with sqlite3.connect(DB_PATH, timeout=60) as con:
+        found = update(con)
+        total, median = con.execute(
+            f"SELECT COUNT(*), (SELECT ach FROM {TABLE} ORDER BY ach "
+            f"LIMIT 1 OFFSET (SELECT COUNT(*) FROM {TABLE}) / 2) FROM {TABLE}"
+        ).fetchone()
+    print(f"{found} new decay events, {total} in all", end="")
+    print(f", median {median:.1f} air changes per hour" if median is not None else "")